@@ -0,0 +1,168 @@
+"""
+ Benchmark of indexing and query speed on synthetic corpora. Results are written as JSON, so runs on
+ different commits can be compared with --compare.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from src.CorpusReader import CorpusReader
+from src.QuestionGenerator import QuestionGenerator
+from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.SimilarityScorer import SimilarityScorer
+from src.TfIdfVectorizer import TfIdfVectorizer
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-c', '--corpus_sizes', default=[10000, 100000], type=int, nargs='+',
+                    help="Numbers of generated questions")
+parser.add_argument('-v', '--vector_sizes', default=['100', '1000'], nargs='+',
+                    help="Values of embedding_size, 'none' keeps every word")
+parser.add_argument('--sample_path', default='data/questions.jsonl', help="Corpus which generated questions imitate")
+parser.add_argument('--vocabulary_size', default=50000, type=int, help="Number of distinct generated words")
+parser.add_argument('-q', '--queries', default=1000, type=int, help="Number of measured queries")
+parser.add_argument('-b', '--batch_size', default=100, type=int, help="Number of queries in batched search")
+parser.add_argument('-t', '--dtype', default='float32', choices=QuestionsSearchEngine.STORAGE_DTYPES,
+                    help="Precision of stored vectors")
+parser.add_argument('-w', '--workers', default=1, type=int, help="Number of processes used for indexing")
+parser.add_argument('--seed', default=0, type=int, help="Seed of generated corpus and queries")
+parser.add_argument('-o', '--output', default='benchmark_results.json', help="Path to JSON results")
+parser.add_argument('--compare', default=None, help="Path to JSON results of earlier run")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_case(corpus_size: int, embedding_size, options: dict) -> dict:
+    """
+    Measure one corpus size and embedding size. Runs in fresh process, so peak RSS belongs only to this case.
+    """
+    generator = QuestionGenerator(sample_path=options['sample_path'], vocabulary_size=options['vocabulary_size'],
+                                  seed=options['seed'])
+    result = {'corpus_size': corpus_size, 'embedding_size': embedding_size, 'dtype': options['dtype']}
+    with tempfile.TemporaryDirectory() as path:
+        corpus_path = os.path.join(path, 'questions.jsonl')
+        generator.write(path=corpus_path, n=corpus_size)
+        questions = [document.text for document in generator.generate(n=options['queries'], start_id=corpus_size)]
+
+        # Vectorizer stages measured separately from whole indexing
+        vectorizer = TfIdfVectorizer(embedding_size=embedding_size, progress_bar=False)
+        # Written corpus is read back, generator state moved on after write
+        corpus_questions = list(CorpusReader(path=corpus_path).questions())
+        _, result['fit_seconds'] = timed(vectorizer.fit, questions=corpus_questions, workers=options['workers'])
+        corpus_vectors, result['transform_seconds'] = timed(vectorizer.transform_sparse, questions=corpus_questions,
+                                                            workers=options['workers'])
+        query_vectors = vectorizer.transform_sparse(questions=questions[:options['batch_size']])
+        _, result['cosine_similarity_seconds'] = timed(SimilarityScorer().cosine_similarity,
+                                                       query_vectors=query_vectors, corpus_vectors=corpus_vectors)
+        del vectorizer, corpus_questions, corpus_vectors
+
+        engine, result['index_seconds'] = timed(QuestionsSearchEngine.from_corpus, path=corpus_path,
+                                                embedding_size=embedding_size, workers=options['workers'],
+                                                dtype=options['dtype'])
+        result['memory_mb'] = {name: size / 2 ** 20 for name, size in engine.memory_usage().items()}
+        index_path = os.path.join(path, 'qse_index')
+        _, result['save_seconds'] = timed(engine.save_stored_data, path=index_path)
+        loaded = QuestionsSearchEngine(skip_process=True)
+        _, result['load_seconds'] = timed(loaded.load_stored_data, path=index_path)
+
+        latencies = []
+        for question in questions:
+            _, latency = timed(engine.most_similar, query=question, n=5)
+            latencies.append(latency)
+        result['query_p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+        result['query_p99_ms'] = float(np.percentile(latencies, 99) * 1000)
+        # The same queries one by one, compared with batches below
+        result['loop_qps'] = len(questions) / sum(latencies)
+
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+        for batch_start in range(0, len(questions), batch_size):
+            engine.most_similar_many(queries=questions[batch_start:batch_start + batch_size], n=5)
+        result['batch_qps'] = len(questions) / (time.perf_counter() - start)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(case: dict) -> tuple:
+    return case['corpus_size'], case['embedding_size'], case['dtype']
+
+
+def compare(results: dict, previous: dict):
+    """
+    Print relative change of every measured value against previous results.
+    """
+    previous_cases = {case_key(case): case for case in previous['results']}
+    print("Compared with %s" % previous.get('commit'))
+    for case in results['results']:
+        old_case = previous_cases.get(case_key(case))
+        if old_case is None:
+            continue
+        print("corpus_size %d, embedding_size %s" % (case['corpus_size'], case['embedding_size']))
+        for name, value in case.items():
+            old_value = old_case.get(name)
+            if isinstance(value, (int, float)) and isinstance(old_value, (int, float)) and old_value \
+                    and name not in ('corpus_size', 'embedding_size'):
+                print("    %-26s %12.4f -> %12.4f  (%+.1f%%)" % (name, old_value, value,
+                                                                  (value - old_value) / old_value * 100))
+
+
+def main():
+    args = parser.parse_args()
+    print(args)
+    options = {'sample_path': args.sample_path if os.path.exists(args.sample_path) else None,
+               'vocabulary_size': args.vocabulary_size, 'queries': args.queries, 'batch_size': args.batch_size,
+               'dtype': args.dtype, 'workers': args.workers, 'seed': args.seed}
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'options': options,
+        'results': []
+    }
+    for corpus_size in args.corpus_sizes:
+        for vector_size in args.vector_sizes:
+            embedding_size = None if vector_size.lower() == 'none' else int(vector_size)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                case = executor.submit(run_case, corpus_size, embedding_size, options).result()
+            print(json.dumps(case))
+            results['results'].append(case)
+
+    with open(args.output, 'w', encoding='utf-8') as fw:
+        json.dump(results, fw, indent=2)
+    print("Results saved to %s" % args.output)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as fr:
+            compare(results=results, previous=json.load(fr))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+ Compare search results of float32 and int8 vector storage with float64 baseline, or approximate (IVF)
+ search with exact search.
+"""
+
+import argparse
+import random
+import time
+from collections import Counter
+
+from src.CorpusReader import CorpusReader
+from src.QuestionSearchEngine import QuestionsSearchEngine
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-d', '--corpus_path', default='data/questions.jsonl', help="Path to corpus")
+parser.add_argument('-s', '--stop_words_path', default='data/stop_words_english.json',
+                    help="Path to file with stopwords")
+parser.add_argument('-v', '--vector_size', default=100, type=int, help="Size of embedding vectors")
+parser.add_argument('-q', '--queries', default=1000, type=int, help="Number of corpus questions used as queries")
+parser.add_argument('-n', default=5, type=int, help="Number of returned questions per query")
+parser.add_argument('-r', '--rerank', default=None, type=int, help="Number of candidates scored again in float32")
+parser.add_argument('--seed', default=0, type=int, help="Seed for sampling queries")
+parser.add_argument('--ann', action='store_true', help="Compare approximate search with exact search")
+parser.add_argument('--n_lists', default=None, type=int, help="Number of IVF clusters")
+parser.add_argument('--n_probe', default=[1, 2, 4, 8, 16], type=int, nargs='+',
+                    help="Numbers of searched IVF clusters")
+parser.add_argument('-w', '--workers', default=1, type=int, help="Number of processes used for processing corpus")
+args = parser.parse_args()
+
+
+def recall(results: list, baseline: list) -> float:
+    """
+    Share of baseline questions which are found. Baseline questions with score equal to the lowest returned
+    baseline score are interchangeable, so any of them counts as hit.
+    """
+    hits = 0
+    total = 0
+    for result, expected in zip(results, baseline):
+        if not expected:
+            continue
+        lowest_score = expected[-1][0]
+        required = Counter(text for score, text in expected if score > lowest_score)
+        tied = len(expected) - sum(required.values())
+        found = Counter(text for _, text in result)
+        hits += sum((required & found).values()) + min(tied, sum((found - required).values()))
+        total += len(expected)
+    return hits / total if total else 1.
+
+
+def search(engine: QuestionsSearchEngine, queries: list, **search_options) -> (list, float):
+    """
+    Search queries one by one, as they come to server.
+    :return: (results, queries per second)
+    """
+    start = time.perf_counter()
+    results = [engine.most_similar(query=query, n=args.n, **search_options) for query in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def compare_ann(queries: list):
+    engine = QuestionsSearchEngine.from_corpus(path=args.corpus_path, stop_words_path=args.stop_words_path,
+                                               embedding_size=args.vector_size, workers=args.workers)
+    baseline, exact_speed = search(engine=engine, queries=queries)
+    print("exact        recall@%d %.4f  queries/s %.1f" % (args.n, 1., exact_speed))
+
+    engine.build_ann_index(n_lists=args.n_lists)
+    for n_probe in args.n_probe:
+        results, speed = search(engine=engine, queries=queries, mode='approx', n_probe=n_probe, rerank=args.rerank)
+        print("n_probe %-4d recall@%d %.4f  queries/s %.1f  speedup %.1fx"
+              % (n_probe, args.n, recall(results=results, baseline=baseline), speed, speed / exact_speed))
+
+
+def main():
+    print(args)
+    random.seed(args.seed)
+    questions = list(CorpusReader(path=args.corpus_path).questions())
+    queries = random.sample(questions, min(args.queries, len(questions)))
+    if args.ann:
+        compare_ann(queries=queries)
+        return
+
+    baseline = None
+    for dtype in QuestionsSearchEngine.STORAGE_DTYPES:
+        engine = QuestionsSearchEngine.from_corpus(path=args.corpus_path, stop_words_path=args.stop_words_path,
+                                                   embedding_size=args.vector_size, workers=args.workers,
+                                                   dtype=dtype)
+        start = time.perf_counter()
+        rerank = None if dtype == 'float64' else args.rerank
+        results = engine.most_similar_many(queries=queries, n=args.n, rerank=rerank)
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline = results
+
+        memory = engine.memory_usage()
+        print("%-8s recall@%d %.4f  vectors %8.1f MB  postings %8.1f MB  queries/s %.1f"
+              % (dtype, args.n, recall(results=results, baseline=baseline), memory['vectors'] / 2 ** 20,
+                 memory['postings'] / 2 ** 20, len(queries) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
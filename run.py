@@ -6,6 +6,7 @@ import argparse
 import os
 
 from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.SimilarityScorer import Bm25Scorer
 
 parser = argparse.ArgumentParser()
 # parser.add_argument('-c', '--config', default='config.json', help="Path to config file")
@@ -16,8 +17,22 @@ parser.add_argument('-s', '--stop_words_path', default='data/stop_words_english.
                     help="Path to file with stopwords")
 parser.add_argument('-f', '--force_process', default=False,
                     help="Force engine to process corpus again")
-parser.add_argument('-dp', '--qse_data_path', default='cached/qse_data.pkl',
+parser.add_argument('-dp', '--qse_data_path', default='cached/qse_index',
                     help="Path to cached data for question search engine")
+parser.add_argument('--n_features', default=None, type=int,
+                    help="Hash words into given number of buckets instead of keeping vocabulary, vector_size is not "
+                         "used, used when corpus is processed")
+parser.add_argument('-w', '--workers', default=1, type=int,
+                    help="Number of processes used for processing corpus")
+parser.add_argument('-t', '--dtype', default='float32', choices=QuestionsSearchEngine.STORAGE_DTYPES,
+                    help="Precision of stored vectors")
+parser.add_argument('--scorer', default='cosine', choices=['cosine', 'bm25'],
+                    help="Scoring of questions, used when corpus is processed")
+parser.add_argument('--bigram_buckets', default=0, type=int,
+                    help="Number of hashed word bigram features of bm25 scorer")
+parser.add_argument('--deduplicate', default=None, type=float,
+                    help="Collapse near duplicate questions with given similarity threshold, used when corpus is "
+                         "processed")
 args = parser.parse_args()
 
 
@@ -29,18 +44,27 @@ def main():
     stop_words_path = args.stop_words_path
     vector_size = args.vector_size
     corpus_path = args.corpus_path
+    workers = args.workers
 
     loaded_from_cache = False
-    if os.path.exists(qse_data_path) and not force_process:
+    stored_data_path = QuestionsSearchEngine.stored_data_path(qse_data_path)
+    if stored_data_path is not None and not force_process:
         qse = QuestionsSearchEngine(skip_process=True)
-        qse.load_stored_data(qse_data_path)
-        loaded_from_cache = True
+        qse.load_stored_data(stored_data_path)
+        # Pickle cache of older versions is saved again as index directory
+        loaded_from_cache = stored_data_path == qse_data_path
 
     else:
-        documents = QuestionsSearchEngine.load_questions(path=corpus_path)
-        qse = QuestionsSearchEngine(questions=documents,
-                                    stop_words_path=stop_words_path,
-                                    embedding_size=vector_size)
+        qse = QuestionsSearchEngine.from_corpus(path=corpus_path,
+                                                stop_words_path=stop_words_path,
+                                                embedding_size=vector_size,
+                                                workers=workers,
+                                                dtype=args.dtype,
+                                                n_features=args.n_features)
+        if args.deduplicate is not None:
+            qse.deduplicate(threshold=args.deduplicate)
+        if args.scorer == 'bm25':
+            qse.set_scorer(Bm25Scorer(bigram_buckets=args.bigram_buckets))
 
     finished = False
     while not finished:
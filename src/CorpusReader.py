@@ -0,0 +1,77 @@
+"""
+Streaming reader of questions corpus in JSONL format (optionally gzip compressed).
+Every line is json object with 'id', 'question' and 'tags' fields.
+"""
+import gzip
+import json
+import logging
+
+from src.Document import Document
+
+
+class CorpusReader:
+    def __init__(self, path, skip_malformed=True):
+        """
+        :param path: Path to .jsonl or .jsonl.gz corpus file.
+        :param skip_malformed: Skip lines which are not valid json objects, otherwise raise ValueError.
+        """
+        self.path = path
+        self.skip_malformed = skip_malformed
+        # Number of malformed lines skipped in last pass over corpus
+        self.skipped = 0
+
+    def _open(self):
+        with open(self.path, 'rb') as fr:
+            gzipped = fr.read(2) == b'\x1f\x8b'
+        if gzipped:
+            return gzip.open(self.path, 'rt', encoding='utf-8')
+        return open(self.path, 'r', encoding='utf-8')
+
+    def __iter__(self):
+        """
+        Yields Document for every corpus line. Every iteration reads file again, so reader can be used
+        for more passes over corpus.
+        """
+        self.skipped = 0
+        with self._open() as fr:
+            for line_number, row in enumerate(fr, start=1):
+                row = row.strip()
+                if not row:
+                    continue
+                try:
+                    sentence_json = json.loads(row)
+                    if not isinstance(sentence_json, dict):
+                        raise ValueError("Corpus line is not json object.")
+                except ValueError as error:
+                    if not self.skip_malformed:
+                        raise ValueError("Malformed corpus line %d in %s: %s" % (line_number, self.path, error))
+                    self.skipped += 1
+                    continue
+
+                question = sentence_json.get('question', '')
+                doc_id = sentence_json.get('id', '')
+                tags = sentence_json.get('tags', '')
+                yield Document(text=question, doc_id=doc_id, tags=tags)
+
+        if self.skipped:
+            logging.log(logging.WARNING, "Skipped %d malformed lines in %s" % (self.skipped, self.path))
+
+    def questions(self):
+        """
+        Yields only question texts.
+        """
+        for document in self:
+            yield document.text
+
+    def batches(self, batch_size: int):
+        """
+        Yields lists of at most batch_size documents.
+        """
+        batch = []
+        for document in self:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -1,8 +1,16 @@
-
-
 class Document:
+    # Without instance __dict__, so decoded questions stay small
+    __slots__ = ('vector', 'doc_id', 'text', 'tags')
+
     def __init__(self, doc_id, text, tags, vector=None):
         self.vector = vector
         self.doc_id = doc_id
         self.text = text
         self.tags = tags
+
+    def __setstate__(self, state):
+        # Questions pickled before __slots__ keep attributes in dict, newer ones in (None, slots) tuple
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
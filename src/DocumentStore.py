@@ -0,0 +1,211 @@
+"""
+Columnar store of questions. Texts and ids are kept in contiguous UTF-8 buffers with offsets, and tags as ids into
+interned tag list (CSR layout like TagIndex), so stored questions take a few arrays instead of one Python object per
+question. Document is decoded only when it is accessed, search results decode only returned questions.
+Appended questions are kept in delta store, so main columns (which can be memory mapped) are not copied.
+"""
+import json
+
+import numpy as np
+
+from src.Document import Document
+from src.TagIndex import TagIndex
+
+
+class DocumentStore:
+    COLUMNS = ('texts', 'ids', 'tag_ids')
+
+    def __init__(self, documents=()):
+        """
+        :param documents: Iterable of Document objects, missing tags are empty string or None.
+        """
+        tag_ids = {}
+        ids = []
+        texts = []
+        doc_tag_ids = []
+        for document in documents:
+            ids.append(json.dumps(document.doc_id))
+            texts.append(document.text)
+            doc_tag_ids.append([tag_ids.setdefault(tag, len(tag_ids))
+                                for tag in dict.fromkeys(TagIndex.document_tags(document.tags))])
+
+        self.tags = list(tag_ids)
+        self.delta = None
+        self._columns = {
+            'texts': DocumentStore._encode(texts),
+            'ids': DocumentStore._encode(ids),
+            'tag_ids': DocumentStore._pack(doc_tag_ids)
+        }
+
+    @staticmethod
+    def _encode(strings: list) -> (np.ndarray, np.ndarray):
+        return DocumentStore._pack([string.encode('utf-8') for string in strings], dtype=np.uint8)
+
+    @staticmethod
+    def _pack(values: list, dtype=np.int32) -> (np.ndarray, np.ndarray):
+        """
+        Concatenate list of sequences into (values, offsets), values of row i are values[offsets[i]:offsets[i + 1]].
+        """
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, values), dtype=np.int64, count=len(values)), out=offsets[1:])
+        if dtype == np.uint8:
+            return np.frombuffer(b''.join(values), dtype=np.uint8), offsets
+        return np.fromiter((value for row in values for value in row), dtype=dtype, count=offsets[-1]), offsets
+
+    def to_arrays(self) -> dict:
+        """
+        Arrays which describe the store, tag names (see merged) are stored separately.
+        """
+        arrays = {}
+        for name, (values, offsets) in self.merged()._columns.items():
+            arrays[name] = values
+            arrays[name + '_offsets'] = offsets
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, tags: list):
+        """
+        Create store from arrays returned by to_arrays and tag names, arrays are used without copying.
+        """
+        store = cls.__new__(cls)
+        store.tags = list(tags)
+        store.delta = None
+        store._columns = {name: (arrays[name], arrays[name + '_offsets']) for name in DocumentStore.COLUMNS}
+        return store
+
+    def append(self, documents):
+        """
+        Returns store with given documents appended, only delta store is copied.
+        :param documents: DocumentStore of appended documents.
+        """
+        store = self._main()
+        store.delta = documents if self.delta is None else DocumentStore.concatenate([self.delta, documents])
+        return store
+
+    def _main(self):
+        """
+        Store which shares main columns of this store, without delta store.
+        """
+        store = DocumentStore.__new__(DocumentStore)
+        store.tags = self.tags
+        store.delta = None
+        store._columns = self._columns
+        return store
+
+    def merged(self):
+        """
+        Returns store without delta store, main store is returned without copying if delta store is empty.
+        """
+        if self.delta is None:
+            return self
+        return DocumentStore.concatenate([self._main(), self.delta])
+
+    @property
+    def _n_main(self) -> int:
+        return len(self._columns['texts'][1]) - 1
+
+    @classmethod
+    def concatenate(cls, stores: list):
+        """
+        Returns store with documents of all given stores, tag ids of every store are mapped to merged tag list.
+        """
+        tag_ids = {}
+        columns = {name: [] for name in DocumentStore.COLUMNS}
+        for store in map(DocumentStore.merged, stores):
+            tag_map = np.array([tag_ids.setdefault(tag, len(tag_ids)) for tag in store.tags], dtype=np.int32)
+            for name, (values, offsets) in store._columns.items():
+                columns[name].append((tag_map[values] if name == 'tag_ids' else values, offsets))
+
+        merged = cls()
+        merged.tags = list(tag_ids)
+        for name, parts in columns.items():
+            if not parts:
+                continue
+            ends = np.cumsum([0] + [len(values) for values, _ in parts])
+            offsets = np.concatenate([np.zeros(1, dtype=np.int64)] + [offsets[1:] + end
+                                                                      for (_, offsets), end in zip(parts, ends)])
+            merged._columns[name] = (np.concatenate([values for values, _ in parts]), offsets)
+        return merged
+
+    def take(self, rows: np.ndarray):
+        """
+        Returns store with documents at given rows, in given order.
+        """
+        if self.delta is not None:
+            return self.merged().take(rows=rows)
+        rows = np.asarray(rows, dtype=np.int64)
+        store = self._main()
+        store._columns = {}
+        for name, (values, offsets) in self._columns.items():
+            lengths = offsets[rows + 1] - offsets[rows]
+            new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=new_offsets[1:])
+            positions = np.repeat(offsets[rows] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+            store._columns[name] = (values[positions], new_offsets)
+        return store
+
+    @property
+    def nbytes(self) -> int:
+        nbytes = sum(values.nbytes + offsets.nbytes for values, offsets in self._columns.values())
+        return nbytes + (self.delta.nbytes if self.delta is not None else 0)
+
+    def __len__(self):
+        return self._n_main + (len(self.delta) if self.delta is not None else 0)
+
+    def _row(self, name: str, index: int) -> np.ndarray:
+        if index >= self._n_main:
+            return self.delta._row(name, index - self._n_main)
+        values, offsets = self._columns[name]
+        return values[offsets[index]:offsets[index + 1]]
+
+    def _position(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Document index out of range.")
+        return int(index)
+
+    def text(self, index: int) -> str:
+        return self._row('texts', self._position(index)).tobytes().decode('utf-8')
+
+    def texts(self, rows: np.ndarray = None) -> list:
+        """
+        Decode texts of given rows, None decodes all texts.
+        """
+        return self._decode('texts', rows=rows)
+
+    def doc_ids(self, rows: np.ndarray = None) -> list:
+        return [json.loads(doc_id) for doc_id in self._decode('ids', rows=rows)]
+
+    def _decode(self, name: str, rows: np.ndarray = None) -> list:
+        if rows is not None:
+            return [self._row(name, self._position(index)).tobytes().decode('utf-8') for index in rows]
+        values, offsets = self._columns[name]
+        buffer = values.tobytes()
+        offsets = offsets.tolist()
+        decoded = [buffer[start:stop].decode('utf-8') for start, stop in zip(offsets[:-1], offsets[1:])]
+        return decoded + (self.delta._decode(name) if self.delta is not None else [])
+
+    def tag_index(self) -> TagIndex:
+        """
+        TagIndex of stored documents, documents of delta store are in delta index of TagIndex.
+        """
+        tag_ids, indptr = self._columns['tag_ids']
+        index = TagIndex.from_document_tag_ids(tags=self.tags, tag_ids=tag_ids, indptr=indptr)
+        if self.delta is not None:
+            index = index.with_delta(delta=self.delta.tag_index(), offset=self._n_main)
+        return index
+
+    def __getitem__(self, index) -> Document:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        index = self._position(index)
+        if index >= self._n_main:
+            return self.delta[index - self._n_main]
+        return Document(doc_id=json.loads(self._row('ids', index).tobytes().decode('utf-8')),
+                        text=self._row('texts', index).tobytes().decode('utf-8'),
+                        tags=[self.tags[tag_id] for tag_id in self._row('tag_ids', index)])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
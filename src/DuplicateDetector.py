@@ -0,0 +1,111 @@
+"""
+Near duplicate detection with MinHash and locality sensitive hashing (LSH). Every question is turned into set of
+trimmed words, MinHash signature estimates Jaccard similarity of two sets, and questions whose signatures share
+a band are compared. Similar questions are grouped into clusters.
+"""
+import numpy as np
+
+from src.Tokenizer import Tokenizer
+
+
+class DuplicateDetector:
+    BATCH_SIZE = 4096
+
+    def __init__(self, threshold=0.8, n_hashes=64, n_bands=16, seed=0):
+        """
+        :param threshold: Questions with estimated Jaccard similarity of word sets at least threshold are
+                          duplicates.
+        :param n_hashes: Length of MinHash signature, longer signature estimates similarity more precisely.
+        :param n_bands: Number of LSH bands, n_hashes should be divisible by it. More bands find more candidate
+                        pairs with lower similarity.
+        :param seed: Seed of hash functions.
+        """
+        if n_hashes % n_bands:
+            raise ValueError("Number of hashes should be divisible by number of bands.")
+        self.threshold = threshold
+        self.n_hashes = n_hashes
+        self.n_bands = n_bands
+        random = np.random.RandomState(seed)
+        # Multiply shift hashing, odd multipliers and upper 32 bits of 64 bit product
+        self._multipliers = random.randint(0, 2 ** 63, size=n_hashes, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._increments = random.randint(0, 2 ** 63, size=n_hashes, dtype=np.uint64)
+        self._band_multipliers = random.randint(0, 2 ** 63, size=n_hashes // n_bands,
+                                                dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def signatures(self, texts: list) -> (np.ndarray, np.ndarray):
+        """
+        MinHash signatures of texts.
+        :return: (signatures, empty), signatures of (N, n_hashes) shape and mask of texts without words.
+        """
+        signatures = np.zeros((len(texts), self.n_hashes), dtype=np.uint64)
+        empty = np.zeros(len(texts), dtype=bool)
+        for start in range(0, len(texts), DuplicateDetector.BATCH_SIZE):
+            batch = texts[start:start + DuplicateDetector.BATCH_SIZE]
+            word_lists = [Tokenizer.trim(text).split() for text in batch]
+            lengths = np.fromiter(map(len, word_lists), dtype=np.int64, count=len(word_lists))
+            words = (word for word_list in word_lists for word in word_list)
+            word_hashes = Tokenizer.buckets(words=words, n_buckets=2 ** 32, count=int(lengths.sum()))
+
+            # Unique words of every text, keys are sorted by text
+            keys = np.unique(np.repeat(np.arange(len(batch), dtype=np.int64), lengths) << 32 | word_hashes)
+            rows, word_hashes = keys >> 32, (keys & 0xffffffff).astype(np.uint64)
+            hashes = (word_hashes[:, np.newaxis] * self._multipliers + self._increments) >> np.uint64(32)
+
+            batch_empty = lengths == 0
+            non_empty = np.flatnonzero(~batch_empty)
+            starts = np.searchsorted(rows, non_empty)
+            if len(non_empty):
+                signatures[start + non_empty] = np.minimum.reduceat(hashes, starts, axis=0)
+            empty[start:start + len(batch)] = batch_empty
+        return signatures, empty
+
+    def cluster(self, texts: list, skip: np.ndarray = None) -> np.ndarray:
+        """
+        Group near duplicate texts.
+        :param texts: List of texts.
+        :param skip: Mask of texts which are left out of clusters.
+        :return: Cluster label of every text, label is the lowest position of text in cluster.
+        """
+        signatures, empty = self.signatures(texts=texts)
+        # Texts without words have no signature
+        candidates = np.flatnonzero(~empty if skip is None else ~(empty | skip))
+        pairs = [self._band_pairs(signatures=signatures[candidates], band=band) for band in range(self.n_bands)]
+        # The same pair is usually found in more bands
+        pair_keys = np.unique(np.concatenate([first * len(candidates) + second for first, second in pairs]))
+        firsts, seconds = candidates[pair_keys // len(candidates)], candidates[pair_keys % len(candidates)]
+
+        # Pairs are verified with similarity estimated from whole signatures
+        similarity = (signatures[firsts] == signatures[seconds]).mean(axis=1)
+        similar = similarity >= self.threshold
+        return DuplicateDetector._connected_components(n=len(texts), firsts=firsts[similar], seconds=seconds[similar])
+
+    def _band_pairs(self, signatures: np.ndarray, band: int) -> (np.ndarray, np.ndarray):
+        """
+        Texts with the same band values are paired with the first text of their bucket.
+        """
+        if not len(signatures):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        rows = self.n_hashes // self.n_bands
+        keys = (signatures[:, band * rows:(band + 1) * rows] * self._band_multipliers).sum(axis=1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        bucket_start = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+        firsts = order[np.flatnonzero(bucket_start)][np.cumsum(bucket_start) - 1]
+        paired = firsts != order
+        return firsts[paired], order[paired]
+
+    @staticmethod
+    def _connected_components(n: int, firsts: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+        """
+        Label of every node is the lowest node connected with it, labels are propagated until they do not change.
+        """
+        labels = np.arange(n)
+        while True:
+            pair_labels = np.minimum(labels[firsts], labels[seconds])
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, firsts, pair_labels)
+            np.minimum.at(new_labels, seconds, pair_labels)
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
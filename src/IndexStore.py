@@ -0,0 +1,142 @@
+"""
+Directory based on-disk format of search engine index. Arrays are stored as raw .npy files which are loaded with
+memory mapping, so loading is fast and multiple processes share the same pages through OS cache.
+
+Directory layout:
+    manifest.json   - format version, metadata and checksum of every other file
+    <name>.npy      - one file per array
+    vocabulary.txt  - vocabulary words, one word per line in word index order, followed by other counted words
+    documents.jsonl - optional, one document per line, same structure as questions corpus. Search engine keeps
+                      questions in columnar arrays instead (see DocumentStore), older indexes have this file.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from src.Document import Document
+from src.LazyDocuments import LazyDocuments
+
+
+class IndexStore:
+    FORMAT_VERSION = 1
+    MANIFEST_FILE = 'manifest.json'
+    VOCABULARY_FILE = 'vocabulary.txt'
+    DOCUMENTS_FILE = 'documents.jsonl'
+
+    def __init__(self, path):
+        """
+        :param path: Path to index directory.
+        """
+        self.path = path
+
+    @staticmethod
+    def is_index(path) -> bool:
+        return os.path.isfile(os.path.join(path, IndexStore.MANIFEST_FILE))
+
+    def write(self, arrays: dict, words: list, metadata: dict, documents: list = None):
+        """
+        Write index into directory. Manifest is written last, so directory without manifest is incomplete index.
+        :param arrays: Arrays of index, key is array name.
+        :param words: Vocabulary words in word index order, followed by other counted words.
+        :param metadata: Json serializable information about index.
+        :param documents: List of Document objects, None writes no documents file.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        manifest_path = os.path.join(self.path, IndexStore.MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        # Files are written under temporary name and renamed, so index which is memory mapped from the same
+        # directory keeps reading old files
+        files = {}
+        for name, array in arrays.items():
+            file_name = name + '.npy'
+            with open(self._temporary_path(file_name), 'wb') as fw:
+                np.save(fw, np.ascontiguousarray(array), allow_pickle=False)
+            files[file_name] = self._replace(file_name)
+
+        with open(self._temporary_path(IndexStore.VOCABULARY_FILE), 'w', encoding='utf-8') as fw:
+            for word in words:
+                fw.write(word + '\n')
+        files[IndexStore.VOCABULARY_FILE] = self._replace(IndexStore.VOCABULARY_FILE)
+
+        if documents is not None:
+            with open(self._temporary_path(IndexStore.DOCUMENTS_FILE), 'w', encoding='utf-8') as fw:
+                for document in documents:
+                    document: Document
+                    fw.write(json.dumps({'id': document.doc_id, 'question': document.text,
+                                         'tags': document.tags}) + '\n')
+            files[IndexStore.DOCUMENTS_FILE] = self._replace(IndexStore.DOCUMENTS_FILE)
+        elif os.path.exists(os.path.join(self.path, IndexStore.DOCUMENTS_FILE)):
+            os.remove(os.path.join(self.path, IndexStore.DOCUMENTS_FILE))
+
+        manifest = {
+            'format_version': IndexStore.FORMAT_VERSION,
+            'arrays': sorted(arrays),
+            'files': files,
+            'metadata': metadata
+        }
+        with open(manifest_path, 'w') as fw:
+            json.dump(manifest, fw, indent=4)
+
+    def _temporary_path(self, file_name) -> str:
+        return os.path.join(self.path, file_name + '.tmp')
+
+    def _replace(self, file_name) -> str:
+        """
+        Move temporary file to its place and return its checksum.
+        """
+        os.replace(self._temporary_path(file_name), os.path.join(self.path, file_name))
+        return self._checksum(file_name)
+
+    def read(self, verify=False) -> (dict, list, LazyDocuments, dict):
+        """
+        Read index from directory, arrays are memory mapped read only and documents are decoded when accessed.
+        :param verify: Check checksum of every file, it reads whole index so it is slower.
+        :return: (arrays, words, documents, metadata), documents are None if index has no documents file.
+        """
+        manifest = self.read_manifest()
+        if verify:
+            self.verify(manifest=manifest)
+
+        arrays = {}
+        for name in manifest['arrays']:
+            arrays[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r', allow_pickle=False)
+
+        with open(os.path.join(self.path, IndexStore.VOCABULARY_FILE), 'r', encoding='utf-8') as fr:
+            words = fr.read().splitlines()
+
+        documents = None
+        if IndexStore.DOCUMENTS_FILE in manifest['files']:
+            documents = LazyDocuments(path=os.path.join(self.path, IndexStore.DOCUMENTS_FILE))
+        return arrays, words, documents, manifest['metadata']
+
+    def read_manifest(self) -> dict:
+        manifest_path = os.path.join(self.path, IndexStore.MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            raise FileNotFoundError("Index manifest does not exist in %s." % self.path)
+
+        with open(manifest_path, 'r') as fr:
+            manifest = json.load(fr)
+        if manifest.get('format_version') != IndexStore.FORMAT_VERSION:
+            raise ValueError("Unsupported index format version %s, expected %s."
+                             % (manifest.get('format_version'), IndexStore.FORMAT_VERSION))
+        return manifest
+
+    def verify(self, manifest: dict = None):
+        """
+        Compare checksum of every index file with checksum from manifest.
+        """
+        manifest = manifest or self.read_manifest()
+        for file_name, checksum in manifest['files'].items():
+            if self._checksum(file_name) != checksum:
+                raise ValueError("Checksum of index file %s does not match manifest." % file_name)
+
+    def _checksum(self, file_name) -> str:
+        sha = hashlib.sha256()
+        with open(os.path.join(self.path, file_name), 'rb') as fr:
+            for block in iter(lambda: fr.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
@@ -0,0 +1,249 @@
+"""
+Inverted index over TF-IDF vectors. For every vocabulary word it keeps posting list of documents which contain
+the word, so query is scored only against documents that share at least one word with it. Documents added after
+the index was built are kept in smaller delta index, see with_delta.
+"""
+import numpy as np
+
+from src.SparseMatrix import SparseMatrix
+
+
+class InvertedIndex:
+    def __init__(self, vectors: SparseMatrix, normalize=True):
+        """
+        Build posting lists from corpus vectors. Posting weights are divided by document norm, so sum of
+        query and posting weights products is cosine similarity. Weights are kept in precision of vectors,
+        for int8 quantized vectors every document has its own scale.
+        :param vectors: Vectorized question corpus of (N, D) shape.
+        :param normalize: Divide document and query weights by their norms, without it score is dot product
+                          (used for BM25 weights).
+        """
+        self.n_docs, self.n_terms = vectors.shape
+        self.normalize = normalize
+        self._delta = None
+
+        norms = vectors.row_norms() if normalize else np.ones(self.n_docs)
+        doc_ids = vectors.row_ids()
+        values = vectors.values()
+        weights = np.divide(values, norms[doc_ids], out=np.zeros(vectors.nnz), where=norms[doc_ids] > 0)
+
+        # Stable sort keeps document ids sorted inside every posting list
+        order = np.argsort(vectors.indices, kind='stable')
+        self._postings_docs = doc_ids[order]
+        self._postings_indptr = np.zeros(self.n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(vectors.indices, minlength=self.n_terms), out=self._postings_indptr[1:])
+        if vectors.quantized:
+            self._postings_weights = vectors.data[order]
+            self._doc_scales = np.divide(vectors.scales, norms, out=np.zeros(self.n_docs),
+                                         where=norms > 0).astype(np.float32)
+        else:
+            self._postings_weights = weights[order].astype(vectors.dtype)
+            self._doc_scales = None
+
+        # Max weight of every posting list, upper bound used for pruning
+        self._max_weights = np.zeros(self.n_terms)
+        non_empty = np.flatnonzero(np.diff(self._postings_indptr))
+        if len(non_empty):
+            self._max_weights[non_empty] = np.maximum.reduceat(weights[order], self._postings_indptr[non_empty])
+
+    def with_delta(self, delta):
+        """
+        Returns index over documents of this index followed by documents of delta index. Posting lists of this
+        index are shared, so appending documents costs only building index of appended documents.
+        :param delta: InvertedIndex of appended documents, replaces delta index of this index.
+        """
+        index = InvertedIndex.from_arrays(arrays=self._main_arrays(), n_docs=self._n_main + delta.n_docs,
+                                          normalize=self.normalize)
+        index._delta = delta
+        return index
+
+    @property
+    def _n_main(self) -> int:
+        return self.n_docs - (self._delta.n_docs if self._delta is not None else 0)
+
+    def merged(self):
+        """
+        Returns index without delta index, posting lists of delta index are appended to posting lists of this index.
+        """
+        if self._delta is None:
+            return self
+        indptr, (main_positions, delta_positions) = SparseMatrix.hstack_positions([self._postings_indptr,
+                                                                                  self._delta._postings_indptr])
+        arrays = {'indptr': indptr, 'max_weights': np.maximum(self._max_weights, self._delta._max_weights)}
+        for name, delta_array in [('docs', self._delta._postings_docs + self._n_main),
+                                  ('weights', self._delta._postings_weights)]:
+            main_array = self._main_arrays()[name]
+            arrays[name] = np.zeros(indptr[-1], dtype=main_array.dtype)
+            arrays[name][main_positions] = main_array
+            arrays[name][delta_positions] = delta_array
+        if self._doc_scales is not None:
+            arrays['doc_scales'] = np.concatenate([self._doc_scales, self._delta._doc_scales])
+        return InvertedIndex.from_arrays(arrays=arrays, n_docs=self.n_docs, normalize=self.normalize)
+
+    @property
+    def nbytes(self) -> int:
+        nbytes = sum(array.nbytes for array in self._main_arrays().values())
+        return nbytes + (self._delta.nbytes if self._delta is not None else 0)
+
+    def to_arrays(self) -> dict:
+        """
+        Arrays which fully describe the index, used for storing it on disk.
+        """
+        return self.merged()._main_arrays()
+
+    def _main_arrays(self) -> dict:
+        arrays = {
+            'docs': self._postings_docs,
+            'weights': self._postings_weights,
+            'indptr': self._postings_indptr,
+            'max_weights': self._max_weights
+        }
+        if self._doc_scales is not None:
+            arrays['doc_scales'] = self._doc_scales
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, n_docs: int, normalize=True):
+        """
+        Create index from arrays returned by to_arrays, arrays are used without copying.
+        """
+        index = cls.__new__(cls)
+        index.n_docs = n_docs
+        index.normalize = normalize
+        index._delta = None
+        index.n_terms = len(arrays['indptr']) - 1
+        index._postings_docs = arrays['docs']
+        index._postings_weights = arrays['weights']
+        index._postings_indptr = arrays['indptr']
+        index._max_weights = arrays['max_weights']
+        index._doc_scales = arrays.get('doc_scales')
+        return index
+
+    def postings(self, term_index: int) -> (np.ndarray, np.ndarray):
+        """
+        Returns posting list for given vocabulary word.
+        :return: (doc_ids, weights), doc ids are sorted.
+        """
+        begin, end = self._postings_indptr[term_index], self._postings_indptr[term_index + 1]
+        docs, weights = self._postings_docs[begin:end], self._postings_weights[begin:end]
+        if self._doc_scales is not None:
+            weights = weights * self._doc_scales[docs]
+        if self._delta is not None:
+            # Delta documents follow documents of this index, so doc ids stay sorted
+            delta_docs, delta_weights = self._delta.postings(term_index)
+            docs = np.concatenate([docs, delta_docs + self._n_main])
+            weights = np.concatenate([weights, delta_weights])
+        return docs, weights
+
+    @property
+    def score_dtype(self):
+        """
+        Precision in which query weights are multiplied with posting weights.
+        """
+        return np.float64 if self._postings_weights.dtype == np.float64 else np.float32
+
+    def search(self, query_vector: SparseMatrix, n: int = None, prune: bool = False,
+               mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """
+        Score corpus documents against one query vector using only posting lists of query words.
+        :param query_vector: Vectorized query of (1, D) shape.
+        :param n: Number of best documents caller needs, used only for pruning.
+        :param prune: Use MaxScore pruning, documents which can not reach top n are skipped. Top n documents
+                      and their scores stay the same as without pruning.
+        :param mask: Boolean array of (N,) shape, only documents with True are scored. Posting lists are
+                     filtered while scores are accumulated, for example with documents of a tag.
+        :return: (doc_ids, scores), sorted doc ids of scored documents and their cosine similarity.
+        """
+        query_terms, query_weights = self._query_weights(query_vector)
+        if not len(query_terms):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        if not prune or not n:
+            postings = [self._masked_postings(term, mask=mask) for term in query_terms]
+            docs = np.concatenate([docs for docs, _ in postings])
+            contributions = np.concatenate([weights * q_weight
+                                            for (_, weights), q_weight in zip(postings, query_weights)])
+            doc_ids, inverse = np.unique(docs, return_inverse=True)
+            return doc_ids, np.bincount(inverse, weights=contributions, minlength=len(doc_ids))
+        return self._search_max_score(query_terms=query_terms, query_weights=query_weights, n=n, mask=mask)
+
+    def search_many(self, query_vectors: SparseMatrix, mask: np.ndarray = None) -> list:
+        """
+        Score corpus documents against every query vector. Posting lists of all query words are gathered
+        (and filtered with mask) once per batch, and scores of every query are accumulated in array of corpus
+        size, so documents are not sorted. Scores are the same as scores of search without pruning.
+        :param query_vectors: Vectorized queries of (M, D) shape.
+        :param mask: Boolean array of (N,) shape, only documents with True are scored.
+        :return: List of M (doc_ids, scores) pairs, see search.
+        """
+        postings = {term: self._masked_postings(term, mask=mask) for term in np.unique(query_vectors.indices)}
+        results = []
+        for row in range(len(query_vectors)):
+            query_terms, query_weights = self._query_weights(query_vectors.getrow(row))
+            if not len(query_terms):
+                results.append((np.zeros(0, dtype=np.int64), np.zeros(0)))
+                continue
+            docs = np.concatenate([postings[term][0] for term in query_terms])
+            contributions = np.concatenate([postings[term][1] * q_weight
+                                            for term, q_weight in zip(query_terms, query_weights)])
+            scores = np.bincount(docs, weights=contributions, minlength=self.n_docs)
+            doc_ids = np.flatnonzero(scores)
+            results.append((doc_ids, scores[doc_ids]))
+        return results
+
+    def _query_weights(self, query_vector: SparseMatrix) -> (np.ndarray, np.ndarray):
+        """
+        Word indices of query and their weights, divided by query norm. Query without weights has no words.
+        """
+        query_terms = query_vector.indices
+        query_norm = np.linalg.norm(query_vector.values()) if self.normalize else 1.
+        if query_norm == 0 or not len(query_terms):
+            return query_terms[:0], np.zeros(0)
+        return query_terms, (query_vector.values() / query_norm).astype(self.score_dtype)
+
+    def _masked_postings(self, term_index: int, mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        docs, weights = self.postings(term_index)
+        if mask is None:
+            return docs, weights
+        selected = mask[docs]
+        return docs[selected], weights[selected]
+
+    def _search_max_score(self, query_terms, query_weights, n, mask=None):
+        """
+        Term at a time MaxScore. Terms are processed from the highest score upper bound. When sum of upper bounds
+        of remaining terms drops below current n-th best score, new documents can not enter top n, so remaining
+        terms only update already found candidates.
+        """
+        max_weights = self._max_weights[query_terms]
+        if self._delta is not None:
+            max_weights = np.maximum(max_weights, self._delta._max_weights[query_terms])
+        upper_bounds = query_weights * max_weights
+        order = np.argsort(-upper_bounds, kind='stable')
+        remaining_bounds = np.cumsum(upper_bounds[order][::-1])[::-1]
+
+        doc_ids = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        essential = True
+        for position, term_position in enumerate(order):
+            docs, weights = self._masked_postings(query_terms[term_position], mask=mask)
+            contributions = weights * query_weights[term_position]
+
+            if essential:
+                all_docs = np.concatenate([doc_ids, docs])
+                doc_ids, inverse = np.unique(all_docs, return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, contributions]),
+                                     minlength=len(doc_ids))
+            else:
+                positions = np.minimum(np.searchsorted(doc_ids, docs), len(doc_ids) - 1)
+                found = doc_ids[positions] == docs
+                scores[positions[found]] += contributions[found]
+
+            rest_bound = remaining_bounds[position + 1] if position + 1 < len(order) else 0.
+            if len(scores) >= n:
+                threshold = np.partition(scores, len(scores) - n)[len(scores) - n]
+                if rest_bound < threshold:
+                    essential = False
+                    # Drop candidates which can not reach top n even with all remaining terms
+                    keep = scores + rest_bound >= threshold
+                    doc_ids, scores = doc_ids[keep], scores[keep]
+        return doc_ids, scores
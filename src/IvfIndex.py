@@ -0,0 +1,182 @@
+"""
+Inverted file (IVF) index for approximate search. Question vectors are clustered with spherical k-means,
+query is scored only against questions from clusters with the most similar centroids.
+"""
+import numpy as np
+
+from src.SparseMatrix import SparseMatrix
+
+
+class IvfIndex:
+    ASSIGN_CHUNK_SIZE = 16384
+    # Max number of values in (nnz, n_lists) product of one assigned chunk with centroids
+    ASSIGN_BUFFER_SIZE = 1 << 22
+
+    def __init__(self, vectors: SparseMatrix, n_lists: int = None, n_probe: int = 8, n_iterations: int = 10,
+                 sample_size: int = 100000, seed: int = 0):
+        """
+        Cluster L2 normalized vectors and build list of questions for every cluster.
+        :param vectors: Normalized question vectors of (N, D) shape.
+        :param n_lists: Number of clusters, default is square root of number of questions. It is limited to number
+            of non empty questions used for fitting centroids.
+        :param n_probe: Default number of clusters searched for query, more clusters give better recall.
+        :param n_iterations: Number of k-means iterations.
+        :param sample_size: Max number of questions used for fitting centroids, all questions are assigned.
+        :param seed: Seed for centroid initialization and sampling.
+        """
+        n_docs = vectors.shape[0]
+        non_empty = np.flatnonzero(np.diff(vectors.indptr))
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_docs))
+        self.n_probe = n_probe
+
+        rng = np.random.default_rng(seed)
+        sample = non_empty
+        if len(sample) > sample_size:
+            sample = np.sort(rng.choice(sample, size=sample_size, replace=False))
+        # Initial centroids are distinct sampled questions
+        n_lists = max(1, min(n_lists, len(sample)))
+        self._delta = None
+        self.centroids = self._fit_centroids(vectors=vectors.take_rows(sample), n_lists=n_lists,
+                                             n_iterations=n_iterations, rng=rng)
+        self._set_lists(assignment=self.assign(vectors=vectors))
+
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """
+        Normalize rows in place, zero rows stay zero.
+        """
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+    def _fit_centroids(self, vectors: SparseMatrix, n_lists: int, n_iterations: int, rng) -> np.ndarray:
+        """
+        Spherical k-means, centroid is normalized sum of its questions and questions are assigned by cosine
+        similarity. Empty clusters get random question as new centroid. Sums are accumulated only for
+        (cluster, column) pairs which occur in vectors, so the only dense array is float32 centroids.
+        """
+        n_docs, n_cols = vectors.shape
+        if n_docs == 0:
+            return np.zeros((1, n_cols), dtype=np.float32)
+        centroids = vectors.take_rows(rng.choice(n_docs, size=n_lists, replace=False)).toarray()
+        centroids = IvfIndex._normalize_rows(centroids.astype(np.float32))
+        row_ids = vectors.row_ids()
+        values = vectors.values()
+        for _ in range(n_iterations):
+            self.centroids = centroids
+            assignment = self.assign(vectors=vectors)
+            keys, positions = np.unique(assignment[row_ids] * n_cols + vectors.indices, return_inverse=True)
+            centroids = np.zeros((n_lists, n_cols), dtype=np.float32)
+            centroids.flat[keys] = np.bincount(positions, weights=values)
+            empty = np.flatnonzero(np.bincount(assignment, minlength=n_lists) == 0)
+            if len(empty):
+                centroids[empty] = vectors.take_rows(rng.choice(n_docs, size=len(empty))).toarray()
+            centroids = IvfIndex._normalize_rows(centroids)
+        return centroids
+
+    def assign(self, vectors: SparseMatrix) -> np.ndarray:
+        """
+        Returns cluster with the most similar centroid for every vector. Vectors are assigned in chunks of rows
+        whose product with centroids has at most ASSIGN_BUFFER_SIZE values.
+        """
+        assignment = np.zeros(vectors.shape[0], dtype=np.int64)
+        centroids = self.centroids.T
+        max_nnz = max(1, IvfIndex.ASSIGN_BUFFER_SIZE // len(self.centroids))
+        start = 0
+        while start < vectors.shape[0]:
+            stop = int(np.searchsorted(vectors.indptr, vectors.indptr[start] + max_nnz, side='right')) - 1
+            stop = min(max(stop, start + 1), start + IvfIndex.ASSIGN_CHUNK_SIZE)
+            chunk = vectors.row_slice(start, stop)
+            assignment[start:start + len(chunk)] = np.argmax(chunk.dot(centroids), axis=1)
+            start += len(chunk)
+        return assignment
+
+    def _set_lists(self, assignment: np.ndarray):
+        # Stable sort keeps question ids sorted inside every list
+        self._docs = np.argsort(assignment, kind='stable')
+        self._indptr = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(self.centroids)), out=self._indptr[1:])
+
+    def with_vectors(self, vectors: SparseMatrix):
+        """
+        Returns index with the same centroids over new vectors, used when questions are removed.
+        """
+        index = IvfIndex.from_arrays(arrays={'centroids': self.centroids}, n_probe=self.n_probe)
+        index._set_lists(assignment=index.assign(vectors=vectors))
+        return index
+
+    def append(self, vectors: SparseMatrix):
+        """
+        Returns index with appended questions assigned to the same centroids. Lists of this index are shared and
+        appended questions are kept in delta lists, so only appended questions are assigned.
+        :param vectors: Normalized vectors of appended questions.
+        """
+        delta = self.with_vectors(vectors=vectors)
+        if self._delta is not None:
+            delta = self._delta._with_delta(delta=delta).merged()
+        return self._with_delta(delta=delta)
+
+    def _with_delta(self, delta):
+        index = IvfIndex.from_arrays(arrays=self._main_arrays(), n_probe=self.n_probe)
+        index._delta = delta
+        return index
+
+    @property
+    def _n_main(self) -> int:
+        # Every question is in exactly one list
+        return len(self._docs)
+
+    def merged(self):
+        """
+        Returns index without appended questions, they are added to lists of this index.
+        """
+        if self._delta is None:
+            return self
+        indptr, (main_positions, delta_positions) = SparseMatrix.hstack_positions([self._indptr,
+                                                                                  self._delta._indptr])
+        docs = np.zeros(indptr[-1], dtype=np.int64)
+        docs[main_positions] = self._docs
+        docs[delta_positions] = self._delta._docs + self._n_main
+        return IvfIndex.from_arrays(arrays={'centroids': self.centroids, 'docs': docs, 'indptr': indptr},
+                                    n_probe=self.n_probe)
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def to_arrays(self) -> dict:
+        """
+        Arrays which fully describe the index, used for storing it on disk.
+        """
+        return self.merged()._main_arrays()
+
+    def _main_arrays(self) -> dict:
+        return {'centroids': self.centroids, 'docs': self._docs, 'indptr': self._indptr}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, n_probe: int = 8):
+        """
+        Create index from arrays returned by to_arrays, arrays are used without copying.
+        """
+        index = cls.__new__(cls)
+        index.n_probe = n_probe
+        index.centroids = arrays['centroids']
+        index._docs = arrays.get('docs')
+        index._indptr = arrays.get('indptr')
+        index._delta = None
+        return index
+
+    def candidates(self, query_vector: np.ndarray, n_probe: int = None) -> np.ndarray:
+        """
+        Returns sorted ids of questions from n_probe clusters with the most similar centroids.
+        :param query_vector: Dense query vector of (D,) shape.
+        :param n_probe: Number of searched clusters, default is n_probe of the index.
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        scores = self.centroids.dot(np.asarray(query_vector, dtype=self.centroids.dtype))
+        probes = np.argpartition(-scores, n_probe - 1)[:n_probe]
+        docs = [self._docs[self._indptr[probe]:self._indptr[probe + 1]] for probe in probes]
+        if self._delta is not None:
+            docs.extend(self._delta._docs[self._delta._indptr[probe]:self._delta._indptr[probe + 1]]
+                        + self._n_main for probe in probes)
+        return np.sort(np.concatenate(docs))
@@ -0,0 +1,53 @@
+"""
+Read only list of documents stored in JSONL file. File is memory mapped and only line offsets are computed
+on load, document is decoded from json when it is accessed.
+"""
+import json
+import mmap
+
+import numpy as np
+
+from src.Document import Document
+
+
+class LazyDocuments:
+    def __init__(self, path):
+        """
+        :param path: Path to JSONL file, one document per line with 'id', 'question' and 'tags' fields.
+        """
+        self.path = path
+        with open(path, 'rb') as fr:
+            # Empty file can not be memory mapped
+            self._buffer = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ) if fr.seek(0, 2) else b''
+        line_ends = np.flatnonzero(np.frombuffer(self._buffer, dtype=np.uint8) == ord('\n'))
+        if len(self._buffer) and (not len(line_ends) or line_ends[-1] != len(self._buffer) - 1):
+            line_ends = np.append(line_ends, len(self._buffer))
+        self._offsets = np.zeros(len(line_ends) + 1, dtype=np.int64)
+        self._offsets[1:] = line_ends + 1
+
+    def view(self, start: int, stop: int):
+        """
+        Returns LazyDocuments with documents from start to stop, memory mapped file is shared.
+        """
+        documents = LazyDocuments.__new__(LazyDocuments)
+        documents.path = self.path
+        documents._buffer = self._buffer
+        documents._offsets = self._offsets[start:stop + 1]
+        return documents
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index) -> Document:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Document index out of range.")
+        document_json = json.loads(self._buffer[self._offsets[index]:self._offsets[index + 1]])
+        return Document(doc_id=document_json['id'], text=document_json['question'], tags=document_json['tags'])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
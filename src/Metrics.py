@@ -0,0 +1,131 @@
+"""
+Lightweight metrics of search engine: counters, gauges and histograms of time spent in search stages,
+exported in Prometheus text format. Metrics are disabled by default, then stage timing costs one method call
+and counters are not recorded.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Histogram:
+    # Upper bounds of buckets in seconds
+    DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5,
+                       5., 10.)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Last count is for values larger than every bucket bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics:
+    PREFIX = 'qse_'
+
+    def __init__(self, enabled=False):
+        """
+        :param enabled: Record counters and time of search stages, gauges are exported always.
+        """
+        self.enabled = enabled
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._disabled_stage = nullcontext()
+
+    def stage(self, name: str):
+        """
+        Context manager which measures time spent in stage, it does nothing when metrics are disabled.
+            with metrics.stage('transform'):
+                ...
+        """
+        if not self.enabled:
+            return self._disabled_stage
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name=name, seconds=time.perf_counter() - start)
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        self._gauges[name] = value
+
+    def register_collector(self, collector):
+        """
+        Register function which returns dict of gauge values, it is called on every export.
+        """
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def to_prometheus(self) -> str:
+        """
+        Returns all metrics in Prometheus text exposition format.
+        """
+        gauges = dict(self._gauges)
+        for collector in self._collectors:
+            gauges.update(collector())
+
+        prefix = Metrics.PREFIX
+        lines = []
+        with self._lock:
+            if self._stages:
+                lines.append('# HELP %sstage_seconds Time spent in search stages.' % prefix)
+                lines.append('# TYPE %sstage_seconds histogram' % prefix)
+            for stage, histogram in sorted(self._stages.items()):
+                bounds = [repr(bound) for bound in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.cumulative_counts()):
+                    lines.append('%sstage_seconds_bucket{stage="%s",le="%s"} %d' % (prefix, stage, bound, count))
+                lines.append('%sstage_seconds_sum{stage="%s"} %r' % (prefix, stage, histogram.sum))
+                lines.append('%sstage_seconds_count{stage="%s"} %d' % (prefix, stage, histogram.count))
+            for name, value in sorted(self._counters.items()):
+                lines.append('# TYPE %s%s counter' % (prefix, name))
+                lines.append('%s%s %r' % (prefix, name, value))
+        for name, value in sorted(gauges.items()):
+            lines.append('# TYPE %s%s gauge' % (prefix, name))
+            lines.append('%s%s %r' % (prefix, name, float(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics shared by search engine, vectorizer and web server
+metrics = Metrics()
@@ -0,0 +1,71 @@
+"""
+Bounded LRU cache for query results. Every entry belongs to index version, when index contents change
+(version is different) whole cache is invalidated.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    def __init__(self, max_size=10000, ttl=None):
+        """
+        :param max_size: Max number of cached entries, least recently used entry is evicted first.
+        :param ttl: Entry lifetime in seconds, None means entries do not expire.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        # key -> (value, insert_time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """
+        Returns cached value or None if key is not cached.
+        :param key: Hashable key.
+        :param version: Current index version.
+        """
+        with self._lock:
+            self._check_version(version=version)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                self._entries.pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, version):
+        with self._lock:
+            self._check_version(version=version)
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.
+        }
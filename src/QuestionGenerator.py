@@ -0,0 +1,95 @@
+"""
+Generator of synthetic questions corpus for benchmarks. Question lengths, frequent words and tags are taken from
+sample corpus, rest of vocabulary is made of generated words with Zipf distribution, so vocabulary grows with
+corpus size like in real questions.
+"""
+import gzip
+import json
+
+import numpy as np
+
+from src.CorpusReader import CorpusReader
+from src.Document import Document
+
+
+class QuestionGenerator:
+    SYLLABLES = ['ba', 'co', 'de', 'fi', 'ga', 'ho', 'ja', 'ke', 'li', 'mo', 'nu', 'pa', 'qui', 're', 'si', 'to',
+                 'va', 'xe', 'yo', 'za', 'ar', 'en', 'ix', 'on', 'ur']
+    DEFAULT_TAGS = ['python', 'java', 'javascript', 'c#', 'typescript', 'go', 'linux', 'mysql']
+    # Questions generated with one batch of random numbers
+    BATCH_SIZE = 100000
+
+    def __init__(self, sample_path=None, vocabulary_size=50000, zipf_exponent=1.1, seed=0):
+        """
+        :param sample_path: Corpus which generated questions should look like, None uses built in defaults.
+        :param vocabulary_size: Number of distinct words, sample corpus words are the most frequent ones.
+        :param zipf_exponent: Word with rank r has probability proportional to 1 / r ** zipf_exponent.
+        :param seed: Seed of random generator, the same seed gives the same corpus.
+        """
+        self._rng = np.random.default_rng(seed)
+        word_counts = {}
+        lengths = []
+        tag_counts = {}
+        n_tags = []
+        if sample_path is not None:
+            for document in CorpusReader(path=sample_path):
+                words = document.text.rstrip('?').lower().split()
+                lengths.append(len(words))
+                for word in words:
+                    word_counts[word] = word_counts.get(word, 0) + 1
+                tags = document.tags if isinstance(document.tags, list) else []
+                n_tags.append(len(tags))
+                for tag in tags:
+                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
+
+        sample_words = sorted(word_counts, key=lambda word: -word_counts[word])
+        self.words = sample_words + self._generate_words(n_words=max(0, vocabulary_size - len(sample_words)),
+                                                         known=set(sample_words))
+        ranks = np.arange(1, len(self.words) + 1, dtype=float)
+        self._word_probabilities = ranks ** -zipf_exponent
+        self._word_probabilities /= self._word_probabilities.sum()
+
+        self._lengths = np.asarray(lengths or list(range(3, 13)), dtype=np.int64)
+        self._n_tags = np.asarray(n_tags or [1, 2, 3], dtype=np.int64)
+        self.tags = sorted(tag_counts, key=lambda tag: -tag_counts[tag]) or list(QuestionGenerator.DEFAULT_TAGS)
+        tag_weights = np.asarray([tag_counts.get(tag, 1) for tag in self.tags], dtype=float)
+        self._tag_probabilities = tag_weights / tag_weights.sum()
+
+    def _generate_words(self, n_words: int, known: set) -> list:
+        words = []
+        seen = set(known)
+        syllables = QuestionGenerator.SYLLABLES
+        while len(words) < n_words:
+            n_syllables = self._rng.integers(2, 5)
+            word = ''.join(syllables[index] for index in self._rng.integers(0, len(syllables), size=n_syllables))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    def generate(self, n: int, start_id: int = 0):
+        """
+        Yields n Document objects with consecutive string ids.
+        """
+        for batch_start in range(0, n, QuestionGenerator.BATCH_SIZE):
+            batch_size = min(QuestionGenerator.BATCH_SIZE, n - batch_start)
+            lengths = self._rng.choice(self._lengths, size=batch_size)
+            word_ids = self._rng.choice(len(self.words), size=int(lengths.sum()), p=self._word_probabilities)
+            n_tags = np.minimum(self._rng.choice(self._n_tags, size=batch_size), len(self.tags))
+            offset = 0
+            for position, (length, tags_count) in enumerate(zip(lengths, n_tags)):
+                words = [self.words[word_id] for word_id in word_ids[offset:offset + length]]
+                offset += length
+                tag_ids = self._rng.choice(len(self.tags), size=tags_count, replace=False, p=self._tag_probabilities)
+                yield Document(doc_id=str(start_id + batch_start + position), text=' '.join(words).capitalize() + '?',
+                               tags=[self.tags[tag_id] for tag_id in tag_ids])
+
+    def write(self, path, n: int):
+        """
+        Write n generated questions as JSONL corpus, gzip compressed if path ends with .gz.
+        """
+        opener = gzip.open if str(path).endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as fw:
+            for document in self.generate(n=n):
+                fw.write(json.dumps({'id': document.doc_id, 'question': document.text, 'tags': document.tags}))
+                fw.write('\n')
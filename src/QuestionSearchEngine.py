@@ -1,136 +1,1106 @@
 """
 Implemented Question Search Engine witch search similar question based on vector similarity.
 """
-import json
 import logging
 import os
 import pickle
+import time
+from itertools import chain
 
 
+import numpy as np
+
+from src.CorpusReader import CorpusReader
 from src.Document import Document
-from src.SimilarityScorer import SimilarityScorer
+from src.DocumentStore import DocumentStore
+from src.DuplicateDetector import DuplicateDetector
+from src.IndexStore import IndexStore
+from src.InvertedIndex import InvertedIndex
+from src.IvfIndex import IvfIndex
+from src.Metrics import metrics
+from src.QueryCache import QueryCache
+from src.SearchPipeline import SearchPipeline
+from src.SegmentedMatrix import SegmentedMatrix
+from src.SimilarityScorer import SCORERS, Scorer, SimilarityScorer
+from src.SparseMatrix import SparseMatrix
+from src.TagIndex import TagIndex
 from src.TfIdfVectorizer import TfIdfVectorizer
+from src.TopNSelector import TopNSelector
 
 
 class QuestionsSearchEngine:
     STORED_INFO_FILE = 'info_data'
     STORED_VECTORS_FILE = 'vectors'
+    # Pickle cache file saved by older versions next to index directory
+    LEGACY_CACHE_FILE = 'qse_data.pkl'
+    SCORING_CHUNK_SIZE = 16384
+    # Number of corpus questions packed into DocumentStore at once while streaming corpus
+    STORE_BATCH_SIZE = 10000
+    # Compaction is recommended when IDF weights drift or too many questions are removed
+    IDF_DRIFT_THRESHOLD = 0.05
+    REMOVED_FRACTION_THRESHOLD = 0.2
+    # Added questions are indexed in delta segment, which is merged into main segment on compaction
+    DELTA_FRACTION_THRESHOLD = 0.2
+    # Supported precisions of stored vectors, int8 vectors are scalar quantized with per question scale
+    STORAGE_DTYPES = ('float64', 'float32', 'int8')
+    # exact - every question is scored, approx - only questions from the nearest IVF clusters
+    SEARCH_MODES = ('exact', 'approx')
 
-    def __init__(self, questions=None, stop_words_path="", embedding_size=100, skip_process=False) -> None:
+    def __init__(self, questions=None, stop_words_path="", embedding_size=100, skip_process=False,
+                 workers=1, dtype='float32', n_features=None) -> None:
         """
         Initialize search engine by vectorizing question corpus.
         :param questions:
         :param stop_words_path:
-        :param embedding_size:
+        :param embedding_size: Vocabulary size, None keeps every corpus word. Vectors are stored as
+                               SparseMatrix, so memory scales with number of words instead of vocabulary size.
         :param skip_process:
+        :param workers: Number of processes used for fitting and vectorizing corpus.
+        :param dtype: Precision of stored vectors, one of STORAGE_DTYPES. Queries are scored in this precision.
+        :param n_features: Number of hashing buckets, words are hashed into buckets instead of keeping vocabulary
+                           and embedding_size is not used, see TfIdfVectorizer.
         """
         if questions is None:
             questions = []
+        if dtype not in QuestionsSearchEngine.STORAGE_DTYPES:
+            raise ValueError("Storage dtype should be one of %s." % (QuestionsSearchEngine.STORAGE_DTYPES,))
+        self._dtype = dtype
+        # Index version, changed whenever index contents change
+        self._version = 0
+        self._result_cache = None
+        self._vector_cache = None
+        self._ann_index = None
+        self._scorer = None
+        self._pipeline = None
+        # Near duplicates collapsed into stored questions (DocumentStore), duplicates of row i are
+        # _duplicate_docs[_duplicate_indptr[i]:_duplicate_indptr[i + 1]]
+        self._duplicate_docs = None
+        self._duplicate_indptr = None
         if skip_process:
             return
 
-        self._vectorizer = TfIdfVectorizer(stop_words_path=stop_words_path, embedding_size=embedding_size)
+        self._vectorizer = TfIdfVectorizer(stop_words_path=stop_words_path, embedding_size=embedding_size,
+                                           n_features=n_features)
         question_list = []
         for document in questions:
             document: Document
             question_list.append(document.text)
 
-        self._vectorizer.fit(questions=question_list)
+        self._vectorizer.fit(questions=question_list, workers=workers)
+        logging.log(logging.INFO, "Finished model fitting")
+        vector_matrix = self._vectorizer.transform_sparse(questions=question_list, workers=workers)
+        logging.log(logging.INFO, "Finished processing corpus into vectors")
+        self._set_stored_data(documents=questions, vector_matrix=self._storage_vectors(vector_matrix))
+
+    @classmethod
+    def from_corpus(cls, path, stop_words_path="", embedding_size=100, workers=1, skip_malformed=True,
+                    dtype='float32', n_features=None):
+        """
+        Initialize search engine from corpus file without loading whole file into memory. Corpus is read in two
+        streaming passes, first one fits vectorizer and second one vectorizes questions batch by batch. Questions
+        are kept only as columnar DocumentStore.
+        :param path: Path to .jsonl or .jsonl.gz questions corpus.
+        :param stop_words_path:
+        :param embedding_size:
+        :param workers: Number of processes used for fitting and vectorizing corpus.
+        :param skip_malformed: Skip corpus lines which are not valid json, otherwise raise ValueError.
+        :param dtype: Precision of stored vectors.
+        :param n_features: Number of hashing buckets used instead of vocabulary.
+        :return: QuestionsSearchEngine
+        """
+        reader = CorpusReader(path=path, skip_malformed=skip_malformed)
+        engine = cls(skip_process=True, dtype=dtype)
+        engine._vectorizer = TfIdfVectorizer(stop_words_path=stop_words_path, embedding_size=embedding_size,
+                                             n_features=n_features)
+        engine._vectorizer.fit(questions=reader.questions(), workers=workers)
         logging.log(logging.INFO, "Finished model fitting")
-        vector_matrix = self._vectorizer.transform(questions=question_list)
+
+        stores = []
+
+        def questions():
+            # Questions are packed into columnar store batch by batch, so corpus is not kept as Document objects
+            for batch in reader.batches(batch_size=QuestionsSearchEngine.STORE_BATCH_SIZE):
+                stores.append(DocumentStore(documents=batch))
+                for document in batch:
+                    yield document.text
+
+        vector_matrix = engine._vectorizer.transform_sparse(questions=questions(), workers=workers)
         logging.log(logging.INFO, "Finished processing corpus into vectors")
-        for doc, vector in zip(questions, vector_matrix[:]):
-            doc: Document
-            doc.vector = vector
+        engine._set_stored_data(documents=DocumentStore.concatenate(stores),
+                                vector_matrix=engine._storage_vectors(vector_matrix))
+        return engine
+
+    @classmethod
+    def from_vectorizer(cls, documents: list, vectorizer: TfIdfVectorizer, workers=1, dtype='float32'):
+        """
+        Initialize search engine with already fitted vectorizer, so IDF weights can come from larger corpus
+        (see ShardedSearchEngine). Vectorizer is shared, not copied.
+        :param documents: List of Document objects or DocumentStore.
+        :param vectorizer: Fitted TfIdfVectorizer.
+        :param workers: Number of processes used for vectorizing questions.
+        :param dtype: Precision of stored vectors.
+        :return: QuestionsSearchEngine
+        """
+        engine = cls(skip_process=True, dtype=dtype)
+        engine._vectorizer = vectorizer
+        if isinstance(documents, DocumentStore):
+            questions = documents.texts()
+        else:
+            questions = [document.text for document in documents]
+        vector_matrix = vectorizer.transform_sparse(questions=questions, workers=workers, progress_bar=False)
+        engine._set_stored_data(documents=documents, vector_matrix=engine._storage_vectors(vector_matrix))
+        return engine
+
+    def _storage_vectors(self, vectors: SparseMatrix) -> SparseMatrix:
+        """
+        Vectors are stored L2 normalized in storage precision, so scoring queries is a single dot product.
+        """
+        return vectors.normalized().astype(self._dtype)
+
+    @property
+    def dtype(self) -> str:
+        return self._dtype
+
+    def __len__(self):
+        return len(self._stored_data)
+
+    @property
+    def vectorizer(self) -> TfIdfVectorizer:
+        return self._vectorizer
+
+    def get_document(self, index: int) -> Document:
+        """
+        Returns question at given corpus position.
+        """
+        return self._stored_data[index]
+
+    def memory_usage(self) -> dict:
+        """
+        Returns number of bytes used by stored questions, vectors and inverted index posting lists.
+        """
+        usage = {
+            'documents': self._stored_data.nbytes,
+            'vectors': self._stored_data_vectors.nbytes,
+            'postings': self._inverted_index.nbytes
+        }
+        if self._scorer is not None:
+            usage['scorer'] = self._scorer.nbytes
+        if self._pipeline is not None:
+            usage['pipeline'] = self._pipeline.nbytes
+        return usage
+
+    def _set_stored_data(self, documents, vector_matrix: SparseMatrix, removed: np.ndarray = None,
+                         ann_index: IvfIndex = None):
+        """
+        :param documents: DocumentStore or list of Document objects, list is converted to DocumentStore.
+        :param ann_index: IVF index built over vector_matrix, by default questions are assigned to centroids
+            of existing IVF index.
+        """
+        if not isinstance(documents, DocumentStore):
+            documents = DocumentStore(documents=documents)
+        self._stored_data = documents
+        self._stored_data_vectors = SegmentedMatrix(main=vector_matrix)
+        self._set_removed(removed=removed)
+        self._inverted_index = InvertedIndex(vectors=vector_matrix)
+        self._tag_index = documents.tag_index()
+        if ann_index is not None:
+            self._ann_index = ann_index
+        elif self._ann_index is not None:
+            # Remaining questions are assigned to existing centroids, build_ann_index fits them again
+            self._ann_index = self._ann_index.with_vectors(vectors=vector_matrix)
+        if self._scorer is not None:
+            self._fit_scorer()
+        if self._pipeline is not None:
+            self._fit_pipeline()
+        logging.log(logging.INFO, "Finished building inverted index")
+
+    def _fit_scorer(self):
+        self._scorer.fit(texts=self._stored_data.texts(), tokenizer=self._vectorizer.tokenizer,
+                         n_terms=self._vectorizer.embedding_size)
+
+    def _set_removed(self, removed: np.ndarray = None):
+        """
+        Set tombstones of removed questions, removed questions stay in index until compaction.
+        """
+        if removed is None:
+            removed = np.zeros(len(self._stored_data), dtype=bool)
+        self._removed = removed
+        self._n_removed = int(np.count_nonzero(removed))
+        self._doc_rows = None
+        self._version += 1
+
+    def add_documents(self, documents: list) -> float:
+        """
+        Add questions to index without fitting vectorizer again. Questions are vectorized with current vocabulary
+        and IDF weights, and document frequency statistics are updated. Added questions are indexed in delta
+        segment, so main segment is not copied, compact merges the segments.
+        :param documents: List of Document objects.
+        :return: IDF drift after update, see needs_compaction.
+        """
+        if not documents:
+            return self._vectorizer.idf_drift()
+
+        texts = [document.text for document in documents]
+        vectors = self._storage_vectors(self._vectorizer.transform_sparse(questions=texts, progress_bar=False))
+        self._vectorizer.update_word_counts(questions=texts)
+
+        n_stored = len(self._stored_data)
+        doc_rows = self._doc_rows
+        self._stored_data = self._stored_data.append(DocumentStore(documents=documents))
+        self._stored_data_vectors = self._stored_data_vectors.append(vectors)
+        self._set_removed(removed=np.concatenate([self._removed, np.zeros(len(texts), dtype=bool)]))
+        if doc_rows is not None:
+            for row, document in enumerate(documents, start=n_stored):
+                doc_rows.setdefault(document.doc_id, []).append(row)
+            self._doc_rows = doc_rows
+        self._set_delta(vectors=vectors, texts=texts)
+        if self._duplicate_indptr is not None:
+            self._duplicate_indptr = np.concatenate([self._duplicate_indptr,
+                                                     np.repeat(self._duplicate_indptr[-1], len(texts))])
+        return self._check_compaction()
 
-        self._stored_data = questions
-        self._stored_data_vectors = vector_matrix
+    def _set_delta(self, vectors: SparseMatrix, texts: list):
+        """
+        Index delta segment after questions with given vectors and texts were appended, indexes of main segment
+        are shared.
+        """
+        delta_index = InvertedIndex(vectors=self._stored_data_vectors.delta)
+        self._inverted_index = self._inverted_index.with_delta(delta=delta_index)
+        self._tag_index = self._tag_index.with_delta(delta=self._stored_data.delta.tag_index(),
+                                                     offset=len(self._stored_data_vectors.main))
+        if self._ann_index is not None:
+            self._ann_index = self._ann_index.append(vectors=vectors)
+        if self._scorer is not None:
+            self._scorer.append(texts=texts)
+        if self._pipeline is not None:
+            self._pipeline.append(texts=texts, documents=self._stored_data, tag_index=self._tag_index)
+
+    def remove_documents(self, doc_ids: list) -> float:
+        """
+        Remove questions with given ids from search results. Removed questions are marked with tombstone and
+        dropped from index on compaction. Ids of near duplicates collapsed by deduplicate are removed from
+        duplicates, and when question with duplicates is removed, its first remaining duplicate is added
+        to index in its place.
+        :param doc_ids: Ids of questions (Document.doc_id).
+        :return: IDF drift after update, see needs_compaction.
+        """
+        if self._doc_rows is None:
+            self._doc_rows = {}
+            for row, doc_id in enumerate(self._stored_data.doc_ids()):
+                self._doc_rows.setdefault(doc_id, []).append(row)
+
+        rows = [row for doc_id in doc_ids for row in self._doc_rows.get(doc_id, [])]
+        rows = [row for row in rows if not self._removed[row]]
+        clusters = []
+        if self._duplicate_indptr is not None:
+            clusters = self._remove_duplicates(doc_ids=set(doc_ids), rows=rows)
+        if rows:
+            # Tombstones loaded from index directory are read only
+            removed = np.array(self._removed)
+            removed[rows] = True
+            self._removed = removed
+            self._n_removed = int(np.count_nonzero(removed))
+            self._version += 1
+            self._vectorizer.update_word_counts(questions=self._stored_data.texts(rows=rows), removed=True)
+        if clusters:
+            self._promote_duplicates(clusters=clusters)
+        return self._check_compaction()
+
+    def _remove_duplicates(self, doc_ids: set, rows: list) -> list:
+        """
+        Drop duplicates with given ids, and duplicates of given removed stored question rows.
+        :return: Remaining duplicates of every removed row which has them, lists of Document objects.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        counts = np.diff(self._duplicate_indptr)
+        owners = np.repeat(np.arange(len(counts)), counts)
+        keep = np.array([doc_id not in doc_ids for doc_id in self._duplicate_docs.doc_ids()], dtype=bool)
+        clusters = [self._duplicate_docs[start:stop] for start, stop in
+                    zip(self._duplicate_indptr[rows], self._duplicate_indptr[rows + 1])]
+        clusters = [[document for document in cluster if document.doc_id not in doc_ids] for cluster in clusters]
+        keep[np.isin(owners, rows)] = False
+        if not keep.all():
+            self._duplicate_indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(owners[keep], minlength=len(counts)), out=self._duplicate_indptr[1:])
+            self._duplicate_docs = self._duplicate_docs.take(rows=np.flatnonzero(keep))
+            self._version += 1
+        return [cluster for cluster in clusters if cluster]
+
+    def _promote_duplicates(self, clusters: list):
+        """
+        Add first question of every cluster of duplicates to index, other questions become its duplicates.
+        """
+        n_stored = len(self._stored_data)
+        self.add_documents(documents=[cluster[0] for cluster in clusters])
+        rest = [cluster[1:] for cluster in clusters]
+        self._duplicate_docs = DocumentStore.concatenate([self._duplicate_docs,
+                                                          DocumentStore(documents=list(chain.from_iterable(rest)))])
+        self._duplicate_indptr[n_stored + 1:] += np.cumsum([len(duplicates) for duplicates in rest])
+
+    @property
+    def _n_delta(self) -> int:
+        return len(self._stored_data_vectors) - len(self._stored_data_vectors.main)
+
+    @property
+    def needs_compaction(self) -> bool:
+        """
+        True if IDF weights of stored vectors drifted from current corpus statistics, or too many questions
+        are removed or added. Call compact to fit vectorizer again and rebuild index.
+        """
+        removed_fraction = self._n_removed / max(len(self._stored_data), 1)
+        delta_fraction = self._n_delta / max(len(self._stored_data), 1)
+        return (self._vectorizer.idf_drift() > QuestionsSearchEngine.IDF_DRIFT_THRESHOLD
+                or removed_fraction > QuestionsSearchEngine.REMOVED_FRACTION_THRESHOLD
+                or delta_fraction > QuestionsSearchEngine.DELTA_FRACTION_THRESHOLD)
+
+    def _check_compaction(self) -> float:
+        idf_drift = self._vectorizer.idf_drift()
+        if self.needs_compaction:
+            logging.log(logging.WARNING, "Index should be compacted, IDF drift %.4f, removed questions %d, "
+                        "questions in delta segment %d" % (idf_drift, self._n_removed, self._n_delta))
+        return idf_drift
+
+    def compact(self, workers=1):
+        """
+        Drop removed questions, fit vectorizer on current questions and vectorize them again. Refitted vectorizer
+        has different vocabulary, so IVF index is built again with the same number of lists.
+        :param workers: Number of processes used for fitting and vectorizing corpus.
+        """
+        documents = self._stored_data.take(rows=np.flatnonzero(~self._removed))
+        vectorizer = self._vectorizer.clone()
+        question_list = documents.texts()
+        vectorizer.fit(questions=question_list, workers=workers)
+        vector_matrix = self._storage_vectors(vectorizer.transform_sparse(questions=question_list, workers=workers))
+        ann_index = None
+        if self._ann_index is not None:
+            ann_index = IvfIndex(vectors=vector_matrix, n_lists=self._ann_index.n_lists,
+                                 n_probe=self._ann_index.n_probe)
+        # Engine is changed only after everything is rebuilt, failed compaction keeps previous index
+        self._vectorizer = vectorizer
+        if self._duplicate_indptr is not None:
+            # Removed questions have no duplicates, remove_documents promotes them
+            self._take_duplicates(rows=np.flatnonzero(~self._removed))
+        self._set_stored_data(documents=documents, vector_matrix=vector_matrix, ann_index=ann_index)
+        logging.log(logging.INFO, "Finished index compaction")
+
+    def deduplicate(self, threshold=0.8, n_hashes=64, n_bands=16, seed=0) -> int:
+        """
+        Collapse near duplicate questions, see DuplicateDetector. Only the first question of every cluster stays
+        in index, other questions are kept as its duplicates and most_similar returns them with
+        expand_duplicates. Removed questions are not collapsed.
+        :param threshold: Minimal estimated Jaccard similarity of question word sets.
+        :param n_hashes: Length of MinHash signatures.
+        :param n_bands: Number of LSH bands.
+        :param seed: Seed of hash functions.
+        :return: Number of collapsed questions.
+        """
+        detector = DuplicateDetector(threshold=threshold, n_hashes=n_hashes, n_bands=n_bands, seed=seed)
+        labels = detector.cluster(texts=self._stored_data.texts(), skip=self._removed)
+        positions = np.arange(len(labels))
+        rows = np.flatnonzero(labels == positions)
+        if len(rows) == len(labels):
+            return 0
+
+        # Rows are visited in corpus order, so duplicates of first question of cluster come first.
+        # Members are positions in stored questions followed by already collapsed duplicates.
+        cluster_positions = np.searchsorted(rows, labels)
+        sources = [self._stored_data]
+        if self._duplicate_indptr is None:
+            has_duplicates = np.zeros(len(labels), dtype=bool)
+        else:
+            has_duplicates = np.diff(self._duplicate_indptr) > 0
+            sources.append(self._duplicate_docs)
+        members = [[] for _ in rows]
+        for row in np.flatnonzero((labels != positions) | has_duplicates):
+            cluster = members[cluster_positions[row]]
+            if labels[row] != row:
+                cluster.append(row)
+            if has_duplicates[row]:
+                start, stop = self._duplicate_indptr[row:row + 2] + len(labels)
+                cluster.extend(range(start, stop))
+
+        self._duplicate_docs = DocumentStore.concatenate(sources).take(
+            rows=np.fromiter(chain.from_iterable(members), dtype=np.int64))
+        self._duplicate_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(cluster) for cluster in members], out=self._duplicate_indptr[1:])
+        self._set_stored_data(documents=self._stored_data.take(rows=rows),
+                              vector_matrix=self._stored_data_vectors.take_rows(rows), removed=self._removed[rows])
+        logging.log(logging.INFO, "Collapsed %d near duplicate questions" % (len(labels) - len(rows)))
+        return len(labels) - len(rows)
+
+    def _take_duplicates(self, rows: np.ndarray):
+        """
+        Keep duplicates of given stored question rows only.
+        """
+        starts, stops = self._duplicate_indptr[rows], self._duplicate_indptr[rows + 1]
+        self._duplicate_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(stops - starts, out=self._duplicate_indptr[1:])
+        positions = np.repeat(starts - self._duplicate_indptr[:-1], stops - starts)
+        self._duplicate_docs = self._duplicate_docs.take(rows=positions + np.arange(self._duplicate_indptr[-1]))
+
+    def duplicates(self, index: int) -> list:
+        """
+        Returns near duplicates collapsed into question at given corpus position.
+        """
+        if self._duplicate_indptr is None:
+            return []
+        return self._duplicate_docs[self._duplicate_indptr[index]:self._duplicate_indptr[index + 1]]
+
+    def build_ann_index(self, n_lists: int = None, n_probe: int = 8, n_iterations: int = 10, seed: int = 0):
+        """
+        Build IVF index used by approximate search (mode='approx'). Questions are clustered with k-means and
+        query is scored only against questions from n_probe clusters with the most similar centroids.
+        :param n_lists: Number of clusters, default is square root of number of questions.
+        :param n_probe: Default number of searched clusters, more clusters give better recall and slower search.
+        :param n_iterations: Number of k-means iterations.
+        :param seed: Seed for centroid initialization.
+        """
+        self._ann_index = IvfIndex(vectors=self._stored_data_vectors.merged(), n_lists=n_lists, n_probe=n_probe,
+                                   n_iterations=n_iterations, seed=seed)
+        self._version += 1
+        logging.log(logging.INFO, "Finished building IVF index with %d lists" % self._ann_index.n_lists)
+
+    def set_scorer(self, scorer: Scorer = None):
+        """
+        Score questions with given scorer (for example Bm25Scorer) instead of TF-IDF cosine similarity. Scorer is
+        fitted on stored questions and fitted again on compaction, added questions are appended to it. It is saved
+        together with the engine.
+        Scores of other scorers are not limited to [0, 1], so min_score has to be chosen for them.
+        :param scorer: Not fitted Scorer, None returns to cosine similarity.
+        """
+        self._scorer = scorer
+        if scorer is not None:
+            self._fit_scorer()
+        self._version += 1
+
+    @property
+    def scorer(self) -> Scorer:
+        return self._scorer
+
+    def build_pipeline(self, pipeline: SearchPipeline = None, workers=1):
+        """
+        Enable two stage search with search_pipeline. Second stage vectorizer is fitted on stored questions and
+        fitted again on compaction, added questions are vectorized with it. Pipeline is not saved with the engine,
+        loading drops it, so build it again after loading.
+        :param pipeline: SearchPipeline with candidate count, stage budgets and boosts, None disables pipeline.
+        :param workers: Number of processes used for fitting second stage vectorizer.
+        """
+        self._pipeline = pipeline
+        if pipeline is not None:
+            self._fit_pipeline(workers=workers)
+            logging.log(logging.INFO, "Finished building search pipeline")
+
+    def _fit_pipeline(self, workers=1):
+        self._pipeline.fit(documents=self._stored_data, tag_index=self._tag_index,
+                           stop_words=self._vectorizer.tokenizer.stop_words, workers=workers)
+
+    def search_pipeline(self, query: str, n: int = 5, tags=None, match: str = 'any', boost_tags=None,
+                        mode: str = 'exact', n_probe: int = None) -> dict:
+        """
+        Two stage search, see build_pipeline. First stage returns pipeline.candidates best questions from index
+        (posting lists, IVF clusters in approx mode, or scorer), second stage scores only them again.
+        :param query: The raw query question input from the user.
+        :param n: The number of similar questions returned from corpus.
+        :param tags: Tag or list of tags, only questions with matching tags are candidates.
+        :param match: 'any' or 'all' of tags, see most_similar.
+        :param boost_tags: Tag or list of tags which increase score of candidates, see SearchPipeline.tag_boost.
+        :param mode: Search mode of first stage, 'exact' or 'approx'.
+        :param n_probe: Number of IVF clusters searched in approx mode.
+        :return: dict with 'results' (same as most_similar), 'timings' (seconds of 'candidates' and 'rescore'
+                 stages), number of 'candidates' and 'rescored' candidates, and 'over_budget' stage names.
+        """
+        pipeline = self._pipeline
+        if pipeline is None:
+            raise ValueError("Search pipeline is not built, call build_pipeline first.")
+        metrics.increment('queries_total')
+        over_budget = []
+
+        start = time.perf_counter()
+        query_vector = self._query_vectors(queries=[query])
+        doc_ids, scores = self.search_vector(query_vector=query_vector, n=pipeline.candidates, prune=mode == 'exact',
+                                             tags=tags, match=match, mode=mode, n_probe=n_probe)
+        candidates_seconds = time.perf_counter() - start
+        n_candidates = len(doc_ids)
+
+        rescore_seconds = 0.
+        n_rescored = 0
+        if pipeline.candidate_budget is not None and candidates_seconds > pipeline.candidate_budget:
+            over_budget.append('candidates')
+        else:
+            start = time.perf_counter()
+            deadline = start + pipeline.rescore_budget if pipeline.rescore_budget is not None else None
+            doc_ids, scores = pipeline.rescore(query=query, doc_ids=doc_ids, boost_tags=boost_tags, deadline=deadline)
+            n_rescored = len(doc_ids)
+            if n_rescored < n_candidates:
+                over_budget.append('rescore')
+            doc_ids, scores = TopNSelector(n=n).select(scores=scores, doc_ids=doc_ids)
+            rescore_seconds = time.perf_counter() - start
+
+        if metrics.enabled:
+            metrics.observe(name='pipeline_candidates', seconds=candidates_seconds)
+            metrics.observe(name='pipeline_rescore', seconds=rescore_seconds)
+        for stage in over_budget:
+            metrics.increment('pipeline_%s_over_budget_total' % stage)
+        return {
+            'results': self._query_result(doc_ids=doc_ids[:n], scores=scores[:n]),
+            'timings': {'candidates': candidates_seconds, 'rescore': rescore_seconds},
+            'candidates': n_candidates,
+            'rescored': n_rescored,
+            'over_budget': over_budget
+        }
+
+    def enable_cache(self, max_size=10000, ttl=None, vector_cache_size=1000):
+        """
+        Cache query results and query vectors. Cache key is normalized query word sequence, so queries which differ
+        only in case and punctuation share cache entry. Caches are invalidated when index contents change.
+        :param max_size: Max number of cached query results.
+        :param ttl: Lifetime of cached result in seconds, None means results expire only with index change.
+        :param vector_cache_size: Max number of cached query vectors, 0 disables vector cache.
+        """
+        self._result_cache = QueryCache(max_size=max_size, ttl=ttl)
+        self._vector_cache = QueryCache(max_size=vector_cache_size) if vector_cache_size else None
+
+    def cache_stats(self) -> dict:
+        """
+        Returns hit and miss counters of result and query vector caches.
+        """
+        stats = {}
+        if self._result_cache is not None:
+            stats['results'] = self._result_cache.stats()
+        if self._vector_cache is not None:
+            stats['vectors'] = self._vector_cache.stats()
+        return stats
+
+    def _query_key(self, query: str) -> tuple:
+        return tuple(self._vectorizer.tokenizer.tokenize(query))
+
+    def _vectorize(self, queries: list) -> SparseMatrix:
+        if self._scorer is not None:
+            return self._scorer.query_vectors(texts=queries)
+        return self._vectorizer.transform_sparse(questions=queries, progress_bar=False)
+
+    def _query_vectors(self, queries: list) -> SparseMatrix:
+        """
+        Vectorize queries, vectors of recently seen queries are taken from vector cache.
+        """
+        if self._vector_cache is None:
+            return self._vectorize(queries=queries)
+
+        version = self._version
+        keys = [self._query_key(query) for query in queries]
+        vectors = [self._vector_cache.get(key=key, version=version) for key in keys]
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_vectors = self._vectorize(queries=[queries[position] for position in missing])
+            for row, position in enumerate(missing):
+                vectors[position] = missing_vectors.getrow(row)
+                self._vector_cache.put(key=keys[position], value=vectors[position], version=version)
+        return SparseMatrix.vstack(vectors)
 
     def most_similar(
         self,
         query: str,
-        n: int = 5
+        n: int = 5,
+        prune: bool = False,
+        min_score: float = None,
+        rerank: int = None,
+        tags=None,
+        match: str = 'any',
+        mode: str = 'exact',
+        n_probe: int = None,
+        expand_duplicates: bool = False
         ) -> list:
         """
         Return top n most similar questions from corpus.
         Input question is cleaned and vectorized with fitted
-        TfIdfVectorizer. After that, use
-        cosine_similarity function to get the top n most similar
-        questions from the corpus.
+        TfIdfVectorizer. After that, cosine similarity is gathered
+        from inverted index posting lists of query words, so only
+        questions that share a word with query are scored.
         :param query: The raw query question input from the user.
         :param n: The number of similar questions returned from corpus.
+        :param prune: Skip questions which can not reach top n (MaxScore).
+        :param min_score: Questions with lower similarity are left out of result.
+        :param rerank: Number of best candidates scored again in float32, useful for int8 storage.
+        :param tags: Tag or list of tags, only questions with matching tags are scored.
+        :param match: 'any' - question has at least one of tags, 'all' - question has every tag.
+        :param mode: 'exact' scores every question, 'approx' only questions from the nearest IVF clusters,
+                     see build_ann_index.
+        :param n_probe: Number of IVF clusters searched in approx mode.
+        :param expand_duplicates: Near duplicates collapsed by deduplicate follow their question in result with
+                                  the same score, result still has at most n questions.
         :return: The list of top n most similar questions from corpus along
-        with similarity scores. Note that returned questions are
-        verbatim.
+        with similarity scores, sorted from the most similar. Note that
+        returned questions are verbatim.
+        """
+        version = self._version
+        if self._result_cache is not None:
+            key = (self._query_key(query), n, min_score, rerank, self._tags_key(tags=tags, match=match), mode,
+                   n_probe, expand_duplicates)
+            query_result = self._result_cache.get(key=key, version=version)
+            if query_result is not None:
+                return list(query_result)
+
+        # Transform query question into vector
+        metrics.increment('queries_total')
+        with metrics.stage('query_vectorize'):
+            query_vector = self._query_vectors(queries=[query])
+        doc_ids, similarity_scores = self.search_vector(query_vector=query_vector, n=n, prune=prune,
+                                                        min_score=min_score, rerank=rerank, tags=tags, match=match,
+                                                        mode=mode, n_probe=n_probe)
+        with metrics.stage('result'):
+            query_result = self._query_result(doc_ids=doc_ids, scores=similarity_scores, n=n,
+                                              expand_duplicates=expand_duplicates)
+        if self._result_cache is not None:
+            self._result_cache.put(key=key, value=query_result, version=version)
+            query_result = list(query_result)
+        return query_result
+
+    def search_vector(self, query_vector: SparseMatrix, n: int = 5, prune: bool = False, min_score: float = None,
+                      rerank: int = None, tags=None, match: str = 'any', mode: str = 'exact',
+                      n_probe: int = None) -> (np.ndarray, np.ndarray):
         """
+        Find top n questions for already vectorized query, see most_similar.
+        :param query_vector: Query vector of (1, D) shape, vectorized with vectorizer (or scorer) of this engine.
+        :return: (doc_ids, scores), positions of questions in corpus and their similarity sorted from the most
+                 similar.
+        """
+        self._check_scorer_options(rerank=rerank, mode=mode)
+        if mode != 'exact':
+            # Questions of nearest clusters are scored directly
+            return self.search_vectors(query_vectors=query_vector, n=n, min_score=min_score, rerank=rerank,
+                                       tags=tags, match=match, mode=mode, n_probe=n_probe)[0]
+        return self._search_postings(query_vector=query_vector, n=n, prune=prune, min_score=min_score,
+                                     rerank=rerank, corpus_mask=self._corpus_mask(tags=tags, match=match))
+
+    def _corpus_mask(self, tags, match: str) -> np.ndarray:
+        """
+        Boolean mask of live questions with matching tags, None if tags are not given.
+        """
+        if tags is None:
+            return None
+        mask = self._tag_index.mask(tags=tags, n_docs=len(self._removed), match=match)
+        if self._n_removed:
+            mask &= ~self._removed
+        return mask
+
+    def _search_postings(self, query_vector: SparseMatrix, n: int, prune: bool, min_score: float, rerank: int,
+                         corpus_mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """
+        Search similar questions with cosine similarity over posting lists.
+        :param corpus_mask: Mask of searched questions from _corpus_mask, it leaves out removed questions.
+        """
+        # Removed questions can take at most n_removed places while pruning
+        n_removed = self._n_removed if corpus_mask is None else 0
+        n_candidates = max(n, rerank or 0)
+        inverted_index = self._inverted_index if self._scorer is None else self._scorer.inverted_index
+        with metrics.stage('score'):
+            doc_ids, similarity_scores = inverted_index.search(query_vector=query_vector, n=n_candidates + n_removed,
+                                                               prune=prune, mask=corpus_mask)
+            if n_removed:
+                live = ~self._removed[doc_ids]
+                doc_ids, similarity_scores = doc_ids[live], similarity_scores[live]
+        return self._select_scored(query_vector=query_vector, doc_ids=doc_ids, similarity_scores=similarity_scores,
+                                   n=n, min_score=min_score, rerank=rerank, corpus_mask=corpus_mask)
+
+    def _select_scored(self, query_vector: SparseMatrix, doc_ids: np.ndarray, similarity_scores: np.ndarray,
+                       n: int, min_score: float, rerank: int,
+                       corpus_mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """
+        Find N most similar questions from questions scored over posting lists, see _search_postings.
+        :param query_vector: Query vector, needed only for rerank.
+        """
+        n_candidates = max(n, rerank or 0)
+        selector = TopNSelector(n=n, min_score=min_score)
+        if rerank:
+            with metrics.stage('rerank'):
+                doc_ids, similarity_scores = TopNSelector(n=n_candidates).select(scores=similarity_scores,
+                                                                                 doc_ids=doc_ids)
+                similarity_scores = self._rerank_scores(query_vector=query_vector, doc_ids=doc_ids)
+        with metrics.stage('select'):
+            doc_ids, similarity_scores = selector.select(scores=similarity_scores, doc_ids=doc_ids)
+            return self._fill_zero_scores(selector=selector, doc_ids=doc_ids, scores=similarity_scores,
+                                          corpus_mask=corpus_mask)
+
+    def most_similar_many(
+        self,
+        queries: list,
+        n: int = 5,
+        min_score: float = None,
+        chunk_size: int = None,
+        rerank: int = None,
+        tags=None,
+        match: str = 'any',
+        mode: str = 'exact',
+        n_probe: int = None,
+        expand_duplicates: bool = False
+        ) -> list:
+        """
+        Return top n most similar questions from corpus for every query.
+        All queries are vectorized together, and posting lists of their
+        words are gathered once for the whole batch, so results are the
+        same as results of most_similar for every query.
+        :param queries: The list of raw query questions.
+        :param n: The number of similar questions returned for every query.
+        :param min_score: Questions with lower similarity are left out of result.
+        :param chunk_size: Number of corpus questions scored at once in approx mode.
+        :param rerank: Number of best candidates scored again in float32, useful for int8 storage.
+        :param tags: Tag or list of tags, only questions with matching tags are scored.
+        :param match: 'any' or 'all' of tags, see most_similar.
+        :param mode: 'exact' or 'approx', see most_similar.
+        :param n_probe: Number of IVF clusters searched in approx mode.
+        :param expand_duplicates: Return near duplicates after their question, see most_similar.
+        :return: List with most_similar result for every query.
+        """
+        if not queries:
+            return []
+        search_options = {'min_score': min_score, 'chunk_size': chunk_size, 'rerank': rerank, 'tags': tags,
+                          'match': match, 'mode': mode, 'n_probe': n_probe}
+        if self._result_cache is None:
+            return self._score_many(queries=queries, n=n, expand_duplicates=expand_duplicates, **search_options)
+
+        version = self._version
+        tags_key = self._tags_key(tags=tags, match=match)
+        keys = [(self._query_key(query), n, min_score, rerank, tags_key, mode, n_probe, expand_duplicates)
+                for query in queries]
+        results = [self._result_cache.get(key=key, version=version) for key in keys]
+        missing = [position for position, query_result in enumerate(results) if query_result is None]
+        if missing:
+            missing_results = self._score_many(queries=[queries[position] for position in missing], n=n,
+                                               expand_duplicates=expand_duplicates, **search_options)
+            for position, query_result in zip(missing, missing_results):
+                results[position] = query_result
+                self._result_cache.put(key=keys[position], value=query_result, version=version)
+        return [list(query_result) for query_result in results]
+
+    def _score_many(self, queries: list, n: int, expand_duplicates=False, **search_options) -> list:
+        metrics.increment('queries_total', len(queries))
+        with metrics.stage('query_vectorize'):
+            query_vectors = self._query_vectors(queries=queries)
+        best = self.search_vectors(query_vectors=query_vectors, n=n, **search_options)
+        with metrics.stage('result'):
+            return [self._query_result(doc_ids=doc_ids, scores=similarity_scores, n=n,
+                                       expand_duplicates=expand_duplicates)
+                    for doc_ids, similarity_scores in best]
+
+    def search_vectors(self, query_vectors: SparseMatrix, n: int = 5, min_score: float = None, chunk_size: int = None,
+                       rerank: int = None, tags=None, match: str = 'any', mode: str = 'exact',
+                       n_probe: int = None) -> list:
+        """
+        Find top n questions for every already vectorized query, see most_similar_many.
+        :param query_vectors: Query vectors of (M, D) shape, vectorized with vectorizer (or scorer) of this engine.
+        :return: List of M (doc_ids, scores) pairs sorted from the most similar.
+        """
+        if mode not in QuestionsSearchEngine.SEARCH_MODES:
+            raise ValueError("Search mode should be one of %s." % (QuestionsSearchEngine.SEARCH_MODES,))
+        self._check_scorer_options(rerank=rerank, mode=mode)
+        if mode == 'exact':
+            # Posting lists of query words are gathered once for all queries and filtered with questions
+            # of tags, removed questions are left out by the same mask
+            corpus_mask = self._corpus_mask(tags=tags, match=match)
+            if corpus_mask is None and self._n_removed:
+                corpus_mask = ~self._removed
+            inverted_index = self._inverted_index if self._scorer is None else self._scorer.inverted_index
+            with metrics.stage('score'):
+                scored = inverted_index.search_many(query_vectors=query_vectors, mask=corpus_mask)
+            return [self._select_scored(query_vector=query_vectors.getrow(row) if rerank else None, doc_ids=doc_ids,
+                                        similarity_scores=similarity_scores, n=n, min_score=min_score,
+                                        rerank=rerank, corpus_mask=corpus_mask)
+                    for row, (doc_ids, similarity_scores) in enumerate(scored)]
+
+        if self._ann_index is None:
+            raise ValueError("Approximate search needs IVF index, call build_ann_index first.")
+        # Every query has its own candidate clusters
+        corpus_ids = None if tags is None else self._tag_index.matching(tags=tags, match=match)
+        results = []
+        for row in range(len(query_vectors)):
+            query_vector = query_vectors.getrow(row)
+            candidates = self._ann_index.candidates(query_vector=query_vector.normalized().toarray()[0],
+                                                    n_probe=n_probe)
+            if corpus_ids is not None:
+                candidates = np.intersect1d(candidates, corpus_ids, assume_unique=True)
+            results.extend(self._search_rows(query_vectors=query_vector, corpus_ids=candidates, n=n,
+                                             min_score=min_score, chunk_size=chunk_size, rerank=rerank))
+        return results
+
+    def _search_rows(self, query_vectors: SparseMatrix, corpus_ids: np.ndarray, n: int, min_score: float,
+                     chunk_size: int, rerank: int) -> list:
+        """
+        Score queries against stored vectors in chunks.
+        :param corpus_ids: Sorted ids of scored questions, None scores all questions.
+        """
+        chunk_size = chunk_size or QuestionsSearchEngine.SCORING_CHUNK_SIZE
+        corpus_vectors = self._stored_data_vectors
+        if corpus_ids is not None and self._scorer is None:
+            corpus_vectors = corpus_vectors.take_rows(corpus_ids)
+        n_rows = len(corpus_vectors) if corpus_ids is None else len(corpus_ids)
+        if self._scorer is None:
+            dense_queries = query_vectors.normalized().toarray().astype(self._score_dtype)
+        else:
+            dense_queries = query_vectors.toarray().astype(np.float32)
 
         sim_scorer = SimilarityScorer()
+        final_selector = TopNSelector(n=n, min_score=min_score)
+        selector = TopNSelector(n=max(n, rerank), min_score=None) if rerank else final_selector
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        best = [empty] * len(query_vectors)
+        for start in range(0, n_rows, chunk_size):
+            if corpus_ids is None:
+                chunk_ids = np.arange(start, min(start + chunk_size, n_rows))
+            else:
+                chunk_ids = corpus_ids[start:start + chunk_size]
+            with metrics.stage('score'):
+                if self._scorer is None:
+                    chunk = corpus_vectors.row_slice(start, start + chunk_size)
+                    similarity_scores = sim_scorer.normalized_cosine_similarity(query_vectors=dense_queries,
+                                                                                corpus_vectors=chunk)
+                else:
+                    similarity_scores = self._scorer.score(query_vectors=dense_queries, corpus_ids=chunk_ids)
+            if self._n_removed:
+                live = ~self._removed[chunk_ids]
+                similarity_scores, chunk_ids = similarity_scores[live], chunk_ids[live]
+            with metrics.stage('select'):
+                chunk_best = selector.select_many(scores=similarity_scores.T, doc_ids=chunk_ids)
+                best = [selector.merge(query_best, query_chunk_best)
+                        for query_best, query_chunk_best in zip(best, chunk_best)]
 
-        # Transform query question into vector
-        self._vectorizer.progress_bar = False
-        query_vector = self._vectorizer.transform(questions=[query])
-        self._vectorizer.progress_bar = True
+        results = []
+        for row, (doc_ids, similarity_scores) in enumerate(best):
+            if rerank:
+                similarity_scores = self._rerank_scores(query_vector=query_vectors.getrow(row), doc_ids=doc_ids)
+                doc_ids, similarity_scores = final_selector.select(scores=similarity_scores, doc_ids=doc_ids)
+            if corpus_ids is None:
+                doc_ids, similarity_scores = self._fill_zero_scores(selector=final_selector, doc_ids=doc_ids,
+                                                                    scores=similarity_scores)
+            results.append((doc_ids, similarity_scores))
+        return results
+
+    def _check_scorer_options(self, rerank: int, mode: str):
+        # Rerank and IVF clusters use TF-IDF vectors, which are not scorer query vectors
+        if self._scorer is not None and (rerank or mode != 'exact'):
+            raise ValueError("Rerank and approximate search are supported only with cosine similarity.")
+
+    @staticmethod
+    def _tags_key(tags, match: str):
+        if tags is None:
+            return None
+        return tuple(sorted(set(TagIndex.document_tags(tags)))), match
+
+    @property
+    def _score_dtype(self):
+        return np.float64 if self._dtype == 'float64' else np.float32
 
-        # Search similar question with cosine similarity
-        similarity_scores = sim_scorer.cosine_similarity(query_vectors=query_vector, corpus_vectors=self._stored_data_vectors)
-        similarity_scores = similarity_scores.T
+    def _rerank_scores(self, query_vector: SparseMatrix, doc_ids: np.ndarray) -> np.ndarray:
+        """
+        Score candidate questions again in float32. Candidates are vectorized from their text, so scores do not
+        have quantization error of stored vectors.
+        """
+        if not len(doc_ids):
+            return np.zeros(0)
+        texts = self._stored_data.texts(rows=doc_ids)
+        candidate_vectors = self._vectorizer.transform_sparse(questions=texts, progress_bar=False)
+        candidate_vectors = candidate_vectors.normalized().astype(np.float32)
+        query = query_vector.normalized().toarray().astype(np.float32)
+        return candidate_vectors.dot(query[0]).astype(np.float64)
 
-        # Find N most similar questions from corpus
-        best_scores = (similarity_scores.argsort(axis=1))
-        best_n_scores = best_scores[:, -n:]
+    def _fill_zero_scores(self, selector: TopNSelector, doc_ids: np.ndarray, scores: np.ndarray,
+                          corpus_mask: np.ndarray = None):
+        """
+        Questions without common words with query are not scored, they have zero similarity.
+        If less than n questions are selected, fill result with them in doc id order.
+        :param corpus_mask: Mask of searched questions from _corpus_mask, None if all questions are searched.
+        """
+        if len(doc_ids) >= selector.n or (selector.min_score is not None and selector.min_score > 0):
+            return doc_ids, scores
+        if corpus_mask is not None:
+            corpus_ids = np.flatnonzero(corpus_mask)
+            zero_ids = np.setdiff1d(corpus_ids[:selector.n], doc_ids)[:selector.n - len(doc_ids)]
+            return np.concatenate([doc_ids, zero_ids]), np.concatenate([scores, np.zeros(len(zero_ids))])
+        missing = min(selector.n, len(self._stored_data) - self._n_removed) - len(doc_ids)
+        if missing <= 0:
+            return doc_ids, scores
+        candidates = np.arange(missing + len(doc_ids) + self._n_removed)
+        if self._n_removed:
+            candidates = candidates[~self._removed[candidates]]
+        zero_ids = np.setdiff1d(candidates, doc_ids)[:missing]
+        return np.concatenate([doc_ids, zero_ids]), np.concatenate([scores, np.zeros(missing)])
 
+    def _query_result(self, doc_ids: np.ndarray, scores: np.ndarray, n: int = None,
+                      expand_duplicates: bool = False) -> list:
+        # Only texts of returned questions are decoded
         query_result = []
-        for index in best_n_scores[0]:
-            document: Document = self._stored_data[index]
-            query_result.append((similarity_scores[0, index].round(decimals=4), document.text))
-        return query_result
+        expand_duplicates = expand_duplicates and self._duplicate_indptr is not None
+        for index, score in zip(doc_ids, scores):
+            score = np.float64(score).round(decimals=4)
+            query_result.append((score, self._stored_data.text(index)))
+            if expand_duplicates:
+                if len(query_result) >= n:
+                    break
+                duplicates = range(self._duplicate_indptr[index], self._duplicate_indptr[index + 1])
+                query_result.extend((score, self._duplicate_docs.text(duplicate)) for duplicate in duplicates)
+        return query_result[:n] if expand_duplicates else query_result
 
     def save_stored_data(self, path):
         """
-        Save processed data on disk
-        :param path: Path to file where to save cached data.
+        Save processed data on disk as index directory (see IndexStore).
+        :param path: Path to directory where to save cached data.
         """
-        dirname = os.path.dirname(path)
-        if dirname and not os.path.exists(path=dirname):
-            os.makedirs(dirname)
+        words, appearance_counts, vectorizer_parameters = self._vectorizer.export_vocabulary()
+        # Delta segment is saved merged with main segment
+        vectors = self._stored_data_vectors.merged()
+        documents = self._stored_data.merged()
+        arrays = {
+            'vectors_data': vectors.data,
+            'vectors_indices': vectors.indices,
+            'vectors_indptr': vectors.indptr,
+            'vocabulary_counts': appearance_counts,
+            'document_frequencies': self._vectorizer.document_frequencies(words=words),
+            'removed': self._removed
+        }
+        for name, array in self._inverted_index.to_arrays().items():
+            arrays['postings_' + name] = array
 
-        if not os.path.basename(path):
-            path = os.path.join(path, 'qse_data.pkl')
+        if vectors.quantized:
+            arrays['vectors_scales'] = vectors.scales
+        for name, array in self._tag_index.to_arrays().items():
+            arrays['tags_' + name] = array
+        if self._ann_index is not None:
+            for name, array in self._ann_index.to_arrays().items():
+                arrays['ann_' + name] = array
+        if self._scorer is not None:
+            for name, array in self._scorer.to_arrays().items():
+                arrays['scorer_' + name] = array
+        for name, array in documents.to_arrays().items():
+            arrays['documents_' + name] = array
+        if self._duplicate_indptr is not None:
+            arrays['duplicates_indptr'] = self._duplicate_indptr
+            for name, array in self._duplicate_docs.to_arrays().items():
+                arrays['duplicate_documents_' + name] = array
 
-        with open(path, 'wb') as output:
-            pickle.dump(self._stored_data, output, pickle.HIGHEST_PROTOCOL)
-            pickle.dump(self._stored_data_vectors, output, pickle.HIGHEST_PROTOCOL)
-            pickle.dump(self._vectorizer, output, pickle.HIGHEST_PROTOCOL)
+        metadata = {
+            'n_documents': len(documents),
+            'n_columns': vectors.shape[1],
+            'dtype': self._dtype,
+            'tags': self._tag_index.tags,
+            'document_tags': documents.tags,
+            'duplicate_tags': self._duplicate_docs.tags if self._duplicate_indptr is not None else None,
+            'ann_n_probe': self._ann_index.n_probe if self._ann_index is not None else None,
+            'scorer': dict(self._scorer.parameters(), name=self._scorer.name) if self._scorer is not None else None,
+            'vectorizer': vectorizer_parameters
+        }
+        IndexStore(path=path).write(arrays=arrays, words=words, metadata=metadata)
 
-    def load_stored_data(self, path):
+    @staticmethod
+    def stored_data_path(path):
+        """
+        Returns path from which stored engine is loaded: given index directory, or pickle cache of older versions
+        (LEGACY_CACHE_FILE in parent directory of index) when index directory does not exist yet.
+        :param path: Path to index directory.
+        :return: Path to index directory or pickle cache, None if neither exists.
         """
-        Loads cached data for Question Searched Engine
-        :param path: Path to file where is cached data stored.
+        if os.path.exists(path):
+            return path
+        legacy_path = os.path.join(os.path.dirname(os.path.normpath(path)), QuestionsSearchEngine.LEGACY_CACHE_FILE)
+        if os.path.isfile(legacy_path):
+            return legacy_path
+        return None
+
+    def load_stored_data(self, path, verify=False):
         """
-        if not os.path.isfile(path):
+        Loads cached data for Question Searched Engine. Vectors and posting lists are memory mapped.
+        :param path: Path to index directory, or to pickle file created by older versions.
+        :param verify: Check checksums of index files.
+        """
+        start = time.perf_counter()
+        if os.path.isfile(path):
+            self._load_pickled_data(path=path)
+        else:
+            self._load_index(path=path, verify=verify)
+        metrics.set_gauge('index_load_seconds', time.perf_counter() - start)
+
+    def _load_index(self, path, verify=False):
+        if not IndexStore.is_index(path):
             raise FileNotFoundError("Given path to Question Search Engine cache does not exist.")
 
+        arrays, words, documents, metadata = IndexStore(path=path).read(verify=verify)
+        vectorizer_parameters = metadata['vectorizer']
+        # Indexes saved before document frequencies were stored keep only vocabulary counts
+        self._vectorizer = TfIdfVectorizer.from_vocabulary(words=words, appearance_counts=arrays['vocabulary_counts'],
+                                                           document_frequencies=arrays.get('document_frequencies'),
+                                                           **vectorizer_parameters)
+        self._vectorizer.progress_bar = True
+        self._duplicate_docs = self._duplicate_indptr = None
+        if 'document_tags' in metadata:
+            self._stored_data = DocumentStore.from_arrays(arrays=self._prefixed(arrays, 'documents_'),
+                                                          tags=metadata['document_tags'])
+            if 'duplicates_indptr' in arrays:
+                self._duplicate_docs = DocumentStore.from_arrays(
+                    arrays=self._prefixed(arrays, 'duplicate_documents_'), tags=metadata['duplicate_tags'])
+        else:
+            # Indexes saved before columnar document store keep documents file, duplicates follow stored questions
+            self._stored_data = DocumentStore(documents=documents.view(0, metadata['n_documents']))
+            if 'duplicates_indptr' in arrays:
+                self._duplicate_docs = DocumentStore(documents=documents.view(metadata['n_documents'], len(documents)))
+        if 'duplicates_indptr' in arrays:
+            self._duplicate_indptr = arrays['duplicates_indptr']
+        # Indexes saved before storage precision was configurable keep float64 vectors
+        self._dtype = metadata.get('dtype', 'float64')
+        vectors = SparseMatrix(data=arrays['vectors_data'], indices=arrays['vectors_indices'],
+                               indptr=arrays['vectors_indptr'], shape=(metadata['n_documents'], metadata['n_columns']),
+                               scales=arrays.get('vectors_scales'))
+        self._stored_data_vectors = SegmentedMatrix(main=vectors)
+        self._set_removed(removed=arrays['removed'])
+        self._inverted_index = InvertedIndex.from_arrays(arrays=self._prefixed(arrays, 'postings_'),
+                                                         n_docs=metadata['n_documents'])
+        if 'tags' in metadata:
+            self._tag_index = TagIndex.from_arrays(arrays=self._prefixed(arrays, 'tags_'), tags=metadata['tags'])
+        else:
+            self._tag_index = self._stored_data.tag_index()
+        self._ann_index = None
+        if metadata.get('ann_n_probe') is not None:
+            self._ann_index = IvfIndex.from_arrays(arrays=self._prefixed(arrays, 'ann_'),
+                                                   n_probe=metadata['ann_n_probe'])
+        self._pipeline = None
+        self._scorer = None
+        if metadata.get('scorer') is not None:
+            scorer_arrays = self._prefixed(arrays, 'scorer_')
+            scorer_parameters = dict(metadata['scorer'])
+            scorer_class = SCORERS[scorer_parameters.pop('name')]
+            self._scorer = scorer_class.from_arrays(arrays=scorer_arrays, parameters=scorer_parameters,
+                                                    tokenizer=self._vectorizer.tokenizer)
+
+    @staticmethod
+    def _prefixed(arrays: dict, prefix: str) -> dict:
+        """
+        Arrays whose name starts with prefix, prefix is removed from names.
+        """
+        return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+    def _load_pickled_data(self, path):
+        """
+        Loads cache pickled by older versions of Question Search Engine.
+        """
+        logging.log(logging.WARNING, "Loading pickled cache, save engine again to convert it to index directory")
         with open(path, 'rb') as input:
-            self._stored_data = pickle.load(input)
+            self._stored_data = DocumentStore(documents=pickle.load(input))
             self._stored_data_vectors = pickle.load(input)
             self._vectorizer = pickle.load(input)
+        self._duplicate_docs = self._duplicate_indptr = None
+        self._ann_index = self._scorer = self._pipeline = None
+
+        # Cache created before sparse storage keeps dense, not normalized vectors
+        if isinstance(self._stored_data_vectors, np.ndarray):
+            self._stored_data_vectors = SparseMatrix.from_dense(self._stored_data_vectors).normalized()
+        self._dtype = str(self._stored_data_vectors.dtype)
+        self._inverted_index = InvertedIndex(vectors=self._stored_data_vectors)
+        self._stored_data_vectors = SegmentedMatrix(main=self._stored_data_vectors)
+        self._set_removed()
+        self._tag_index = self._stored_data.tag_index()
 
     @staticmethod
-    def load_questions(path):
+    def load_questions(path, skip_malformed=True):
         if not os.path.exists(path):
             return
-        fr = open(path, 'r')
-        documents = []
-        for row in fr.readlines():
-            row = row.replace('\n', '')
-            sentence_json = json.loads(row)
-            question = sentence_json.get('question', '')
-            doc_id = sentence_json.get('id', '')
-            tags = sentence_json.get('tags', '')
-            doc = Document(text=question, doc_id=doc_id, tags=tags)
-            documents.append(doc)
-        fr.close()
-        return documents
+        return list(CorpusReader(path=path, skip_malformed=skip_malformed))
 
 
 if __name__ == "__main__":
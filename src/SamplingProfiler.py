@@ -0,0 +1,72 @@
+"""
+Sampling profiler which periodically records stacks of all threads. Report is in collapsed stack format
+("outer;inner;function count" per line), which flame graph tools read.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        """
+        :param interval: Seconds between samples.
+        """
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self._stacks[SamplingProfiler._collapse(frame)] += 1
+                self.samples += 1
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def report(self, top: int = None) -> str:
+        """
+        Returns collapsed stacks sorted from the most sampled.
+        :param top: Number of returned stacks, None returns all.
+        """
+        with self._lock:
+            stacks = self._stacks.most_common(top)
+        return ''.join('%s %d\n' % (stack, count) for stack, count in stacks)
@@ -0,0 +1,116 @@
+"""
+Second stage of two stage search. First stage (search engine index) returns bounded number of candidates,
+pipeline scores only them again with full vocabulary TF-IDF vectors and optional phrase and tag boosts.
+Appended questions are vectorized with fitted vocabulary and kept in delta segment of pipeline vectors.
+"""
+import time
+
+import numpy as np
+
+from src.DocumentStore import DocumentStore
+from src.SegmentedMatrix import SegmentedMatrix
+from src.TagIndex import TagIndex
+from src.TfIdfVectorizer import TfIdfVectorizer
+from src.Tokenizer import Tokenizer
+
+
+class SearchPipeline:
+    def __init__(self, candidates=100, candidate_budget=None, rescore_budget=None, phrase_boost=0., tag_boost=0.,
+                 embedding_size=None, chunk_size=256):
+        """
+        :param candidates: Number of candidates returned by first stage.
+        :param candidate_budget: Seconds for first stage, when they are exceeded second stage is skipped and
+                                 first stage ranking is returned.
+        :param rescore_budget: Seconds for second stage. Candidates are scored in chunks from the best first stage
+                               score, chunks which do not fit into budget are left out of result.
+        :param phrase_boost: Added to score of candidates which contain query words as exact phrase.
+        :param tag_boost: Added to score of candidates for every boosted tag they have.
+        :param embedding_size: Vocabulary size of second stage vectorizer, None keeps every corpus word.
+        :param chunk_size: Number of candidates scored between budget checks.
+        """
+        self.candidates = candidates
+        self.candidate_budget = candidate_budget
+        self.rescore_budget = rescore_budget
+        self.phrase_boost = phrase_boost
+        self.tag_boost = tag_boost
+        self.embedding_size = embedding_size
+        self.chunk_size = chunk_size
+        self._vectorizer = None
+        self._vectors = None
+        self._documents = None
+        self._tag_index = None
+
+    def fit(self, documents: DocumentStore, tag_index: TagIndex, stop_words=(), workers=1):
+        """
+        Fit second stage vectorizer and vectorize corpus questions.
+        :param documents: Stored questions, position in store is doc id.
+        :param tag_index: Tags of stored questions, used for tag boosts.
+        :param stop_words: Stop words of search engine vectorizer.
+        :param workers: Number of processes used for fitting and vectorizing corpus.
+        """
+        texts = documents.texts()
+        self._vectorizer = TfIdfVectorizer(embedding_size=self.embedding_size, progress_bar=False)
+        self._vectorizer.set_stop_words(stop_words=stop_words)
+        self._vectorizer.fit(questions=texts, workers=workers)
+        self._vectors = SegmentedMatrix(main=self._vectorize(texts=texts, workers=workers))
+        self._documents = documents
+        self._tag_index = tag_index
+
+    def append(self, texts: list, documents: DocumentStore, tag_index: TagIndex):
+        """
+        Vectorize appended questions with fitted vectorizer, words which are not in its vocabulary are ignored
+        until pipeline is fitted again.
+        :param texts: Appended questions, they follow already vectorized questions.
+        :param documents: Stored questions including appended ones.
+        :param tag_index: Tags of stored questions including appended ones.
+        """
+        self._vectors = self._vectors.append(self._vectorize(texts=texts))
+        self._documents = documents
+        self._tag_index = tag_index
+
+    def _vectorize(self, texts: list, workers=1):
+        vectors = self._vectorizer.transform_sparse(questions=texts, workers=workers, progress_bar=False)
+        return vectors.normalized().astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self._vectors.nbytes if self._vectors is not None else 0
+
+    def rescore(self, query: str, doc_ids: np.ndarray, boost_tags=None,
+                deadline: float = None) -> (np.ndarray, np.ndarray):
+        """
+        Score candidates with full vocabulary cosine similarity and boosts.
+        :param query: Raw query question.
+        :param doc_ids: Candidate doc ids sorted from the best first stage score.
+        :param boost_tags: Tag or list of tags, candidates get tag_boost for every tag they have.
+        :param deadline: time.perf_counter value after which no more chunks are scored.
+        :return: (doc_ids, scores) of scored candidates, in order of doc_ids.
+        """
+        query_vector = self._vectorizer.transform_sparse(questions=[query], progress_bar=False).normalized()
+        dense_query = query_vector.toarray()[0].astype(np.float32)
+        phrase = self._phrase(query) if self.phrase_boost else None
+        boosted = [self._tag_index.documents(tag) for tag in dict.fromkeys(TagIndex.document_tags(boost_tags))]
+
+        scored = []
+        # At least first chunk is scored, so result is never empty because of budget
+        for start in range(0, len(doc_ids), self.chunk_size):
+            if start and deadline is not None and time.perf_counter() > deadline:
+                break
+            chunk_ids = doc_ids[start:start + self.chunk_size]
+            scores = self._vectors.take_rows(chunk_ids).dot(dense_query).astype(np.float64)
+            if phrase:
+                scores += self.phrase_boost * np.array([phrase in self._phrase(self._documents.text(doc_id))
+                                                        for doc_id in chunk_ids])
+            for tag_documents in boosted:
+                scores += self.tag_boost * np.isin(chunk_ids, tag_documents)
+            scored.append(scores)
+        n_scored = sum(len(scores) for scores in scored)
+        return doc_ids[:n_scored], np.concatenate(scored) if scored else np.zeros(0)
+
+    @staticmethod
+    def _phrase(text: str) -> str:
+        """
+        Words of text separated and surrounded by single space, so phrase is matched only on word boundaries.
+        """
+        words = Tokenizer.trim(text).split()
+        return ' %s ' % ' '.join(words) if len(words) > 1 else ''
@@ -0,0 +1,73 @@
+"""
+Sparse matrix made of main segment and delta segment of appended rows. Rows are appended only to delta segment,
+so main segment (which can be memory mapped from index directory) is not copied until segments are merged.
+"""
+import numpy as np
+
+from src.SparseMatrix import SparseMatrix
+
+
+class SegmentedMatrix:
+    def __init__(self, main: SparseMatrix, delta: SparseMatrix = None):
+        """
+        :param main: Rows [0, len(main)).
+        :param delta: Rows which follow main rows, None if no rows were appended.
+        """
+        self.main = main
+        self.delta = delta
+
+    @property
+    def shape(self) -> (int, int):
+        return len(self), self.main.shape[1]
+
+    def __len__(self):
+        return len(self.main) + (len(self.delta) if self.delta is not None else 0)
+
+    @property
+    def nbytes(self) -> int:
+        return self.main.nbytes + (self.delta.nbytes if self.delta is not None else 0)
+
+    def append(self, rows: SparseMatrix):
+        """
+        Returns matrix with given rows appended, only delta segment is copied.
+        """
+        delta = rows if self.delta is None else SparseMatrix.vstack([self.delta, rows])
+        return SegmentedMatrix(main=self.main, delta=delta)
+
+    def merged(self) -> SparseMatrix:
+        """
+        Returns single SparseMatrix with all rows, main segment is returned without copying if delta is empty.
+        """
+        if self.delta is None:
+            return self.main
+        return SparseMatrix.vstack([self.main, self.delta])
+
+    def row_slice(self, start: int, stop: int) -> SparseMatrix:
+        """
+        Returns rows [start, stop), rows from one segment are views into it.
+        """
+        n_main = len(self.main)
+        start, stop = max(0, start), min(len(self), stop)
+        if self.delta is None or stop <= n_main:
+            return self.main.row_slice(start, stop)
+        if start >= n_main:
+            return self.delta.row_slice(start - n_main, stop - n_main)
+        return SparseMatrix.vstack([self.main.row_slice(start, n_main), self.delta.row_slice(0, stop - n_main)])
+
+    def take_rows(self, rows: np.ndarray) -> SparseMatrix:
+        """
+        Returns copy of matrix with given rows, in given order.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        n_main = len(self.main)
+        if self.delta is None or not len(rows) or rows.max() < n_main:
+            return self.main.take_rows(rows)
+        in_delta = rows >= n_main
+        main_positions, delta_positions = np.flatnonzero(~in_delta), np.flatnonzero(in_delta)
+        stacked = SparseMatrix.vstack([self.main.take_rows(rows[main_positions]),
+                                       self.delta.take_rows(rows[delta_positions] - n_main)])
+        # Stacked rows are main rows followed by delta rows, sorted rows are already in this order
+        order = np.concatenate([main_positions, delta_positions])
+        if np.array_equal(order, np.arange(len(rows))):
+            return stacked
+        return stacked.take_rows(np.argsort(order))
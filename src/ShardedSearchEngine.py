@@ -0,0 +1,240 @@
+"""
+Search engine which splits question corpus into partitions (shards). Every shard is QuestionsSearchEngine with
+its own vectors and inverted index, shards are scored in parallel and their top n results are merged.
+All shards share one vectorizer fitted on whole corpus, so IDF weights and scores are the same as in
+single QuestionsSearchEngine.
+"""
+import json
+import logging
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.CorpusReader import CorpusReader
+from src.Document import Document
+from src.DocumentStore import DocumentStore
+from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.TfIdfVectorizer import TfIdfVectorizer
+from src.TopNSelector import TopNSelector
+
+
+class ShardedSearchEngine:
+    SHARDS_FILE = 'shards.json'
+    SHARD_OF_FILE = 'shard_of.npy'
+    PARTITIONS = ('hash', 'tag')
+
+    def __init__(self, shards: list, shard_of: np.ndarray, partition='hash', workers=None):
+        """
+        Use ShardedSearchEngine.build, from_corpus or load for creating engine.
+        :param shards: List of QuestionsSearchEngine sharing one vectorizer.
+        :param shard_of: Shard of every question in corpus order.
+        :param partition: How questions were assigned to shards, one of PARTITIONS.
+        :param workers: Number of threads scoring shards, default is one thread per shard.
+        """
+        self._shards = shards
+        self._partition = partition
+        self._vectorizer = shards[0].vectorizer
+        self._set_shard_of(shard_of=shard_of)
+        # NumPy releases GIL while scoring, so shards are scored concurrently in threads
+        self._pool = ThreadPoolExecutor(max_workers=workers or len(shards))
+
+    def _set_shard_of(self, shard_of: np.ndarray):
+        """
+        Map corpus positions to (shard, row in shard). Questions keep corpus order inside shard, so tie breaking
+        by row in shard is the same as tie breaking by corpus position.
+        """
+        self._shard_of = shard_of
+        order = np.argsort(shard_of, kind='stable')
+        offsets = np.zeros(len(self._shards) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(shard_of, minlength=len(self._shards)), out=offsets[1:])
+        self._global_ids = [order[offsets[shard]:offsets[shard + 1]] for shard in range(len(self._shards))]
+        self._local_rows = np.empty(len(shard_of), dtype=np.int64)
+        self._local_rows[order] = np.arange(len(shard_of)) - offsets[shard_of[order]]
+
+    @staticmethod
+    def shard_of_document(document: Document, n_shards: int, partition='hash') -> int:
+        """
+        Shard of question, computed from CRC32 of question id or of its first tag, so assignment does not
+        depend on Python hash seed.
+        """
+        if partition == 'tag':
+            key = document.tags[0] if document.tags else ''
+        else:
+            key = document.doc_id
+        return zlib.crc32(str(key).encode('utf-8')) % n_shards
+
+    @classmethod
+    def build(cls, documents: list, n_shards: int, stop_words_path="", embedding_size=100, partition='hash',
+              workers=1, dtype='float32', threads=None):
+        """
+        Fit vectorizer on whole corpus and build one QuestionsSearchEngine per shard.
+        :param documents: List of Document objects.
+        :param n_shards: Number of partitions.
+        :param stop_words_path:
+        :param embedding_size:
+        :param partition: 'hash' assigns questions by id, 'tag' by first tag.
+        :param workers: Number of processes used for fitting and vectorizing corpus.
+        :param dtype: Precision of stored vectors.
+        :param threads: Number of threads scoring shards, default is one thread per shard.
+        :return: ShardedSearchEngine
+        """
+        vectorizer = TfIdfVectorizer(stop_words_path=stop_words_path, embedding_size=embedding_size)
+        vectorizer.fit(questions=[document.text for document in documents], workers=workers)
+        logging.log(logging.INFO, "Finished model fitting")
+        batch_size = QuestionsSearchEngine.STORE_BATCH_SIZE
+        batches = (documents[start:start + batch_size] for start in range(0, len(documents), batch_size))
+        return cls._build_shards(batches=batches, vectorizer=vectorizer, n_shards=n_shards, partition=partition,
+                                 workers=workers, dtype=dtype, threads=threads)
+
+    @classmethod
+    def from_corpus(cls, path, n_shards: int, stop_words_path="", embedding_size=100, partition='hash',
+                    workers=1, skip_malformed=True, dtype='float32', threads=None):
+        """
+        Same as build, but corpus file is streamed twice, first pass fits vectorizer and second one splits questions
+        into shards, see QuestionsSearchEngine.from_corpus.
+        """
+        reader = CorpusReader(path=path, skip_malformed=skip_malformed)
+        vectorizer = TfIdfVectorizer(stop_words_path=stop_words_path, embedding_size=embedding_size)
+        vectorizer.fit(questions=reader.questions(), workers=workers)
+        logging.log(logging.INFO, "Finished model fitting")
+        batches = reader.batches(batch_size=QuestionsSearchEngine.STORE_BATCH_SIZE)
+        return cls._build_shards(batches=batches, vectorizer=vectorizer, n_shards=n_shards, partition=partition,
+                                 workers=workers, dtype=dtype, threads=threads)
+
+    @classmethod
+    def _build_shards(cls, batches, vectorizer: TfIdfVectorizer, n_shards: int, partition: str, workers: int,
+                      dtype: str, threads: int):
+        """
+        :param batches: Iterable of lists of Document objects in corpus order, every batch is split into columnar
+            DocumentStore of every shard, so corpus is not kept as Document objects.
+        """
+        if partition not in cls.PARTITIONS:
+            raise ValueError("Partition should be one of %s." % (cls.PARTITIONS,))
+        shard_of = []
+        shard_stores = [[] for _ in range(n_shards)]
+        for batch in batches:
+            batch_shard_of = np.fromiter((cls.shard_of_document(document=document, n_shards=n_shards,
+                                                                partition=partition)
+                                          for document in batch), dtype=np.int32, count=len(batch))
+            shard_of.append(batch_shard_of)
+            for shard, stores in enumerate(shard_stores):
+                stores.append(DocumentStore(documents=[batch[index]
+                                                       for index in np.flatnonzero(batch_shard_of == shard)]))
+        shard_of = np.concatenate(shard_of) if shard_of else np.zeros(0, dtype=np.int32)
+
+        shards = []
+        for shard, stores in enumerate(shard_stores):
+            shard_documents = DocumentStore.concatenate(stores)
+            shards.append(QuestionsSearchEngine.from_vectorizer(documents=shard_documents, vectorizer=vectorizer,
+                                                                workers=workers, dtype=dtype))
+            logging.log(logging.INFO, "Finished shard %d with %d questions" % (shard, len(shard_documents)))
+        return cls(shards=shards, shard_of=shard_of, partition=partition, workers=threads)
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._shards)
+
+    def __len__(self):
+        return len(self._shard_of)
+
+    def build_ann_index(self, **ann_options):
+        """
+        Build IVF index of every shard, see QuestionsSearchEngine.build_ann_index.
+        """
+        for future in [self._pool.submit(shard.build_ann_index, **ann_options) for shard in self._shards]:
+            future.result()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def _merge(self, shard_results: list, n: int, min_score: float) -> (np.ndarray, np.ndarray):
+        """
+        Merge top n (doc_ids, scores) of every shard into global top n, doc ids are mapped to corpus positions.
+        """
+        doc_ids = np.concatenate([self._global_ids[shard][local_ids]
+                                  for shard, (local_ids, _) in enumerate(shard_results)])
+        scores = np.concatenate([scores for _, scores in shard_results])
+        return TopNSelector(n=n, min_score=min_score).select(scores=scores, doc_ids=doc_ids)
+
+    def _query_result(self, doc_ids: np.ndarray, scores: np.ndarray) -> list:
+        query_result = []
+        for index, score in zip(doc_ids, scores):
+            document = self._shards[self._shard_of[index]].get_document(self._local_rows[index])
+            query_result.append((np.float64(score).round(decimals=4), document.text))
+        return query_result
+
+    def most_similar(self, query: str, n: int = 5, prune: bool = False, min_score: float = None,
+                     rerank: int = None, tags=None, match: str = 'any', mode: str = 'exact',
+                     n_probe: int = None) -> list:
+        """
+        Return top n most similar questions from all shards, see QuestionsSearchEngine.most_similar.
+        """
+        query_vector = self._vectorizer.transform_sparse(questions=[query], progress_bar=False)
+        futures = [self._pool.submit(shard.search_vector, query_vector=query_vector, n=n, prune=prune,
+                                     min_score=min_score, rerank=rerank, tags=tags, match=match, mode=mode,
+                                     n_probe=n_probe)
+                   for shard in self._shards]
+        doc_ids, scores = self._merge(shard_results=[future.result() for future in futures], n=n,
+                                      min_score=min_score)
+        return self._query_result(doc_ids=doc_ids, scores=scores)
+
+    def most_similar_many(self, queries: list, n: int = 5, min_score: float = None, chunk_size: int = None,
+                          rerank: int = None, tags=None, match: str = 'any', mode: str = 'exact',
+                          n_probe: int = None) -> list:
+        """
+        Return top n most similar questions from all shards for every query,
+        see QuestionsSearchEngine.most_similar_many.
+        """
+        if not queries:
+            return []
+        query_vectors = self._vectorizer.transform_sparse(questions=queries, progress_bar=False)
+        futures = [self._pool.submit(shard.search_vectors, query_vectors=query_vectors, n=n, min_score=min_score,
+                                     chunk_size=chunk_size, rerank=rerank, tags=tags, match=match, mode=mode,
+                                     n_probe=n_probe)
+                   for shard in self._shards]
+        shard_results = [future.result() for future in futures]
+        results = []
+        for query_results in zip(*shard_results):
+            doc_ids, scores = self._merge(shard_results=query_results, n=n, min_score=min_score)
+            results.append(self._query_result(doc_ids=doc_ids, scores=scores))
+        return results
+
+    def save_stored_data(self, path):
+        """
+        Save every shard as index directory (see IndexStore) inside path, with question to shard assignment.
+        """
+        os.makedirs(path, exist_ok=True)
+        for shard, engine in enumerate(self._shards):
+            engine.save_stored_data(path=os.path.join(path, 'shard_%d' % shard))
+        np.save(os.path.join(path, ShardedSearchEngine.SHARD_OF_FILE), self._shard_of)
+        # Written last, directory without it is not complete sharded index
+        with open(os.path.join(path, ShardedSearchEngine.SHARDS_FILE), 'w', encoding='utf-8') as fw:
+            json.dump({'n_shards': len(self._shards), 'partition': self._partition}, fw)
+
+    @classmethod
+    def load(cls, path, verify=False, workers=None):
+        """
+        Load sharded index saved with save_stored_data, shard vectors and posting lists are memory mapped.
+        :param path: Path to sharded index directory.
+        :param verify: Check checksums of index files.
+        :param workers: Number of threads scoring shards.
+        :return: ShardedSearchEngine
+        """
+        shards_path = os.path.join(path, ShardedSearchEngine.SHARDS_FILE)
+        if not os.path.exists(shards_path):
+            raise FileNotFoundError("Given path to sharded index does not exist.")
+        with open(shards_path, 'r', encoding='utf-8') as fr:
+            info = json.load(fr)
+
+        shards = []
+        for shard in range(info['n_shards']):
+            engine = QuestionsSearchEngine(skip_process=True)
+            engine.load_stored_data(path=os.path.join(path, 'shard_%d' % shard), verify=verify)
+            if shards:
+                # Shards have the same vocabulary, keep only one copy of it
+                engine._vectorizer = shards[0].vectorizer
+            shards.append(engine)
+        shard_of = np.load(os.path.join(path, ShardedSearchEngine.SHARD_OF_FILE), mmap_mode='r')
+        return cls(shards=shards, shard_of=shard_of, partition=info['partition'], workers=workers)
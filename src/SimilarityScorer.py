@@ -1,36 +1,287 @@
 """
 Class that can measure similarity between vectors. It uses Cosine similarity.
+Scorer classes are pluggable alternatives of TF-IDF cosine similarity used by QuestionsSearchEngine.
 """
+from abc import ABC, abstractmethod
+
 import numpy as np
 
-# TODO: Fix problem with dividing by zero -> cos_similarity = prod / norms
-np.seterr(divide='ignore', invalid='ignore')
+from src.InvertedIndex import InvertedIndex
+from src.SegmentedMatrix import SegmentedMatrix
+from src.SparseMatrix import SparseMatrix
+from src.Tokenizer import Tokenizer
 
 
 class SimilarityScorer:
     def cosine_similarity(self,
-                          query_vectors: np.ndarray,
-                          corpus_vectors: np.ndarray) -> np.ndarray:
+                          query_vectors,
+                          corpus_vectors) -> np.ndarray:
         """Calculate cosine similarity between question vectors.
         query_vectors is matrix of word vectors dimensionality (e.g. 1000)
         N is the number of questions in the corpus.
         M is number of question for search
         Args:
-        query_vector: Vectorized question query of (M, D) shape.
-        corpus_vectors: Vectorized question corpus of (N, D) shape.
+        query_vector: Vectorized question query of (M, D) shape, dense or SparseMatrix.
+        corpus_vectors: Vectorized question corpus of (N, D) shape, dense or SparseMatrix.
         Returns:
         The vector of (1, N) shape with values in range [-1, 1] where
         1 is max similarity i.e. two vectors are the same.
         """
 
+        # Queries are small, so they are always scored as dense matrix
+        if isinstance(query_vectors, SparseMatrix):
+            query_vectors = query_vectors.toarray()
+
         query_vectors_norm = np.linalg.norm(query_vectors, axis=1)
-        corpus_vectors_norm = np.linalg.norm(corpus_vectors, axis=1)
+        if isinstance(corpus_vectors, SparseMatrix):
+            corpus_vectors_norm = corpus_vectors.row_norms()
+        else:
+            corpus_vectors_norm = np.linalg.norm(corpus_vectors, axis=1)
         b_corpus_vectors_norm = corpus_vectors_norm[:, np.newaxis]
         b_query_vectors_norm = query_vectors_norm[np.newaxis, :]
         prod = corpus_vectors.dot(query_vectors.T)
 
         norms = np.multiply(b_corpus_vectors_norm, b_query_vectors_norm)
-        # TODO: Fix dividing by zero problem
-        cos_similarity = prod / norms
-        cos_similarity = np.nan_to_num(cos_similarity)
+        # Zero vector has no direction, its similarity with any vector is 0
+        cos_similarity = np.divide(prod, norms, out=np.zeros(prod.shape), where=norms > 0)
         return cos_similarity
+
+    def normalized_cosine_similarity(self,
+                                     query_vectors,
+                                     corpus_vectors) -> np.ndarray:
+        """Calculate cosine similarity between L2 normalized question vectors.
+        Vector norms are already 1 (or 0 for empty vectors), so cosine similarity is a single dot product.
+        Args:
+        query_vector: Normalized question query of (M, D) shape, dense or SparseMatrix.
+        corpus_vectors: Normalized question corpus of (N, D) shape, dense or SparseMatrix.
+        Returns:
+        The matrix of (N, M) shape with values in range [-1, 1].
+        """
+        if isinstance(query_vectors, SparseMatrix):
+            query_vectors = query_vectors.toarray()
+        return corpus_vectors.dot(query_vectors.T)
+
+
+class Scorer(ABC):
+    """
+    Interface of corpus scorers. Scorer is fitted on corpus questions, queries are turned into query vectors
+    with the same features, and questions are scored with sum of products of query and question weights.
+    """
+    # Name under which scorer is saved with index
+    name = None
+
+    @abstractmethod
+    def fit(self, texts: list, tokenizer: Tokenizer, n_terms: int):
+        """
+        Compute question weights.
+        :param texts: Corpus questions.
+        :param tokenizer: Tokenizer of engine vectorizer, words are mapped to its vocabulary ids.
+        :param n_terms: Number of vocabulary ids.
+        """
+
+    @abstractmethod
+    def append(self, texts: list):
+        """
+        Add weights of appended questions without fitting scorer again.
+        :param texts: Questions which follow already scored questions.
+        """
+
+    @abstractmethod
+    def query_vectors(self, texts: list) -> SparseMatrix:
+        pass
+
+    @property
+    @abstractmethod
+    def inverted_index(self) -> InvertedIndex:
+        """
+        Posting lists of question weights, used for scoring single query.
+        """
+
+    @abstractmethod
+    def score(self, query_vectors: np.ndarray, corpus_ids: np.ndarray) -> np.ndarray:
+        """
+        Score questions against queries.
+        :param query_vectors: Dense query vectors of (M, D) shape.
+        :param corpus_ids: Sorted ids of scored questions.
+        :return: Scores of (len(corpus_ids), M) shape.
+        """
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        pass
+
+    @abstractmethod
+    def parameters(self) -> dict:
+        """
+        Parameters stored with index, together with name.
+        """
+
+    @abstractmethod
+    def to_arrays(self) -> dict:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def from_arrays(cls, arrays: dict, parameters: dict, tokenizer: Tokenizer):
+        pass
+
+
+class Bm25Scorer(Scorer):
+    """
+    Okapi BM25 ranking over vocabulary words and optional hashed word bigrams. Term frequencies and lengths
+    of questions are kept, BM25 weights are computed from them with current k1 and b. Appended questions are
+    weighted with IDF and average length of fitted questions, engine fits scorer again on compaction.
+    """
+    name = 'bm25'
+
+    def __init__(self, k1=1.2, b=0.75, bigram_buckets=0):
+        """
+        :param k1: Term frequency saturation.
+        :param b: Strength of question length normalization, 0 - none, 1 - full.
+        :param bigram_buckets: Number of hashing buckets of word bigrams, 0 scores only single words.
+        """
+        self.k1 = k1
+        self.b = b
+        self.bigram_buckets = bigram_buckets
+        self._tokenizer = None
+        self._n_terms = 0
+        self.term_frequencies = None
+        self.lengths = None
+
+    @property
+    def n_features(self) -> int:
+        return self._n_terms + self.bigram_buckets
+
+    def fit(self, texts: list, tokenizer: Tokenizer, n_terms: int):
+        self._tokenizer = tokenizer
+        self._n_terms = n_terms
+        term_frequencies, lengths = self._count_terms(texts=texts)
+        self._set_term_frequencies(term_frequencies=term_frequencies, lengths=lengths)
+
+    def append(self, texts: list):
+        term_frequencies, lengths = self._count_terms(texts=texts)
+        self.term_frequencies = self.term_frequencies.append(term_frequencies)
+        self.lengths = np.concatenate([self.lengths, lengths])
+        self._length_norms = np.concatenate([self._length_norms, self._length_norm(lengths=lengths)])
+        # Delta posting lists are built from all appended questions, posting lists of fitted questions are shared
+        delta = self.term_frequencies.delta
+        n_main = len(self.term_frequencies.main)
+        weights = self._weights(term_frequencies=delta, doc_ids=delta.row_ids() + n_main)
+        self._inverted_index = self._inverted_index.with_delta(delta=InvertedIndex(vectors=weights, normalize=False))
+
+    def _count_terms(self, texts: list) -> (SparseMatrix, np.ndarray):
+        """
+        Count features of every text, vocabulary words are followed by bigram buckets.
+        :return: (term_frequencies, lengths), counts of (N, n_features) shape and number of words of every text.
+        """
+        word_lists = [self._tokenizer.tokenize(text) for text in texts]
+        word_ids, lengths = self._tokenizer.encode_words(word_lists=word_lists)
+        rows = np.repeat(np.arange(len(word_lists)), lengths)
+        found = word_ids != Tokenizer.UNKNOWN_ID
+        rows, columns = rows[found], word_ids[found]
+        if self.bigram_buckets:
+            bigram_lengths = np.maximum(lengths - 1, 0)
+            bigrams = (first + ' ' + second for words in word_lists for first, second in zip(words, words[1:]))
+            bigram_ids = Tokenizer.buckets(words=bigrams, n_buckets=self.bigram_buckets,
+                                           count=int(bigram_lengths.sum()))
+            rows = np.concatenate([rows, np.repeat(np.arange(len(word_lists)), bigram_lengths)])
+            columns = np.concatenate([columns, bigram_ids + self._n_terms])
+
+        n_features = max(self.n_features, 1)
+        keys, counts = np.unique(rows * n_features + columns, return_counts=True)
+        rows = keys // n_features
+        indptr = np.zeros(len(word_lists) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(word_lists)), out=indptr[1:])
+        term_frequencies = SparseMatrix(data=counts.astype(np.float32), indices=keys % n_features, indptr=indptr,
+                                        shape=(len(word_lists), self.n_features))
+        return term_frequencies, lengths.astype(np.int32)
+
+    def _set_term_frequencies(self, term_frequencies: SparseMatrix, lengths: np.ndarray):
+        self.term_frequencies = SegmentedMatrix(main=term_frequencies)
+        self.lengths = lengths
+        n_docs = len(lengths)
+        document_frequency = np.bincount(term_frequencies.indices, minlength=self.n_features)
+        self._idf = np.log(1 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        self._average_length = float(lengths.mean()) if n_docs and lengths.any() else 1.
+        self._length_norms = self._length_norm(lengths=lengths)
+        self._inverted_index = InvertedIndex(vectors=self._weights(term_frequencies=term_frequencies,
+                                                                   doc_ids=term_frequencies.row_ids()),
+                                             normalize=False)
+
+    def _length_norm(self, lengths: np.ndarray) -> np.ndarray:
+        return (self.k1 * (1 - self.b + self.b * lengths / self._average_length)).astype(np.float32)
+
+    def _weights(self, term_frequencies: SparseMatrix, doc_ids: np.ndarray) -> SparseMatrix:
+        """
+        BM25 weights of term frequencies.
+        :param doc_ids: Question id of every stored value.
+        """
+        tf = term_frequencies.data
+        weights = self._idf[term_frequencies.indices] * tf * (self.k1 + 1) / (tf + self._length_norms[doc_ids])
+        return SparseMatrix(data=weights, indices=term_frequencies.indices, indptr=term_frequencies.indptr,
+                            shape=term_frequencies.shape)
+
+    def query_vectors(self, texts: list) -> SparseMatrix:
+        query_vectors, _ = self._count_terms(texts=texts)
+        return query_vectors
+
+    @property
+    def inverted_index(self) -> InvertedIndex:
+        return self._inverted_index
+
+    def score(self, query_vectors: np.ndarray, corpus_ids: np.ndarray) -> np.ndarray:
+        term_frequencies = self.term_frequencies.take_rows(corpus_ids)
+        weights = self._weights(term_frequencies=term_frequencies, doc_ids=corpus_ids[term_frequencies.row_ids()])
+        return weights.dot(query_vectors.T)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.term_frequencies.nbytes + self.lengths.nbytes + self._length_norms.nbytes + self._idf.nbytes
+                + self._inverted_index.nbytes)
+
+    def parameters(self) -> dict:
+        return {'k1': self.k1, 'b': self.b, 'bigram_buckets': self.bigram_buckets, 'n_terms': self._n_terms}
+
+    def to_arrays(self) -> dict:
+        term_frequencies = self.term_frequencies.merged()
+        arrays = {
+            'data': term_frequencies.data,
+            'indices': term_frequencies.indices,
+            'indptr': term_frequencies.indptr,
+            'lengths': self.lengths,
+            'length_norms': self._length_norms,
+            'idf': self._idf,
+            'average_length': np.array([self._average_length])
+        }
+        for name, array in self._inverted_index.to_arrays().items():
+            arrays['postings_' + name] = array
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, parameters: dict, tokenizer: Tokenizer):
+        """
+        Create fitted scorer from arrays returned by to_arrays, arrays are used without copying. Scorers saved
+        without posting lists compute BM25 weights again.
+        """
+        scorer = cls(k1=parameters['k1'], b=parameters['b'], bigram_buckets=parameters['bigram_buckets'])
+        scorer._tokenizer = tokenizer
+        scorer._n_terms = parameters['n_terms']
+        lengths = arrays['lengths']
+        term_frequencies = SparseMatrix(data=arrays['data'], indices=arrays['indices'], indptr=arrays['indptr'],
+                                        shape=(len(lengths), scorer.n_features))
+        if 'postings_docs' not in arrays:
+            scorer._set_term_frequencies(term_frequencies=term_frequencies, lengths=lengths)
+            return scorer
+        scorer.term_frequencies = SegmentedMatrix(main=term_frequencies)
+        scorer.lengths = lengths
+        scorer._idf = arrays['idf']
+        scorer._length_norms = arrays['length_norms']
+        scorer._average_length = float(arrays['average_length'][0])
+        postings = {name[len('postings_'):]: array for name, array in arrays.items() if name.startswith('postings_')}
+        scorer._inverted_index = InvertedIndex.from_arrays(arrays=postings, n_docs=len(lengths), normalize=False)
+        return scorer
+
+
+# Scorers which can be loaded with index, by name
+SCORERS = {Bm25Scorer.name: Bm25Scorer}
@@ -0,0 +1,234 @@
+"""
+Compressed sparse row (CSR) matrix backed by plain numpy arrays.
+Used for storing TF-IDF vectors, where almost every value in a row is zero.
+"""
+import numpy as np
+
+
+class SparseMatrix:
+    # Column indices are vocabulary word ids, int32 halves their memory compared to int64
+    INDEX_DTYPE = np.int32
+
+    def __init__(self, data, indices, indptr, shape, scales=None):
+        """
+        Create matrix from CSR arrays.
+        :param data: Non zero values of the matrix, row after row.
+        :param indices: Column index for every value in data.
+        :param indptr: Row boundaries, values of row i are data[indptr[i]:indptr[i + 1]].
+        :param shape: (N, D) shape of the matrix.
+        :param scales: Scale of every row for quantized matrix, value is data * scales[row].
+        """
+        self.data = np.asarray(data)
+        self.indices = np.asarray(indices, dtype=SparseMatrix.INDEX_DTYPE)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.scales = None if scales is None else np.asarray(scales)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indptr[-1])
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def quantized(self) -> bool:
+        return self.scales is not None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by arrays of the matrix.
+        """
+        arrays = [self.data, self.indices, self.indptr] + ([self.scales] if self.quantized else [])
+        return sum(array.nbytes for array in arrays)
+
+    @classmethod
+    def from_rows(cls, rows, n_cols, dtype=float):
+        """
+        Build matrix from sequence of rows.
+        :param rows: Sequence of (column_indices, values) pairs, one pair per row.
+        :param n_cols: Number of columns in matrix.
+        :param dtype: Type of stored values.
+        :return: SparseMatrix
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for row_indices, row_values in rows:
+            row_indices = np.asarray(row_indices, dtype=np.int64)
+            row_values = np.asarray(row_values, dtype=dtype)
+            order = np.argsort(row_indices, kind='stable')
+            indices.append(row_indices[order])
+            data.append(row_values[order])
+            indptr.append(indptr[-1] + len(row_indices))
+
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=SparseMatrix.INDEX_DTYPE)
+        data = np.concatenate(data).astype(dtype) if data else np.zeros(0, dtype=dtype)
+        return cls(data=data, indices=indices, indptr=indptr, shape=(len(indptr) - 1, n_cols))
+
+    @classmethod
+    def from_dense(cls, array: np.ndarray):
+        """
+        Convert dense (N, D) numpy array into sparse matrix.
+        """
+        array = np.atleast_2d(np.asarray(array))
+        rows, cols = np.nonzero(array)
+        indptr = np.zeros(array.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=array.shape[0]), out=indptr[1:])
+        return cls(data=array[rows, cols], indices=cols, indptr=indptr, shape=array.shape)
+
+    @staticmethod
+    def vstack(matrices):
+        """
+        Stack sparse matrices with same number of columns vertically.
+        """
+        matrices = list(matrices)
+        if not matrices:
+            raise ValueError("At least one matrix is needed for stacking.")
+        if len(set(matrix.quantized for matrix in matrices)) > 1:
+            raise ValueError("Quantized and not quantized matrices can not be stacked.")
+        n_cols = matrices[0].shape[1]
+        indptr = [np.zeros(1, dtype=np.int64)]
+        offset = 0
+        for matrix in matrices:
+            if matrix.shape[1] != n_cols:
+                raise ValueError("All matrices should have the same number of columns.")
+            indptr.append(matrix.indptr[1:] + offset)
+            offset += matrix.nnz
+        data = np.concatenate([matrix.data[:matrix.nnz] for matrix in matrices])
+        indices = np.concatenate([matrix.indices[:matrix.nnz] for matrix in matrices])
+        n_rows = sum(matrix.shape[0] for matrix in matrices)
+        scales = np.concatenate([matrix.scales for matrix in matrices]) if matrices[0].quantized else None
+        return SparseMatrix(data=data, indices=indices, indptr=np.concatenate(indptr), shape=(n_rows, n_cols),
+                            scales=scales)
+
+    @staticmethod
+    def hstack_positions(indptrs: list) -> (np.ndarray, list):
+        """
+        Positions of values of CSR matrices with the same number of rows in matrix stacked horizontally, row i
+        of stacked matrix has values of row i of every matrix in order. Used for merging posting lists.
+        :param indptrs: indptr array of every matrix.
+        :return: (indptr, positions), indptr of stacked matrix and positions of values of every matrix in it.
+        """
+        lengths = [np.diff(indptr) for indptr in indptrs]
+        indptr = np.zeros(len(lengths[0]) + 1, dtype=np.int64)
+        np.cumsum(np.sum(lengths, axis=0), out=indptr[1:])
+        row_starts = indptr[:-1].copy()
+        positions = []
+        for matrix_indptr, matrix_lengths in zip(indptrs, lengths):
+            positions.append(np.repeat(row_starts - matrix_indptr[:-1], matrix_lengths)
+                             + np.arange(matrix_indptr[0], matrix_indptr[-1]))
+            row_starts += matrix_lengths
+        return indptr, positions
+
+    def row_slice(self, start: int, stop: int):
+        """
+        Returns rows [start, stop) as new sparse matrix, value arrays are views into this matrix.
+        """
+        start = max(0, start)
+        stop = min(self.shape[0], stop)
+        begin, end = self.indptr[start], self.indptr[stop]
+        scales = self.scales[start:stop] if self.quantized else None
+        return SparseMatrix(data=self.data[begin:end], indices=self.indices[begin:end],
+                            indptr=self.indptr[start:stop + 1] - begin, shape=(stop - start, self.shape[1]),
+                            scales=scales)
+
+    def take_rows(self, rows: np.ndarray):
+        """
+        Returns copy of matrix with given rows, in given order.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        positions = np.repeat(self.indptr[rows] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        scales = self.scales[rows] if self.quantized else None
+        return SparseMatrix(data=self.data[positions], indices=self.indices[positions], indptr=indptr,
+                            shape=(len(rows), self.shape[1]), scales=scales)
+
+    def getrow(self, i: int):
+        return self.row_slice(i, i + 1)
+
+    def row_ids(self) -> np.ndarray:
+        """
+        Returns row index for every stored value.
+        """
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def values(self) -> np.ndarray:
+        """
+        Stored values as float array, quantized values are multiplied with row scales.
+        """
+        if self.quantized:
+            return self.data * self.scales[self.row_ids()]
+        return self.data
+
+    def row_norms(self) -> np.ndarray:
+        """
+        L2 norm of every row as (N,) array.
+        """
+        squares = np.square(self.values(), dtype=float)
+        return np.sqrt(np.bincount(self.row_ids(), weights=squares, minlength=self.shape[0]))
+
+    def normalized(self):
+        """
+        Returns float64 copy of matrix with every row divided by its L2 norm. Rows with zero norm stay zero.
+        """
+        norms = self.row_norms()[self.row_ids()]
+        data = np.divide(self.values(), norms, out=np.zeros(self.nnz), where=norms > 0)
+        return SparseMatrix(data=data, indices=self.indices.copy(), indptr=self.indptr.copy(), shape=self.shape)
+
+    def astype(self, dtype):
+        """
+        Returns copy of matrix with values stored as dtype. For int8 every row is scalar quantized, values are
+        divided by row scale (max absolute row value / 127) and rounded.
+        """
+        dtype = np.dtype(dtype)
+        values = self.values()
+        scales = None
+        if dtype == np.int8:
+            max_values = np.zeros(self.shape[0])
+            non_empty = np.flatnonzero(np.diff(self.indptr))
+            if len(non_empty):
+                max_values[non_empty] = np.maximum.reduceat(np.abs(values), self.indptr[non_empty])
+            scales = (max_values / 127).astype(np.float32)
+            row_scales = scales[self.row_ids()]
+            data = np.divide(values, row_scales, out=np.zeros(self.nnz), where=row_scales > 0)
+            data = np.rint(data).astype(np.int8)
+        else:
+            data = values.astype(dtype)
+        return SparseMatrix(data=data, indices=self.indices, indptr=self.indptr, shape=self.shape, scales=scales)
+
+    def toarray(self) -> np.ndarray:
+        dense = np.zeros(self.shape, dtype=float if self.quantized else self.dtype)
+        dense[self.row_ids(), self.indices] = self.values()
+        return dense
+
+    def dot(self, other: np.ndarray) -> np.ndarray:
+        """
+        Matrix product with dense matrix.
+        :param other: Dense matrix of (D, M) shape.
+        :return: Dense matrix of (N, M) shape.
+        """
+        other = np.asarray(other)
+        vector_input = other.ndim == 1
+        if vector_input:
+            other = other[:, np.newaxis]
+        if other.shape[0] != self.shape[1]:
+            raise ValueError("Matrix shapes %s and %s are not aligned." % (self.shape, other.shape))
+
+        # Product is computed in stored precision, quantized rows are scaled after summing
+        result_type = np.result_type(self.dtype, other.dtype)
+        result = np.zeros((self.shape[0], other.shape[1]), dtype=result_type)
+        if self.nnz:
+            contributions = self.data[:, np.newaxis] * other[self.indices]
+            non_empty = np.flatnonzero(np.diff(self.indptr))
+            result[non_empty] = np.add.reduceat(contributions, self.indptr[non_empty], axis=0)
+        if self.quantized:
+            result *= self.scales[:, np.newaxis].astype(result_type)
+        return result[:, 0] if vector_input else result
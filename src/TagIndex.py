@@ -0,0 +1,181 @@
+"""
+Index of question tags. For every tag it keeps sorted array of ids of documents which have the tag,
+so searches scoped to tags score only matching documents. Documents added after the index was built are kept
+in smaller delta index, see with_delta.
+"""
+import numpy as np
+
+from src.SparseMatrix import SparseMatrix
+
+
+class TagIndex:
+    MATCH_MODES = ('any', 'all')
+
+    def __init__(self, documents: list):
+        """
+        Build sorted document id array for every tag.
+        :param documents: List of Document objects, document id is position in list.
+        """
+        tag_ids = {}
+        doc_ids = []
+        doc_tag_ids = []
+        for doc_id, document in enumerate(documents):
+            for tag in dict.fromkeys(TagIndex.document_tags(document.tags)):
+                doc_tag_ids.append(tag_ids.setdefault(tag, len(tag_ids)))
+                doc_ids.append(doc_id)
+
+        self.tags = list(tag_ids)
+        self._tag_ids = tag_ids
+        self._delta = None
+        self._delta_offset = 0
+        self._set_documents(doc_ids=np.asarray(doc_ids, dtype=np.int64),
+                            doc_tag_ids=np.asarray(doc_tag_ids, dtype=np.int64))
+
+    @classmethod
+    def from_document_tag_ids(cls, tags: list, tag_ids: np.ndarray, indptr: np.ndarray):
+        """
+        Build index from tag ids of every document, see DocumentStore.
+        :param tags: Tag names, tag id is position in list.
+        :param tag_ids: Unique tag ids of document i are tag_ids[indptr[i]:indptr[i + 1]].
+        :param indptr: Offsets of documents in tag_ids.
+        """
+        index = cls.from_arrays(arrays={}, tags=tags)
+        index._set_documents(doc_ids=np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr)),
+                             doc_tag_ids=np.asarray(tag_ids, dtype=np.int64))
+        return index
+
+    def _set_documents(self, doc_ids: np.ndarray, doc_tag_ids: np.ndarray):
+        # Stable sort keeps document ids sorted inside every tag
+        order = np.argsort(doc_tag_ids, kind='stable')
+        self._docs = doc_ids[order]
+        self._indptr = np.zeros(len(self.tags) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(doc_tag_ids, minlength=len(self.tags)), out=self._indptr[1:])
+
+    @staticmethod
+    def document_tags(tags) -> list:
+        """
+        Corpus keeps tags as list, missing tags are empty string.
+        """
+        if isinstance(tags, str):
+            return [tags] if tags else []
+        return list(tags or [])
+
+    def to_arrays(self) -> dict:
+        """
+        Arrays which describe the index, tag names (merged with tags of delta index) are stored separately.
+        """
+        index = self.merged()
+        return {'docs': index._docs, 'indptr': index._indptr}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, tags: list):
+        """
+        Create index from arrays returned by to_arrays and tag names, arrays are used without copying.
+        """
+        index = cls.__new__(cls)
+        index.tags = list(tags)
+        index._tag_ids = {tag: tag_id for tag_id, tag in enumerate(index.tags)}
+        index._docs = arrays.get('docs')
+        index._indptr = arrays.get('indptr')
+        index._delta = None
+        index._delta_offset = 0
+        return index
+
+    def with_delta(self, delta, offset: int):
+        """
+        Returns index over documents of this index followed by documents of delta index, document arrays of this
+        index are shared.
+        :param delta: TagIndex of appended documents, replaces delta index of this index.
+        :param offset: Number of documents before appended documents.
+        """
+        index = TagIndex.from_arrays(arrays={'docs': self._docs, 'indptr': self._indptr}, tags=self._main_tags)
+        index.tags.extend(tag for tag in delta.tags if tag not in self._tag_ids)
+        index._delta = delta
+        index._delta_offset = offset
+        return index
+
+    @property
+    def _main_tags(self) -> list:
+        return self.tags[:len(self._indptr) - 1]
+
+    def merged(self):
+        """
+        Returns index without delta index, documents of delta index are appended to documents of every tag.
+        """
+        if self._delta is None:
+            return self
+        # Delta lists are reordered to tag order of merged index, tags missing in one index have empty lists
+        tag_ids = {tag: tag_id for tag_id, tag in enumerate(self.tags)}
+        delta_tag_ids = np.array([tag_ids[tag] for tag in self._delta.tags], dtype=np.int64)
+        delta_lengths = np.zeros(len(self.tags), dtype=np.int64)
+        delta_lengths[delta_tag_ids] = np.diff(self._delta._indptr)
+        order = np.argsort(np.repeat(delta_tag_ids, np.diff(self._delta._indptr)), kind='stable')
+        main_lengths = np.zeros(len(self.tags), dtype=np.int64)
+        main_lengths[:len(self._indptr) - 1] = np.diff(self._indptr)
+
+        indptrs = [np.concatenate([[0], np.cumsum(lengths)]) for lengths in (main_lengths, delta_lengths)]
+        indptr, (main_positions, delta_positions) = SparseMatrix.hstack_positions(indptrs)
+        docs = np.zeros(indptr[-1], dtype=np.int64)
+        docs[main_positions] = self._docs
+        docs[delta_positions] = self._delta._docs[order] + self._delta_offset
+        return TagIndex.from_arrays(arrays={'docs': docs, 'indptr': indptr}, tags=self.tags)
+
+    def documents(self, tag: str) -> np.ndarray:
+        """
+        Returns sorted ids of documents with given tag.
+        """
+        tag_id = self._tag_ids.get(tag)
+        docs = np.zeros(0, dtype=np.int64)
+        if tag_id is not None:
+            docs = self._docs[self._indptr[tag_id]:self._indptr[tag_id + 1]]
+        if self._delta is not None:
+            docs = np.concatenate([docs, self._delta.documents(tag) + self._delta_offset])
+        return docs
+
+    def matching(self, tags, match='any') -> np.ndarray:
+        """
+        Returns sorted ids of documents which have any or all of given tags.
+        :param tags: Tag or list of tags.
+        :param match: 'any' - document has at least one of tags, 'all' - document has every tag.
+        """
+        if match not in TagIndex.MATCH_MODES:
+            raise ValueError("Match should be one of %s." % (TagIndex.MATCH_MODES,))
+        tag_documents = [self.documents(tag) for tag in dict.fromkeys(TagIndex.document_tags(tags))]
+        if not tag_documents:
+            return np.zeros(0, dtype=np.int64)
+        if match == 'any':
+            return np.unique(np.concatenate(tag_documents))
+
+        # Intersection starts from the rarest tag, so intermediate results stay small
+        tag_documents.sort(key=len)
+        doc_ids = tag_documents[0]
+        for documents in tag_documents[1:]:
+            doc_ids = np.intersect1d(doc_ids, documents, assume_unique=True)
+        return np.asarray(doc_ids, dtype=np.int64)
+
+    def mask(self, tags, n_docs: int, match='any') -> np.ndarray:
+        """
+        Returns boolean mask of documents which have any or all of given tags, see matching. Mask is built
+        without sorting document ids of tags.
+        :param n_docs: Number of documents, length of mask.
+        """
+        if match not in TagIndex.MATCH_MODES:
+            raise ValueError("Match should be one of %s." % (TagIndex.MATCH_MODES,))
+        tag_documents = [self.documents(tag) for tag in dict.fromkeys(TagIndex.document_tags(tags))]
+        mask = np.zeros(n_docs, dtype=bool)
+        if not tag_documents:
+            return mask
+        if match == 'any':
+            for documents in tag_documents:
+                mask[documents] = True
+            return mask
+
+        # Documents of the rarest tag are checked in masks of other tags
+        tag_documents.sort(key=len)
+        doc_ids = tag_documents[0]
+        for documents in tag_documents[1:]:
+            tag_mask = np.zeros(n_docs, dtype=bool)
+            tag_mask[documents] = True
+            doc_ids = doc_ids[tag_mask[doc_ids]]
+        mask[doc_ids] = True
+        return mask
@@ -2,16 +2,40 @@
 Implementation of Sentence embedding based on bags-of-words and TfIdf algorithm.
 
 """
+import heapq
 import json
 import os
-import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
-from tqdm import tqdm
+
+from src.CorpusReader import CorpusReader
+from src.Metrics import metrics
+from src.SparseMatrix import SparseMatrix
+from src.Tokenizer import Tokenizer
 
 
 class TfIdfVectorizer:
-    def __init__(self, stop_words_path="", embedding_size=1000, progress_bar=True):
+    TRANSFORM_BATCH_SIZE = 10000
+
+    def __init__(self, stop_words_path="", embedding_size=1000, progress_bar=True, min_df=1, max_df=1.0,
+                 n_features=None):
+        """
+        :param stop_words_path: Path to json list of words which are left out of vocabulary.
+        :param embedding_size: Number of most frequent words used as vector dimensions,
+                               None keeps the whole corpus vocabulary.
+        :param progress_bar: Show tqdm progress bar while processing corpus.
+        :param min_df: Words which appear in fewer questions are left out of vocabulary. Integer is number of
+                       questions, float is fraction of corpus questions.
+        :param max_df: Words which appear in more questions are left out of vocabulary, integer or fraction.
+        :param n_features: Number of hashing buckets. When given, words are hashed into buckets used as vector
+                           dimensions and no vocabulary is kept, embedding_size, min_df and max_df are not used.
+        """
         self.progress_bar = progress_bar
+        self.min_df = min_df
+        self.max_df = max_df
+        self._n_features = n_features
 
         # Full processed dictionary of all words in corpus
         self._word_count_dict = {}
@@ -24,10 +48,22 @@ class TfIdfVectorizer:
         self._bag_word_vocabulary = {}
         self._embedding_size = embedding_size
 
+        # Lookup structures derived from vocabulary, used for bulk transform
+        # word -> word_index, and IDF weight for every word_index
+        self._word_indices = {}
+        self._idf = np.zeros(0)
+        # Vocabulary size IDF weights were computed with, update_word_counts changes only total corpus size
+        self._idf_corpus_size = -1
+
+        # Hashing mode: in how many questions words of every bucket appear, and changes of counts made
+        # by update_word_counts after fitting
+        self._bucket_counts = np.zeros(0, dtype=np.int64)
+        self._bucket_count_updates = np.zeros(0, dtype=np.int64)
+
+        self._stop_words = []
+        self._tokenizer = Tokenizer(n_buckets=n_features)
         if stop_words_path:
             self.load_stop_words(path=stop_words_path)
-        else:
-            self._stop_words = []
 
     def load_stop_words(self, path):
         if not os.path.exists(path):
@@ -35,51 +71,194 @@ class TfIdfVectorizer:
 
         with open(path, 'r') as fr:
             stop_words = json.load(fr)
-        self._stop_words = stop_words
+        self.set_stop_words(stop_words=stop_words)
+
+    def set_stop_words(self, stop_words):
+        """
+        Stop words are dropped by tokenizer, so they are not part of vocabulary or question length.
+        """
+        self._stop_words = list(stop_words)
+        self._tokenizer = Tokenizer(stop_words=self._stop_words, word_ids=self._word_indices,
+                                    n_buckets=self.n_features)
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        return self._tokenizer
+
+    @property
+    def n_features(self) -> int:
+        """
+        Number of hashing buckets, None when vectorizer uses vocabulary.
+        """
+        # Vectorizer pickled before hashing mode was added
+        return getattr(self, '_n_features', None)
+
+    @property
+    def fitted(self) -> bool:
+        if self.n_features:
+            return len(self._bucket_counts) > 0
+        return bool(self._bag_word_vocabulary)
 
     @staticmethod
     def load_questions(path):
-        fr = open(path, 'r')
-        documents = []
-        for row in fr.readlines():
-            row = row.replace('\n', '')
-            sentence_json = json.loads(row)
-            documents.append(sentence_json['question'])
-        fr.close()
-        return documents
-
-    def set_and_sort_word_dict(self, word_count_dict: dict):
-        """
-        Sorts given dictionary and set internal word count dictionary
+        return list(CorpusReader(path=path).questions())
+
+    def set_and_sort_word_dict(self, word_count_dict: dict, n_documents: int = None):
+        """
+        Set internal word count dictionary and select vocabulary from it
         :param word_count_dict: Processed dictionary with every word appearance count
+        :param n_documents: Number of counted questions, needed when min_df or max_df is a fraction.
         """
         # If stop word list is loaded, clear stop words
-        for stop_word in self._stop_words:
-            if stop_word in word_count_dict:
-                word_count_dict.pop(stop_word)
+        for stop_word in self._tokenizer.stop_words & word_count_dict.keys():
+            word_count_dict.pop(stop_word)
 
-        # Sort dictionary by appearance count
-        sorted_word_count_dict = {}
-        for word in sorted(word_count_dict, key=word_count_dict.get, reverse=True):
-            sorted_word_count_dict[word] = word_count_dict[word]
+        min_count, max_count = self._document_frequency_bounds(n_documents=n_documents)
+        if min_count > 1 or max_count is not None:
+            word_count_dict = {word: app_count for word, app_count in word_count_dict.items()
+                               if app_count >= min_count and (max_count is None or app_count <= max_count)}
 
-        self._word_count_dict = sorted_word_count_dict
-        self._total_corpus_size = len(sorted_word_count_dict)
+        self._word_count_dict = word_count_dict
+        self._total_corpus_size = len(word_count_dict)
         self._bag_word_vocabulary = self.get_first_n_words(n=self._embedding_size)
+        self._build_lookup()
+
+    def _document_frequency_bounds(self, n_documents: int = None) -> (int, int):
+        """
+        Converts min_df and max_df into numbers of questions, max_count is None when there is no upper bound.
+        """
+        min_df, max_df = getattr(self, 'min_df', 1), getattr(self, 'max_df', 1.0)
+        if (isinstance(min_df, float) or isinstance(max_df, float) and max_df < 1.0) and n_documents is None:
+            raise ValueError("Number of documents is needed for min_df and max_df fractions.")
+        min_count = int(np.ceil(min_df * n_documents)) if isinstance(min_df, float) else min_df
+        if isinstance(max_df, float):
+            max_count = None if max_df >= 1.0 else int(np.floor(max_df * n_documents))
+        else:
+            max_count = max_df
+        return min_count, max_count
+
+    def _build_lookup(self):
+        """
+        Precompute word indices and IDF weights of vocabulary words.
+        """
+        if self.n_features:
+            self._build_bucket_lookup()
+            return
+        self._word_indices = {word: word_index for word, (word_index, _) in self._bag_word_vocabulary.items()}
+        self._tokenizer.set_vocabulary(word_ids=self._word_indices)
+        appearance_counts = np.zeros(len(self._bag_word_vocabulary))
+        for word_index, app_count in self._bag_word_vocabulary.values():
+            appearance_counts[word_index] = app_count
+        self._idf = np.log(self._total_corpus_size / (appearance_counts + 1)) + 1
+        self._idf_corpus_size = self._total_corpus_size
+
+    def _build_bucket_lookup(self):
+        # Number of used buckets takes place of vocabulary size, without collisions weights are the same as with
+        # vocabulary of all words
+        self._bucket_count_updates = np.zeros(len(self._bucket_counts), dtype=np.int64)
+        self._total_corpus_size = int(np.count_nonzero(self._bucket_counts))
+        self._idf = np.log(max(self._total_corpus_size, 1) / (self._bucket_counts + 1)) + 1
+        self._idf_corpus_size = self._total_corpus_size
+
+    def _ensure_lookup(self):
+        # Vectorizer pickled before lookup structures were added
+        if not hasattr(self, '_tokenizer'):
+            self._word_indices = {}
+            self.set_stop_words(stop_words=self._stop_words)
+        if self.n_features:
+            return
+        if len(getattr(self, '_idf', ())) != len(self._bag_word_vocabulary):
+            self._build_lookup()
+
+    def clone(self):
+        """
+        Returns new not fitted vectorizer with the same parameters.
+        """
+        vectorizer = TfIdfVectorizer(embedding_size=self._embedding_size, progress_bar=self.progress_bar,
+                                     min_df=getattr(self, 'min_df', 1), max_df=getattr(self, 'max_df', 1.0),
+                                     n_features=self.n_features)
+        vectorizer.set_stop_words(stop_words=self._stop_words)
+        return vectorizer
 
     def get_first_n_words(self, n: int) -> dict:
         """
-        Returns most frequent words N words as dictionary
-        :param n: Number of words
+        Returns most frequent words N words as dictionary. Words with the same count keep order of word count
+        dictionary. N words are selected with heap, so whole vocabulary is not sorted.
+        :param n: Number of words, None returns all words
         :return: dictionary - (word_index, appearance_count)
         """
-        firs_n_words_dict = {}
-        for word_index, (key, app_count) in enumerate(self._word_count_dict.items()):
-            if word_index >= n:
-                break
-            # TODO: Change this structure it is not really readable
-            firs_n_words_dict[key] = (word_index, app_count)
-        return firs_n_words_dict
+        word_counts = self._word_count_dict.items()
+        if n is None:
+            top_words = sorted(word_counts, key=lambda item: item[1], reverse=True)
+        else:
+            top_words = heapq.nlargest(n, word_counts, key=lambda item: item[1])
+        # TODO: Change this structure it is not really readable
+        return {key: (word_index, app_count) for word_index, (key, app_count) in enumerate(top_words)}
+
+    def export_vocabulary(self) -> (list, np.ndarray, dict):
+        """
+        Vocabulary of fitted vectorizer, used for storing vectorizer without pickling.
+        :return: (words, appearance_counts, parameters), vocabulary words and their counts are in word index
+                 order, vocabulary words are followed by other words of word count dictionary, see
+                 document_frequencies. In hashing mode words are empty and counts are bucket counts.
+        """
+        if self.n_features:
+            words, appearance_counts = [], np.asarray(self._bucket_counts, dtype=np.int64)
+        else:
+            words = [word for word, _ in sorted(self._bag_word_vocabulary.items(), key=lambda item: item[1][0])]
+            appearance_counts = np.array([self._bag_word_vocabulary[word][1] for word in words], dtype=np.int64)
+            words.extend(word for word in self._word_count_dict if word not in self._bag_word_vocabulary)
+        parameters = {
+            'embedding_size': self._embedding_size,
+            'total_corpus_size': getattr(self, '_idf_corpus_size', self._total_corpus_size),
+            'stop_words': list(self._stop_words),
+            'min_df': getattr(self, 'min_df', 1),
+            'max_df': getattr(self, 'max_df', 1.0),
+            'n_features': self.n_features
+        }
+        return words, appearance_counts, parameters
+
+    def document_frequencies(self, words: list) -> np.ndarray:
+        """
+        Current document frequencies of exported words, they include changes made by update_word_counts.
+        :param words: Words returned by export_vocabulary.
+        :return: Appearance count of every word, in hashing mode count of every bucket.
+        """
+        if self.n_features:
+            return np.asarray(self._bucket_counts + self._bucket_count_updates, dtype=np.int64)
+        return np.array([self._word_count_dict.get(word, 0) for word in words], dtype=np.int64)
+
+    @classmethod
+    def from_vocabulary(cls, words, appearance_counts, embedding_size, total_corpus_size, stop_words=None,
+                        min_df=1, max_df=1.0, n_features=None, document_frequencies=None):
+        """
+        Create fitted vectorizer from exported vocabulary.
+        :param document_frequencies: Result of document_frequencies for exported words. Without it word count
+                                     dictionary is replaced with vocabulary words and their counts.
+        """
+        vectorizer = cls(embedding_size=embedding_size, progress_bar=False, min_df=min_df, max_df=max_df,
+                         n_features=n_features)
+        vectorizer.set_stop_words(stop_words=stop_words or [])
+        if n_features:
+            vectorizer._bucket_counts = np.array(appearance_counts, dtype=np.int64)
+            vectorizer._build_lookup()
+            if document_frequencies is not None:
+                vectorizer._bucket_count_updates = np.asarray(document_frequencies, dtype=np.int64) \
+                                                   - vectorizer._bucket_counts
+            return vectorizer
+        vectorizer._bag_word_vocabulary = {word: (word_index, int(app_count)) for word_index, (word, app_count)
+                                           in enumerate(zip(words, appearance_counts))}
+        vectorizer._total_corpus_size = total_corpus_size
+        vectorizer._build_lookup()
+        if document_frequencies is None:
+            vectorizer._word_count_dict = {word: app_count for word, (_, app_count)
+                                           in vectorizer._bag_word_vocabulary.items()}
+        else:
+            vectorizer._word_count_dict = {word: int(app_count) for word, app_count
+                                           in zip(words, document_frequencies) if app_count > 0}
+            # Every word of word count dictionary is counted in total corpus size
+            vectorizer._total_corpus_size = len(vectorizer._word_count_dict)
+        return vectorizer
 
     @staticmethod
     def trim_string(tmp_string: str) -> str:
@@ -88,22 +267,192 @@ class TfIdfVectorizer:
         :param tmp_string: Any string
         :return: Trimmed string
         """
-        tmp_string = tmp_string.lower()
-        # Clear all non word characters
-        trimmed_string = re.sub(r'[\d\W]+', ' ', tmp_string)
-        return trimmed_string
+        return Tokenizer.trim(tmp_string)
+
+    @property
+    def embedding_size(self) -> int:
+        """
+        Dimensionality of produced vectors.
+        """
+        if self.n_features:
+            return self.n_features
+        if self._embedding_size is None:
+            return len(self._bag_word_vocabulary)
+        return self._embedding_size
+
+    @staticmethod
+    def iterate_batches(items, batch_size: int):
+        """
+        Yields consecutive lists of at most batch_size items, works with generators.
+        """
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def ordered_map(executor, function, items, max_pending: int):
+        """
+        Map function over items with executor. Unlike executor.map it submits at most max_pending items at once,
+        so items can come from a stream which does not fit into memory. Results are yielded in items order.
+        """
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    @staticmethod
+    def count_words(questions, tokenizer: Tokenizer = None, progress_bar=False) -> Counter:
+        """
+        Count in how many questions every word appears.
+        :return: Counter with words in order of first appearance.
+        """
+        tokenizer = tokenizer or Tokenizer()
+        word_count_dict = Counter()
+        total = len(questions) if hasattr(questions, '__len__') else None
+        with _progress_bar(enabled=progress_bar, desc="Fitting vectorizer model", total=total) as progress:
+            for doc in questions:
+                # Unique words in order of first appearance, so order of words with same count does not depend
+                # on hashing
+                word_count_dict.update(dict.fromkeys(tokenizer.tokenize(doc)).keys())
+                progress.update(1)
+        return word_count_dict
 
-    def fit(self, questions):
+    @staticmethod
+    def count_buckets(questions, tokenizer: Tokenizer) -> np.ndarray:
+        """
+        Count in how many questions words of every hashing bucket appear.
+        :param questions: List of questions.
+        :param tokenizer: Tokenizer with n_buckets.
+        """
+        buckets, lengths = tokenizer.encode_many(texts=questions)
+        n_buckets = tokenizer.n_buckets
+        # Every (question, bucket) pair is counted once
+        keys = np.unique(np.repeat(np.arange(len(lengths)), lengths) * n_buckets + buckets)
+        return np.bincount(keys % n_buckets, minlength=n_buckets)
+
+    def fit(self, questions, workers=1):
         """Fit vectorizer with the sequence of documents (questions), after this vectorizer can be used for transforming
         sentences into vectors.
+        :param questions: The sequence or stream of raw corpus questions.
+        :param workers: Number of processes, every process counts words of its own batches. Batch counts are
+                        merged in batch order, so result is the same as with one process.
+        """
+        if self.n_features:
+            self._fit_buckets(questions=questions, workers=workers)
+            return
+
+        if hasattr(questions, '__len__'):
+            n_documents = [len(questions)]
+        else:
+            n_documents = [0]
+            questions = _counted(items=questions, count=n_documents)
+
+        if workers > 1:
+            word_count_dict = Counter()
+            batches = TfIdfVectorizer.iterate_batches(items=questions, batch_size=TfIdfVectorizer.TRANSFORM_BATCH_SIZE)
+            with ProcessPoolExecutor(max_workers=workers) as executor, \
+                    _progress_bar(enabled=self.progress_bar, desc="Fitting vectorizer model", unit='batch') as progress:
+                count_words = partial(TfIdfVectorizer.count_words, tokenizer=self._tokenizer)
+                for batch_count in TfIdfVectorizer.ordered_map(executor=executor, function=count_words,
+                                                               items=batches, max_pending=2 * workers):
+                    word_count_dict.update(batch_count)
+                    progress.update(1)
+        else:
+            word_count_dict = TfIdfVectorizer.count_words(questions=questions, tokenizer=self._tokenizer,
+                                                          progress_bar=self.progress_bar)
+        self.set_and_sort_word_dict(word_count_dict=dict(word_count_dict), n_documents=n_documents[0])
+
+    def _fit_buckets(self, questions, workers=1):
+        """
+        Fit hashing vectorizer in one streaming pass, only bucket counts are kept in memory.
         """
-        word_count_dict = {}
-        for doc in tqdm(questions, desc="Fitting vectorizer model", disable= not self.progress_bar):
-            cl_doc = TfIdfVectorizer.trim_string(doc)
-            words = list(set(cl_doc.split()))
-            for word in words:
-                word_count_dict[word] = word_count_dict.get(word, 0) + 1
-        self.set_and_sort_word_dict(word_count_dict=word_count_dict)
+        bucket_counts = np.zeros(self.n_features, dtype=np.int64)
+        batches = TfIdfVectorizer.iterate_batches(items=questions, batch_size=TfIdfVectorizer.TRANSFORM_BATCH_SIZE)
+        count_buckets = partial(TfIdfVectorizer.count_buckets, tokenizer=self._tokenizer)
+        with _progress_bar(enabled=self.progress_bar, desc="Fitting vectorizer model", unit='batch') as progress:
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for batch_counts in TfIdfVectorizer.ordered_map(executor=executor, function=count_buckets,
+                                                                    items=batches, max_pending=2 * workers):
+                        bucket_counts += batch_counts
+                        progress.update(1)
+            else:
+                for batch in batches:
+                    bucket_counts += count_buckets(batch)
+                    progress.update(1)
+        self._bucket_counts = bucket_counts
+        self._build_lookup()
+
+    @classmethod
+    def merge(cls, vectorizers: list):
+        """
+        Merge hashing vectorizers fitted on different parts of corpus, for example on shards. Result is the same
+        as vectorizer fitted on the whole corpus.
+        :param vectorizers: Fitted vectorizers with the same n_features and stop words.
+        :return: TfIdfVectorizer
+        """
+        first = vectorizers[0]
+        if not first.n_features:
+            raise ValueError("Only vectorizers with n_features can be merged.")
+        for vectorizer in vectorizers[1:]:
+            if vectorizer.n_features != first.n_features or set(vectorizer._stop_words) != set(first._stop_words):
+                raise ValueError("Merged vectorizers should have the same n_features and stop words.")
+        merged = first.clone()
+        merged._bucket_counts = np.sum([vectorizer._bucket_counts for vectorizer in vectorizers], axis=0)
+        merged._build_lookup()
+        return merged
+
+    def update_word_counts(self, questions, removed=False):
+        """
+        Update document frequency statistics with added or removed questions. Vocabulary and IDF weights used
+        for vectorizing stay the same until vectorizer is fitted again, use idf_drift to measure the difference.
+        :param questions: The sequence of raw questions.
+        :param removed: Questions are removed from corpus.
+        """
+        if self.n_features:
+            bucket_counts = TfIdfVectorizer.count_buckets(questions=list(questions), tokenizer=self._tokenizer)
+            if removed:
+                bucket_counts = -bucket_counts
+            self._bucket_count_updates = self._bucket_count_updates + bucket_counts
+            return
+        for word, count in TfIdfVectorizer.count_words(questions=questions, tokenizer=self._tokenizer).items():
+            if removed:
+                app_count = self._word_count_dict.get(word, 0) - count
+                if app_count > 0:
+                    self._word_count_dict[word] = app_count
+                elif word in self._word_count_dict:
+                    self._word_count_dict.pop(word)
+                    self._total_corpus_size -= 1
+            else:
+                if word not in self._word_count_dict:
+                    self._total_corpus_size += 1
+                self._word_count_dict[word] = self._word_count_dict.get(word, 0) + count
+
+    def idf_drift(self) -> float:
+        """
+        Relative L1 difference between IDF weights used for vectorizing and IDF weights computed from
+        current document frequency statistics.
+        """
+        self._ensure_lookup()
+        if not len(self._idf):
+            return 0.
+        if self.n_features:
+            bucket_counts = self._bucket_counts + self._bucket_count_updates
+            current_idf = np.log(max(np.count_nonzero(bucket_counts), 1) / (bucket_counts + 1)) + 1
+            return float(np.abs(current_idf - self._idf).sum() / max(np.abs(self._idf).sum(), 1e-12))
+        appearance_counts = np.zeros(len(self._idf))
+        for word, word_index in self._word_indices.items():
+            appearance_counts[word_index] = self._word_count_dict.get(word, 0)
+        current_idf = np.log(max(self._total_corpus_size, 1) / (appearance_counts + 1)) + 1
+        return float(np.abs(current_idf - self._idf).sum() / max(np.abs(self._idf).sum(), 1e-12))
 
     def tf_idf_info(self, word: str, document: str, word_list=None) -> (float, int):
         """
@@ -113,13 +462,12 @@ class TfIdfVectorizer:
         :param word_list: Instead of document it can use already processed list of words from document
         :return: (tf_idf_score, found_in_corpus), found_in_corpus - True if word is in bag-of-words corpus
         """
-        if not self._bag_word_vocabulary:
+        if not self.fitted:
             raise ValueError("Model should be initialized.")
 
         # To speedup processing
         if not word_list:
-            cl_sentence = TfIdfVectorizer.trim_string(document)
-            word_list = cl_sentence.split()
+            word_list = self._tokenizer.tokenize(document)
 
             if not word_list:
                 return [], 0
@@ -127,7 +475,10 @@ class TfIdfVectorizer:
         num_appearance = word_list.count(word)
         tf = num_appearance / len(word_list)
 
-        num_appearance_in_corpus = self._bag_word_vocabulary.get(word, (0, 0))[1]
+        if self.n_features:
+            num_appearance_in_corpus = self._bucket_counts[Tokenizer.bucket(word, n_buckets=self.n_features)]
+        else:
+            num_appearance_in_corpus = self._bag_word_vocabulary.get(word, (0, 0))[1]
         idf = np.log(self._total_corpus_size / (num_appearance_in_corpus + 1)) + 1
 
         tf_idf_score = tf * idf
@@ -143,24 +494,19 @@ class TfIdfVectorizer:
 
     def transform_doc(self, question) -> np.ndarray:
         """
-        Transform texts into numpy vectors with TF-IDF scores.
-        :return: Vectorized questions as numpy array of (N, D) shape where
-                N is number of questions in corpus, and D is vocabulary size
+        Transform text into numpy vector with TF-IDF scores.
+        :return: Vectorized question as numpy array of (D,) shape where D is vocabulary size
                 Used in a bag-of-words model.
         """
-        cl_sentence = TfIdfVectorizer.trim_string(question)
-        word_list = cl_sentence.split()
+        return self.transform_sparse(questions=[question]).toarray()[0]
 
-        # Clear multiple word appearance from word list
-        words = list(set(word_list))
-        embedding = np.zeros(self._embedding_size, dtype=float)
-
-        for word in words:
-            tf_idf_score, found_in_corpus = self.tf_idf_info(word=word, document=question, word_list=word_list)
-            if found_in_corpus:
-                word_index = self._bag_word_vocabulary.get(word)[0]
-                embedding[word_index] = tf_idf_score
-        return embedding
+    def transform_doc_sparse(self, question) -> (np.ndarray, np.ndarray):
+        """
+        Transform text into non zero TF-IDF scores.
+        :return: (word_indices, tf_idf_scores), vector dimensions and values for words found in vocabulary.
+        """
+        vector = self.transform_sparse(questions=[question])
+        return vector.indices, vector.data
 
     def transform(self, questions) -> np.ndarray:
         """
@@ -170,13 +516,117 @@ class TfIdfVectorizer:
                 N is number of questions in corpus, and D is vocabulary size
                 Used in a bag-of-words model.
         """
-        vectors = np.zeros(shape=(0, self._embedding_size), dtype=float)
-        for num, document in tqdm(enumerate(questions), desc="Processing documents into vectors",
-                                  total=len(questions), disable=not self.progress_bar):
-            vector = self.transform_doc(question=document)
-            vectors = np.vstack([vectors, vector])
-        return vectors
+        return self.transform_sparse(questions=questions).toarray()
+
+    def transform_sparse(self, questions, batch_size=None, workers=1, progress_bar=None) -> SparseMatrix:
+        """
+        Transform texts into sparse matrix with TF-IDF scores. Memory scales with number of words in
+        questions instead of N x D.
+        :param questions: The sequence or stream of raw corpus questions.
+        :param batch_size: Number of questions vectorized at once.
+        :param workers: Number of processes, batches are vectorized in parallel and stacked in order.
+        :param progress_bar: Show progress bar, by default vectorizer progress_bar setting is used. Passing it
+                             instead of changing the setting keeps vectorizer read only for concurrent queries.
+        :return: Vectorized questions as SparseMatrix of (N, D) shape.
+        """
+        if not self.fitted:
+            raise ValueError("Model should be initialized.")
+        self._ensure_lookup()
+
+        batch_size = batch_size or TfIdfVectorizer.TRANSFORM_BATCH_SIZE
+        total = len(questions) if hasattr(questions, '__len__') else None
+        batches = TfIdfVectorizer.iterate_batches(items=questions, batch_size=batch_size)
+        vectors = []
+        progress_bar = self.progress_bar if progress_bar is None else progress_bar
+        with _progress_bar(enabled=progress_bar, desc="Processing documents into vectors", total=total) as progress:
+            if workers > 1:
+                # Vectorizer is sent to every process once, batches are vectorized with its copy
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_vectorizer,
+                                         initargs=(self,)) as executor:
+                    for batch_vectors in TfIdfVectorizer.ordered_map(executor=executor, function=_transform_in_worker,
+                                                                     items=batches, max_pending=2 * workers):
+                        vectors.append(batch_vectors)
+                        progress.update(len(batch_vectors))
+            else:
+                for batch in batches:
+                    vectors.append(self._transform_batch(questions=batch))
+                    progress.update(len(batch))
+
+        if not vectors:
+            return SparseMatrix.from_rows(rows=[], n_cols=self.embedding_size)
+        return SparseMatrix.vstack(vectors)
+
+    def _transform_batch(self, questions: list) -> SparseMatrix:
+        with metrics.stage('tokenize'):
+            word_ids, lengths = self._tokenizer.encode_many(texts=questions)
+        with metrics.stage('vectorize'):
+            return self._transform_word_ids(word_ids=word_ids, lengths=lengths)
+
+    def _transform_word_ids(self, word_ids: np.ndarray, lengths: np.ndarray) -> SparseMatrix:
+        """
+        Vectorize already tokenized questions. Word counts per question are computed with numpy over the whole
+        batch and multiplied with precomputed IDF weights.
+        :param word_ids: Vocabulary ids of words of all questions, see Tokenizer.encode_many.
+        :param lengths: Number of words of every question.
+        """
+        n_docs = len(lengths)
+        vocabulary_size = max(len(self._idf), 1)
+        doc_indices = np.repeat(np.arange(n_docs), lengths)
+
+        # Count (question, word) pairs, unique keys come sorted by question and then by word index
+        found = word_ids != Tokenizer.UNKNOWN_ID
+        keys = doc_indices[found] * vocabulary_size + word_ids[found]
+        keys, counts = np.unique(keys, return_counts=True)
+        rows, columns = keys // vocabulary_size, keys % vocabulary_size
+
+        tf = counts / lengths[rows]
+        data = tf * self._idf[columns]
+        indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_docs), out=indptr[1:])
+        return SparseMatrix(data=data, indices=columns, indptr=indptr, shape=(n_docs, self.embedding_size))
 
     def save_bag_word_dict(self, path):
         json.dump(self._bag_word_vocabulary, open(path, 'w'), indent=4)
 
+
+# Vectorizer used by worker processes of TfIdfVectorizer.transform_sparse
+_worker_vectorizer = None
+
+
+def _counted(items, count: list):
+    """
+    Yields items and counts them in count[0], used for streams without length.
+    """
+    for item in items:
+        count[0] += 1
+        yield item
+
+
+class _NoProgressBar:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, n=1):
+        pass
+
+
+def _progress_bar(enabled, **tqdm_options):
+    """
+    tqdm is imported only when progress bar is shown, so serving queries does not import it.
+    """
+    if not enabled:
+        return _NoProgressBar()
+    from tqdm import tqdm
+    return tqdm(**tqdm_options)
+
+
+def _init_worker_vectorizer(vectorizer: TfIdfVectorizer):
+    global _worker_vectorizer
+    _worker_vectorizer = vectorizer
+
+
+def _transform_in_worker(questions: list) -> SparseMatrix:
+    return _worker_vectorizer._transform_batch(questions=questions)
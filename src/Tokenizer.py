@@ -0,0 +1,90 @@
+"""
+Tokenizer which splits questions into words and maps words to vocabulary ids, or to hashing buckets.
+"""
+import re
+import zlib
+from itertools import chain, repeat
+
+import numpy as np
+
+
+class Tokenizer:
+    # Digits and non word characters separate words
+    NON_WORD_PATTERN = re.compile(r'[\d\W]+')
+    UNKNOWN_ID = -1
+
+    def __init__(self, stop_words=(), word_ids: dict = None, n_buckets: int = None):
+        """
+        :param stop_words: Words which are dropped while tokenizing.
+        :param word_ids: Vocabulary, word -> word id.
+        :param n_buckets: Number of hashing buckets, when given words are mapped to buckets and vocabulary
+                          is not used.
+        """
+        self.stop_words = frozenset(stop_words)
+        self._word_ids = word_ids or {}
+        self.n_buckets = n_buckets
+
+    def set_vocabulary(self, word_ids: dict):
+        self._word_ids = word_ids
+
+    @staticmethod
+    def bucket(word: str, n_buckets: int) -> int:
+        """
+        Hashing bucket of word. crc32 is used instead of hash, so buckets are the same in every process.
+        """
+        return zlib.crc32(word.encode('utf-8')) % n_buckets
+
+    @staticmethod
+    def trim(text: str) -> str:
+        """
+        Lower case and replace non word characters with space.
+        """
+        return Tokenizer.NON_WORD_PATTERN.sub(' ', text.lower())
+
+    def tokenize(self, text: str) -> list:
+        """
+        Split text into lower cased words without stop words.
+        """
+        words = Tokenizer.trim(text).split()
+        if self.stop_words:
+            stop_words = self.stop_words
+            words = [word for word in words if word not in stop_words]
+        return words
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        Returns vocabulary id (or bucket) of every word in text, UNKNOWN_ID for words out of vocabulary.
+        """
+        word_ids, _ = self.encode_many(texts=[text])
+        return word_ids
+
+    def encode_many(self, texts) -> (np.ndarray, np.ndarray):
+        """
+        Tokenize texts and map words to vocabulary ids.
+        :param texts: Sequence of texts.
+        :return: (word_ids, lengths), word ids of all texts concatenated and number of words of every text.
+        """
+        return self.encode_words(word_lists=[self.tokenize(text) for text in texts])
+
+    def encode_words(self, word_lists: list) -> (np.ndarray, np.ndarray):
+        """
+        Map already tokenized texts to vocabulary ids, see encode_many.
+        :param word_lists: List of word lists returned by tokenize.
+        """
+        lengths = np.fromiter(map(len, word_lists), dtype=np.int64, count=len(word_lists))
+        words = chain.from_iterable(word_lists)
+        if self.n_buckets:
+            return Tokenizer.buckets(words=words, n_buckets=self.n_buckets, count=int(lengths.sum())), lengths
+        word_ids = np.fromiter(map(self._word_ids.get, words, repeat(Tokenizer.UNKNOWN_ID)), dtype=np.int64,
+                               count=int(lengths.sum()))
+        return word_ids, lengths
+
+    @staticmethod
+    def buckets(words, n_buckets: int, count: int = -1) -> np.ndarray:
+        """
+        Hashing buckets of words, see bucket.
+        :param words: Iterable of words.
+        :param count: Number of words, when known.
+        """
+        word_hashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.int64, count=count)
+        return word_hashes % n_buckets
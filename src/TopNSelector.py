@@ -0,0 +1,67 @@
+"""
+Selection of n best scored documents without sorting whole corpus scores.
+"""
+import numpy as np
+
+
+class TopNSelector:
+    def __init__(self, n: int, min_score: float = None):
+        """
+        :param n: Number of documents to select.
+        :param min_score: Documents with score lower than min_score are never selected.
+        """
+        self.n = n
+        self.min_score = min_score
+
+    def select(self, scores: np.ndarray, doc_ids: np.ndarray = None) -> (np.ndarray, np.ndarray):
+        """
+        Select n best scores with partial selection (argpartition), only selected scores are sorted.
+        Equal scores are ordered by doc id, lower id first.
+        :param scores: Scores as (N,) array.
+        :param doc_ids: Doc id for every score, by default position of score in array.
+        :return: (doc_ids, scores) of selected documents sorted by score in descending order.
+        """
+        scores = np.asarray(scores)
+        if doc_ids is None:
+            doc_ids = np.arange(len(scores))
+        doc_ids = np.asarray(doc_ids)
+
+        if self.min_score is not None:
+            passed = scores >= self.min_score
+            scores, doc_ids = scores[passed], doc_ids[passed]
+
+        k = min(self.n, len(scores))
+        if k <= 0:
+            return doc_ids[:0], scores[:0]
+
+        if k < len(scores):
+            kth = len(scores) - k
+            threshold = scores[np.argpartition(scores, kth)[kth]]
+            above = np.flatnonzero(scores > threshold)
+            # Score of n-th document can be shared with more documents, keep ones with lowest doc id
+            ties = np.flatnonzero(scores == threshold)
+            ties = ties[np.argsort(doc_ids[ties], kind='stable')[:k - len(above)]]
+            selected = np.concatenate([above, ties])
+        else:
+            selected = np.arange(len(scores))
+
+        order = np.lexsort((doc_ids[selected], -scores[selected]))
+        selected = selected[order]
+        return doc_ids[selected], scores[selected]
+
+    def select_many(self, scores: np.ndarray, doc_ids: np.ndarray = None) -> list:
+        """
+        Select n best scores for every query.
+        :param scores: Scores of (M, N) shape, one row per query.
+        :param doc_ids: Doc ids of (N,) shape shared by all queries.
+        :return: List of M (doc_ids, scores) pairs.
+        """
+        return [self.select(scores=row_scores, doc_ids=doc_ids) for row_scores in np.atleast_2d(scores)]
+
+    def merge(self, first: tuple, second: tuple) -> (np.ndarray, np.ndarray):
+        """
+        Merge two (doc_ids, scores) selections into n best.
+        """
+        doc_ids = np.concatenate([first[0], second[0]])
+        scores = np.concatenate([first[1], second[1]])
+        return self.select(scores=scores, doc_ids=doc_ids)
@@ -0,0 +1,38 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from src.CorpusReader import CorpusReader
+
+
+class CorpusReaderTestCase(unittest.TestCase):
+    ROWS = [
+        json.dumps({"id": "1", "question": "How to use numpy?", "tags": ["python"]}),
+        "{not valid json",
+        "",
+        json.dumps({"id": "2", "question": "What is C#?", "tags": ["c#"]}),
+        json.dumps(["not", "object"])
+    ]
+
+    def test_read(self):
+        with tempfile.TemporaryDirectory() as path:
+            corpus_path = os.path.join(path, 'questions.jsonl.gz')
+            with gzip.open(corpus_path, 'wt', encoding='utf-8') as fw:
+                fw.write('\n'.join(CorpusReaderTestCase.ROWS))
+
+            reader = CorpusReader(path=corpus_path)
+            documents = list(reader)
+            self.assertEqual([doc.doc_id for doc in documents], ["1", "2"])
+            self.assertEqual(documents[1].tags, ["c#"])
+            self.assertEqual(reader.skipped, 2)
+            self.assertEqual(list(reader.questions()), ["How to use numpy?", "What is C#?"])
+            self.assertEqual([len(batch) for batch in reader.batches(batch_size=1)], [1, 1])
+
+            with self.assertRaises(ValueError):
+                list(CorpusReader(path=corpus_path, skip_malformed=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from src.Document import Document
+from src.DocumentStore import DocumentStore
+
+
+class DocumentStoreTestCase(unittest.TestCase):
+    def test_access(self):
+        documents = [Document(doc_id='1', text='How to use numpy?', tags=['python', 'numpy']),
+                     Document(doc_id=2, text='Čo je C#?', tags=''),
+                     Document(doc_id='3', text='Python list', tags=['python'])]
+        store = DocumentStore(documents=documents)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.tags, ['python', 'numpy'])
+        self.assertEqual(store.text(1), 'Čo je C#?')
+        self.assertEqual(store.texts(), [document.text for document in documents])
+        self.assertEqual(store.doc_ids(), ['1', 2, '3'])
+        self.assertEqual([document.tags for document in store], [['python', 'numpy'], [], ['python']])
+        self.assertEqual(store[-1].text, 'Python list')
+        with self.assertRaises(IndexError):
+            store[3]
+        self.assertTrue(np.array_equal(store.tag_index().documents('python'), [0, 2]))
+
+        taken = store.take(rows=np.array([2, 0]))
+        self.assertEqual(taken.texts(), ['Python list', 'How to use numpy?'])
+        self.assertEqual([document.tags for document in taken], [['python'], ['python', 'numpy']])
+
+        merged = DocumentStore.concatenate([DocumentStore([Document(doc_id=4, text='Java', tags=['java'])]), store])
+        self.assertEqual(merged.doc_ids(), [4, '1', 2, '3'])
+        self.assertEqual(merged[1].tags, ['python', 'numpy'])
+        self.assertEqual(merged.texts(rows=[0, 2]), ['Java', 'Čo je C#?'])
+
+        loaded = DocumentStore.from_arrays(arrays=merged.to_arrays(), tags=merged.tags)
+        self.assertEqual([document.tags for document in loaded], [document.tags for document in merged])
+
+        appended = store.append(DocumentStore([Document(doc_id=4, text='Java', tags=['java'])]))
+        appended = appended.append(DocumentStore([Document(doc_id=5, text='Go', tags=['go', 'python'])]))
+        self.assertEqual(len(store), 3)
+        self.assertEqual(appended.doc_ids(), ['1', 2, '3', 4, 5])
+        self.assertEqual(appended[4].tags, ['go', 'python'])
+        self.assertEqual(appended.texts(rows=[4, 0]), ['Go', 'How to use numpy?'])
+        self.assertTrue(np.array_equal(appended.tag_index().documents('python'), [0, 2, 4]))
+        self.assertEqual(appended.merged().tags, ['python', 'numpy', 'java', 'go'])
+        self.assertEqual(appended.take(rows=[3, 1]).texts(), ['Java', 'Čo je C#?'])
+
+
+if __name__ == '__main__':
+    unittest.main()
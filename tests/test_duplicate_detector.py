@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+
+from src.DuplicateDetector import DuplicateDetector
+
+
+class DuplicateDetectorTestCase(unittest.TestCase):
+    def test_cluster(self):
+        texts = [
+            "How to sort a list in Python?",
+            "Java array",
+            "how to sort a list in python",
+            "",
+            "java array!!",
+            "What is array in JavaScript?",
+            "How to sort a list in Python quickly?"
+        ]
+        detector = DuplicateDetector(threshold=0.8)
+        self.assertTrue(np.array_equal(detector.cluster(texts=texts), [0, 1, 0, 3, 1, 5, 0]))
+
+        skip = np.zeros(len(texts), dtype=bool)
+        skip[2] = True
+        self.assertTrue(np.array_equal(detector.cluster(texts=texts, skip=skip), [0, 1, 2, 3, 1, 5, 0]))
+
+        # Similarity of word sets {how, to, sort, a, list, in, python} and the same set with "quickly" is 7 / 8
+        strict = DuplicateDetector(threshold=1.)
+        self.assertTrue(np.array_equal(strict.cluster(texts=texts), [0, 1, 0, 3, 1, 5, 6]))
+        self.assertEqual(len(detector.cluster(texts=[])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
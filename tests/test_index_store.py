@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.Document import Document
+from src.IndexStore import IndexStore
+
+
+class IndexStoreTestCase(unittest.TestCase):
+    def test_write_read(self):
+        arrays = {'values': np.arange(5, dtype=float), 'ids': np.array([3, 1, 2])}
+        documents = [Document(doc_id='1', text='How to use numpy?', tags=['python']),
+                     Document(doc_id='2', text='What is C#?', tags=['c#'])]
+        with tempfile.TemporaryDirectory() as path:
+            store = IndexStore(path=os.path.join(path, 'index'))
+            store.write(arrays=arrays, words=['numpy', 'use'], documents=documents, metadata={'size': 2})
+            self.assertTrue(IndexStore.is_index(store.path))
+
+            loaded_arrays, words, loaded_documents, metadata = store.read(verify=True)
+            self.assertTrue(isinstance(loaded_arrays['values'], np.memmap))
+            self.assertTrue(np.array_equal(loaded_arrays['ids'], arrays['ids']))
+            self.assertEqual(words, ['numpy', 'use'])
+            self.assertEqual([doc.text for doc in loaded_documents], [doc.text for doc in documents])
+            self.assertEqual(loaded_documents[1].tags, ['c#'])
+            self.assertEqual(metadata, {'size': 2})
+
+            # Loaded index keeps reading old files when index is written again
+            store.write(arrays=arrays, words=['numpy'], documents=documents[:1], metadata={'size': 1})
+            self.assertEqual(loaded_documents[1].text, 'What is C#?')
+            self.assertEqual(len(store.read()[2]), 1)
+
+            del loaded_arrays
+            with open(os.path.join(store.path, 'ids.npy'), 'ab') as fw:
+                fw.write(b'0')
+            with self.assertRaises(ValueError):
+                store.verify()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+
+from src.InvertedIndex import InvertedIndex
+from src.SimilarityScorer import SimilarityScorer
+from src.SparseMatrix import SparseMatrix
+
+
+class InvertedIndexTestCase(unittest.TestCase):
+    @staticmethod
+    def random_corpus(seed=7, n_docs=300, n_terms=40):
+        random_state = np.random.RandomState(seed)
+        dense = random_state.rand(n_docs, n_terms)
+        dense[dense < 0.85] = 0
+        return dense
+
+    def test_search(self):
+        dense = self.random_corpus()
+        query = np.zeros((1, dense.shape[1]))
+        query[0, [1, 5, 9]] = [0.5, 1., 0.3]
+
+        index = InvertedIndex(vectors=SparseMatrix.from_dense(dense))
+        doc_ids, scores = index.search(query_vector=SparseMatrix.from_dense(query))
+
+        expected = SimilarityScorer().cosine_similarity(query_vectors=query, corpus_vectors=dense)[:, 0]
+        self.assertTrue(np.array_equal(doc_ids, np.flatnonzero(expected)))
+        self.assertTrue(np.allclose(scores, expected[doc_ids]))
+
+    def test_pruned_search(self):
+        dense = self.random_corpus()
+        query = np.zeros((1, dense.shape[1]))
+        query[0, [0, 3, 4, 8, 20]] = [0.2, 1., 0.7, 0.1, 0.4]
+        query_vector = SparseMatrix.from_dense(query)
+        n = 5
+
+        index = InvertedIndex(vectors=SparseMatrix.from_dense(dense))
+        doc_ids, scores = index.search(query_vector=query_vector)
+        pruned_ids, pruned_scores = index.search(query_vector=query_vector, n=n, prune=True)
+
+        self.assertTrue(len(pruned_ids) <= len(doc_ids))
+        best = doc_ids[np.argsort(-scores)[:n]]
+        pruned_best = pruned_ids[np.argsort(-pruned_scores)[:n]]
+        self.assertTrue(np.array_equal(best, pruned_best))
+
+    def test_masked_search(self):
+        dense = self.random_corpus()
+        query_vector = SparseMatrix.from_dense(self.random_corpus(seed=5, n_docs=1))
+        mask = np.random.RandomState(11).rand(len(dense)) < 0.25
+        index = InvertedIndex(vectors=SparseMatrix.from_dense(dense))
+
+        doc_ids, scores = index.search(query_vector=query_vector)
+        masked_ids, masked_scores = index.search(query_vector=query_vector, mask=mask)
+        self.assertTrue(np.array_equal(masked_ids, doc_ids[mask[doc_ids]]))
+        self.assertTrue(np.allclose(masked_scores, scores[mask[doc_ids]]))
+
+        pruned_ids, pruned_scores = index.search(query_vector=query_vector, n=5, prune=True, mask=mask)
+        self.assertTrue(np.all(mask[pruned_ids]))
+        self.assertTrue(set(masked_ids[np.argsort(-masked_scores)[:5]]) <= set(pruned_ids))
+
+    def test_search_many(self):
+        dense = self.random_corpus()
+        queries = self.random_corpus(seed=13, n_docs=6)
+        queries[2] = 0
+        query_vectors = SparseMatrix.from_dense(queries)
+        mask = np.random.RandomState(11).rand(len(dense)) < 0.5
+        index = InvertedIndex(vectors=SparseMatrix.from_dense(dense[:200])).with_delta(
+            delta=InvertedIndex(vectors=SparseMatrix.from_dense(dense[200:])))
+
+        for query_mask in [None, mask]:
+            results = index.search_many(query_vectors=query_vectors, mask=query_mask)
+            self.assertEqual(len(results), len(queries))
+            for row, (doc_ids, scores) in enumerate(results):
+                expected_ids, expected_scores = index.search(query_vector=query_vectors.getrow(row), mask=query_mask)
+                self.assertTrue(np.array_equal(doc_ids, expected_ids))
+                self.assertTrue(np.array_equal(scores, expected_scores))
+        self.assertEqual(len(results[2][0]), 0)
+
+    def test_delta(self):
+        dense = self.random_corpus()
+        query_vector = SparseMatrix.from_dense(self.random_corpus(seed=3, n_docs=1))
+        index = InvertedIndex(vectors=SparseMatrix.from_dense(dense))
+        delta_index = InvertedIndex(vectors=SparseMatrix.from_dense(dense[:200])).with_delta(
+            delta=InvertedIndex(vectors=SparseMatrix.from_dense(dense[200:])))
+        self.assertEqual(delta_index.n_docs, len(dense))
+
+        doc_ids, scores = index.search(query_vector=query_vector)
+        for searched_index in [delta_index, delta_index.merged()]:
+            delta_ids, delta_scores = searched_index.search(query_vector=query_vector)
+            self.assertTrue(np.array_equal(delta_ids, doc_ids))
+            self.assertTrue(np.allclose(delta_scores, scores))
+            pruned_ids, _ = searched_index.search(query_vector=query_vector, n=5, prune=True)
+            self.assertTrue(set(doc_ids[np.argsort(-scores)[:5]]) <= set(pruned_ids))
+        for name, array in index.to_arrays().items():
+            self.assertTrue(np.allclose(delta_index.to_arrays()[name], array))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+import numpy as np
+
+from src.IvfIndex import IvfIndex
+from src.SparseMatrix import SparseMatrix
+
+
+class IvfIndexTestCase(unittest.TestCase):
+    def test_small_corpus(self):
+        vectors = SparseMatrix.from_dense(np.array([[1., 0., 0.], [0., 1., 0.], [0., 0., 0.], [0., 0.6, 0.8]],
+                                                   dtype=np.float32)).normalized()
+        # More lists than non empty questions
+        index = IvfIndex(vectors=vectors, n_lists=10)
+        self.assertEqual(index.n_lists, 3)
+        self.assertTrue(np.array_equal(index.candidates(query_vector=np.ones(3), n_probe=3), np.arange(4)))
+
+        # More lists than sampled questions
+        index = IvfIndex(vectors=vectors, n_lists=3, sample_size=2)
+        self.assertEqual(index.n_lists, 2)
+        self.assertTrue(np.array_equal(index.candidates(query_vector=np.ones(3), n_probe=2), np.arange(4)))
+
+        index = IvfIndex(vectors=SparseMatrix.from_dense(np.zeros((2, 3), dtype=np.float32)), n_lists=4)
+        self.assertEqual(index.n_lists, 1)
+        self.assertTrue(np.array_equal(index.candidates(query_vector=np.ones(3)), [0, 1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.LazyDocuments import LazyDocuments
+
+
+class LazyDocumentsTestCase(unittest.TestCase):
+    def test_access(self):
+        rows = [{'id': str(i), 'question': 'Question %d?' % i, 'tags': ['python']} for i in range(5)]
+        with tempfile.TemporaryDirectory() as path:
+            documents_path = os.path.join(path, 'documents.jsonl')
+            with open(documents_path, 'w', encoding='utf-8') as fw:
+                fw.write('\n'.join(json.dumps(row) for row in rows))
+
+            documents = LazyDocuments(path=documents_path)
+            self.assertEqual(len(documents), 5)
+            self.assertEqual(documents[4].text, 'Question 4?')
+            self.assertEqual(documents[-1].doc_id, '4')
+            self.assertEqual([document.doc_id for document in documents[1:3]], ['1', '2'])
+            self.assertEqual([document.tags for document in documents], [['python']] * 5)
+            with self.assertRaises(IndexError):
+                documents[5]
+            view = documents.view(2, 4)
+            self.assertEqual([document.doc_id for document in view], ['2', '3'])
+
+            open(documents_path, 'w').close()
+            self.assertEqual(len(LazyDocuments(path=documents_path)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
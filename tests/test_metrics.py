@@ -0,0 +1,38 @@
+import unittest
+
+from src.Metrics import Histogram, Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1.))
+        for value in [0.05, 0.1, 0.5, 2.]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative_counts(), [2, 3, 4])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        with metrics.stage('score'):
+            pass
+        metrics.increment('queries_total', 3)
+        metrics.register_collector(lambda: {'index_documents': 10})
+        text = metrics.to_prometheus()
+        self.assertNotIn('stage="score"', text)
+        self.assertNotIn('qse_queries_total', text)
+        self.assertIn('qse_index_documents 10.0', text)
+
+        metrics.enabled = True
+        with metrics.stage('score'):
+            pass
+        metrics.increment('queries_total', 3)
+        text = metrics.to_prometheus()
+        self.assertIn('qse_queries_total 3', text)
+        self.assertIn('# TYPE qse_stage_seconds histogram', text)
+        self.assertIn('qse_stage_seconds_bucket{stage="score",le="+Inf"} 1', text)
+        self.assertIn('qse_stage_seconds_count{stage="score"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import time
+import unittest
+
+from src.QueryCache import QueryCache
+
+
+class QueryCacheTestCase(unittest.TestCase):
+    def test_lru(self):
+        cache = QueryCache(max_size=2)
+        cache.put(key='a', value=1, version=1)
+        cache.put(key='b', value=2, version=1)
+        self.assertEqual(cache.get(key='a', version=1), 1)
+        cache.put(key='c', value=3, version=1)
+        self.assertIsNone(cache.get(key='b', version=1))
+        self.assertEqual(cache.get(key='c', version=1), 3)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+        self.assertIsNone(cache.get(key='a', version=2))
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl(self):
+        cache = QueryCache(max_size=2, ttl=0.01)
+        cache.put(key='a', value=1, version=1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(key='a', version=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+
+from src.CorpusReader import CorpusReader
+from src.QuestionGenerator import QuestionGenerator
+
+
+class QuestionGeneratorTestCase(unittest.TestCase):
+    CORPUS_PATH = "../data/questions.jsonl"
+
+    def test_generate(self):
+        generator = QuestionGenerator(sample_path=QuestionGeneratorTestCase.CORPUS_PATH, vocabulary_size=1000)
+        self.assertEqual(len(generator.words), 1000)
+        documents = list(generator.generate(n=200, start_id=10))
+        self.assertEqual([document.doc_id for document in documents], [str(i) for i in range(10, 210)])
+        self.assertTrue(all(document.text.endswith('?') for document in documents))
+        self.assertTrue(all(set(document.tags) <= set(generator.tags) for document in documents))
+
+        same_seed = QuestionGenerator(sample_path=QuestionGeneratorTestCase.CORPUS_PATH, vocabulary_size=1000)
+        self.assertEqual([document.text for document in same_seed.generate(n=200)],
+                         [document.text for document in documents])
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as path:
+            corpus_path = os.path.join(path, 'questions.jsonl.gz')
+            QuestionGenerator(vocabulary_size=100).write(path=corpus_path, n=50)
+            documents = list(CorpusReader(path=corpus_path, skip_malformed=False))
+            self.assertEqual(len(documents), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
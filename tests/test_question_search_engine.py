@@ -1,7 +1,13 @@
 import numpy as np
+import os
+import pickle
+import tempfile
 import unittest
 
+from src.Document import Document
+from src.IvfIndex import IvfIndex
 from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.SimilarityScorer import Bm25Scorer
 
 
 class QuestionSearchEngineTestCase(unittest.TestCase):
@@ -27,6 +33,321 @@ class QuestionSearchEngineTestCase(unittest.TestCase):
                 self.assertTrue(type(similarity) is np.float64)
                 self.assertTrue(-1 <= similarity <= 1)
 
+            scores = [rq[0] for rq in r_query]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+
+            pruned_query = qse.most_similar(query=t_question, n=n, prune=True)
+            self.assertEqual([rq[0] for rq in r_query], [rq[0] for rq in pruned_query])
+
+        batch_result = qse.most_similar_many(queries=test_questions, n=n, chunk_size=128)
+        self.assertEqual(len(batch_result), len(test_questions))
+        for t_question, r_query in zip(test_questions, batch_result):
+            single_result = qse.most_similar(query=t_question, n=n)
+            self.assertTrue(np.allclose([rq[0] for rq in r_query], [rq[0] for rq in single_result]))
+
+    def test_save_load(self):
+        test_question = "c# index was out of the bounds of the array"
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents)
+
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path, verify=True)
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5),
+                             qse.most_similar(query=test_question, n=5))
+            self.assertEqual(loaded_qse.most_similar_many(queries=[test_question], n=5),
+                             qse.most_similar_many(queries=[test_question], n=5))
+
+        # Hashing vectorizer is saved with the index
+        hashed_qse = QuestionsSearchEngine(questions=documents, n_features=256)
+        self.assertEqual(hashed_qse.vectorizer.n_features, 256)
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            hashed_qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path)
+            self.assertEqual(loaded_qse.vectorizer.n_features, 256)
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5),
+                             hashed_qse.most_similar(query=test_question, n=5))
+
+        # Pickle cache of older versions is found next to missing index directory
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            self.assertIsNone(QuestionsSearchEngine.stored_data_path(index_path))
+            legacy_path = os.path.join(path, QuestionsSearchEngine.LEGACY_CACHE_FILE)
+            with open(legacy_path, 'wb') as output:
+                pickle.dump(documents, output)
+                pickle.dump(qse._stored_data_vectors.merged(), output)
+                pickle.dump(qse.vectorizer, output)
+            self.assertEqual(QuestionsSearchEngine.stored_data_path(index_path), legacy_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=QuestionsSearchEngine.stored_data_path(index_path))
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5),
+                             qse.most_similar(query=test_question, n=5))
+            loaded_qse.save_stored_data(path=index_path)
+            self.assertEqual(QuestionsSearchEngine.stored_data_path(index_path), index_path)
+
+    def test_from_corpus(self):
+        test_question = "MySQL how to query five tables in one SELECT"
+        with open(QuestionSearchEngineTestCase.CORPUS_PATH, 'r') as fr:
+            rows = [fr.readline() for _ in range(1000)]
+
+        with tempfile.TemporaryDirectory() as path:
+            corpus_path = os.path.join(path, 'questions.jsonl')
+            with open(corpus_path, 'w') as fw:
+                fw.writelines(rows)
+
+            documents = QuestionsSearchEngine.load_questions(path=corpus_path)
+            qse = QuestionsSearchEngine(questions=documents)
+            streamed_qse = QuestionsSearchEngine.from_corpus(path=corpus_path, workers=2)
+            self.assertEqual(streamed_qse.most_similar(query=test_question, n=5),
+                             qse.most_similar(query=test_question, n=5))
+            self.assertEqual(streamed_qse.get_document(999).doc_id, documents[999].doc_id)
+
+    def test_add_remove_documents(self):
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        more_documents = documents[1000:1100]
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents[:900])
+
+        new_documents = documents[900:]
+        words, _, _ = qse._vectorizer.export_vocabulary()
+        new_question = ' '.join(words[:30])
+        new_documents.append(Document(doc_id='new_question', text=new_question, tags=[]))
+        idf_drift = qse.add_documents(documents=new_documents)
+        self.assertTrue(idf_drift >= 0)
+
+        r_query = qse.most_similar(query=new_question, n=5)
+        self.assertEqual(r_query[0][1], new_question)
+        self.assertEqual(qse.most_similar_many(queries=[new_question], n=5)[0][0][1], new_question)
+
+        # Delta segment is merged when index is saved
+        with tempfile.TemporaryDirectory() as path:
+            qse.save_stored_data(path=os.path.join(path, 'qse_index'))
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=os.path.join(path, 'qse_index'))
+            self.assertEqual(loaded_qse.most_similar(query=new_question, n=5, tags='python'),
+                             qse.most_similar(query=new_question, n=5, tags='python'))
+            self.assertEqual(loaded_qse.most_similar(query=new_question, n=5, prune=True), r_query)
+
+            # Document frequencies of words outside vocabulary are stored too, so IDF drift is the same after load
+            self.assertAlmostEqual(loaded_qse.add_documents(documents=more_documents),
+                                   qse.add_documents(documents=more_documents))
+            self.assertAlmostEqual(loaded_qse.remove_documents(doc_ids=[documents[0].doc_id]),
+                                   qse.remove_documents(doc_ids=[documents[0].doc_id]))
+
+        qse.remove_documents(doc_ids=['new_question'])
+        for r_query in [qse.most_similar(query=new_question, n=5, prune=True),
+                        qse.most_similar_many(queries=[new_question], n=5)[0]]:
+            self.assertEqual(len(r_query), 5)
+            self.assertNotIn(new_question, [rq[1] for rq in r_query])
+        # Batch is scored over posting lists, so results are the same as results of single queries
+        queries = [new_question] + [document.text for document in documents[:20]] + ['']
+        self.assertEqual(qse.most_similar_many(queries=queries, n=5),
+                         [qse.most_similar(query=query, n=5) for query in queries])
+
+        qse.compact()
+        self.assertFalse(qse.needs_compaction)
+        self.assertNotIn(new_question, [rq[1] for rq in qse.most_similar(query=new_question, n=5)])
+
+    def test_storage_dtype(self):
+        test_question = "c# index was out of the bounds of the array"
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        baseline_qse = QuestionsSearchEngine(questions=documents, dtype='float64')
+        baseline = baseline_qse.most_similar(query=test_question, n=5)
+
+        qse = QuestionsSearchEngine(questions=documents, dtype='int8')
+        self.assertLess(qse.memory_usage()['vectors'], baseline_qse.memory_usage()['vectors'])
+        r_query = qse.most_similar(query=test_question, n=5, rerank=20)
+        self.assertEqual([rq[1] for rq in r_query], [rq[1] for rq in baseline])
+        self.assertTrue(np.allclose([rq[0] for rq in r_query], [rq[0] for rq in baseline], atol=1e-3))
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5, rerank=20), [r_query])
+
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path)
+            self.assertEqual(loaded_qse.dtype, 'int8')
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5),
+                             qse.most_similar(query=test_question, n=5))
+
+    def test_bm25_scorer(self):
+        test_question = "c# index was out of the bounds of the array"
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents)
+        qse.enable_cache()
+        cosine_query = qse.most_similar(query=test_question, n=5)
+        qse.set_scorer(Bm25Scorer(bigram_buckets=1024))
+        self.assertIn('scorer', qse.memory_usage())
+
+        r_query = qse.most_similar(query=test_question, n=5)
+        self.assertNotEqual(r_query, cosine_query)
+        self.assertEqual(qse.most_similar(query=test_question, n=5, prune=True), r_query)
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5, chunk_size=100), [r_query])
+        with self.assertRaises(ValueError):
+            qse.most_similar(query=test_question, n=5, rerank=20)
+
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path)
+            self.assertIsInstance(loaded_qse.scorer, Bm25Scorer)
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5), r_query)
+
+        qse.set_scorer(None)
+        self.assertEqual(qse.most_similar(query=test_question, n=5), cosine_query)
+
+        # Added questions are appended to scorer, posting lists of fitted questions are shared
+        qse.set_scorer(Bm25Scorer(bigram_buckets=1024))
+        qse.add_documents(documents=[Document(doc_id='new_question', text=test_question, tags=[])])
+        r_query = qse.most_similar(query=test_question, n=5)
+        self.assertEqual(r_query[0][1], test_question)
+        self.assertEqual(qse.most_similar(query=test_question, n=5, prune=True), r_query)
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5, chunk_size=100), [r_query])
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path)
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5), r_query)
+
+    def test_deduplicate(self):
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)[:500]
+        duplicates = [Document(doc_id='dup_%d' % i, text=documents[0].text + '!', tags=[]) for i in range(3)]
+        documents = documents[:1] + duplicates + documents[1:]
+        test_question = documents[0].text
+        qse = QuestionsSearchEngine(questions=documents)
+        r_query = qse.most_similar(query=test_question, n=5)
+        self.assertEqual([rq[0] for rq in r_query[:4]], [1.0] * 4)
+
+        self.assertGreaterEqual(qse.deduplicate(), 3)
+        self.assertEqual([d.doc_id for d in qse.duplicates(index=0)], ['dup_0', 'dup_1', 'dup_2'])
+        deduplicated = qse.most_similar(query=test_question, n=5)
+        self.assertEqual(deduplicated[0], r_query[0])
+        self.assertEqual(len(set(rq[1] for rq in deduplicated)), 5)
+        self.assertEqual(qse.most_similar(query=test_question, n=5, expand_duplicates=True)[:4], r_query[:4])
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5, expand_duplicates=True)[0][:4],
+                         r_query[:4])
+
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path)
+            self.assertEqual(len(loaded_qse), len(qse))
+            self.assertEqual(loaded_qse.most_similar(query=test_question, n=5, expand_duplicates=True),
+                             qse.most_similar(query=test_question, n=5, expand_duplicates=True))
+
+        qse.add_documents([Document(doc_id='new', text='Brand new question', tags=[])])
+        qse.remove_documents([documents[1 + 3].doc_id])
+        qse.compact()
+        self.assertEqual([d.doc_id for d in qse.duplicates(index=0)], ['dup_0', 'dup_1', 'dup_2'])
+        self.assertEqual(qse.duplicates(index=len(qse) - 1), [])
+
+        # Removed duplicate is dropped, first remaining duplicate of removed question takes its place
+        qse.remove_documents(['dup_1'])
+        self.assertEqual([d.doc_id for d in qse.duplicates(index=0)], ['dup_0', 'dup_2'])
+        qse.remove_documents([documents[0].doc_id])
+        self.assertEqual(qse.duplicates(index=0), [])
+        self.assertEqual(qse.get_document(len(qse) - 1).doc_id, 'dup_0')
+        self.assertEqual([d.doc_id for d in qse.duplicates(index=len(qse) - 1)], ['dup_2'])
+        r_query = qse.most_similar(query=test_question, n=5, expand_duplicates=True)
+        self.assertEqual([rq[1] for rq in r_query[:2]], [duplicates[0].text, duplicates[2].text])
+        qse.compact()
+        self.assertEqual(qse.get_document(len(qse) - 1).doc_id, 'dup_0')
+        self.assertEqual([d.doc_id for d in qse.duplicates(index=len(qse) - 1)], ['dup_2'])
+
+    def test_tags(self):
+        test_question = "c# index was out of the bounds of the array"
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents)
+
+        tagged = {document.text for document in documents if 'python' in document.tags and 'go' in document.tags}
+        expected = [rq for rq in qse.most_similar(query=test_question, n=len(documents)) if rq[1] in tagged][:5]
+        r_query = qse.most_similar(query=test_question, n=5, tags=['python', 'go'], match='all')
+        self.assertEqual(r_query, expected)
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5, tags=['python', 'go'], match='all'),
+                         [r_query])
+
+        r_query = qse.most_similar(query=test_question, n=5, tags='python')
+        texts = {document.text for document in documents if 'python' in document.tags}
+        self.assertEqual(len(r_query), 5)
+        self.assertTrue(all(rq[1] in texts for rq in r_query))
+        self.assertEqual(qse.most_similar(query=test_question, n=5, tags='no_such_tag'), [])
+
+        # Removed questions are left out of posting lists of tags
+        expected = [rq for rq in qse.most_similar(query=test_question, n=len(documents)) if rq[1] in texts]
+        self.assertEqual(qse.most_similar(query=test_question, n=5, tags='python', prune=True), expected[:5])
+        qse.remove_documents([document.doc_id for document in documents if document.text == expected[0][1]])
+        self.assertEqual(qse.most_similar(query=test_question, n=5, tags='python', prune=True), expected[1:6])
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5, tags='python'), [expected[1:6]])
+
+    def test_approx(self):
+        test_questions = [
+            "c# index was out of the bounds of the array",
+            "MySQL how to query five tables in one SELECT"
+        ]
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents)
+        with self.assertRaises(ValueError):
+            qse.most_similar(query=test_questions[0], mode='approx')
+
+        qse.build_ann_index(n_lists=10, n_probe=2)
+        for t_question in test_questions:
+            exact = qse.most_similar(query=t_question, n=5)
+            self.assertEqual(qse.most_similar(query=t_question, n=5, mode='approx', n_probe=10), exact)
+            approx = qse.most_similar(query=t_question, n=5, mode='approx')
+            self.assertTrue(len(approx) <= 5)
+            self.assertTrue(all(rq[0] <= exact[0][0] for rq in approx))
+        self.assertEqual(qse.most_similar_many(queries=test_questions, n=5, mode='approx'),
+                         [qse.most_similar(query=t_question, n=5, mode='approx') for t_question in test_questions])
+
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            loaded_qse = QuestionsSearchEngine(skip_process=True)
+            loaded_qse.load_stored_data(path=index_path)
+            self.assertEqual(loaded_qse.most_similar(query=test_questions[0], n=5, mode='approx'),
+                             qse.most_similar(query=test_questions[0], n=5, mode='approx'))
+
+        # Compaction refits vectorizer on changed questions, so IVF index is built again over new columns
+        qse.remove_documents(doc_ids=[document.doc_id for document in documents[:300]])
+        qse.add_documents(documents=[Document(doc_id='new_%d' % index, text='zzzalpha zzzbeta zzzgamma %d' % index,
+                                              tags=[]) for index in range(300)])
+        qse.compact()
+        self.assertTrue(np.array_equal(qse._ann_index.centroids,
+                                       IvfIndex(vectors=qse._stored_data_vectors.merged(), n_lists=10).centroids))
+        for t_question in test_questions:
+            self.assertEqual(qse.most_similar(query=t_question, n=5, mode='approx', n_probe=10),
+                             qse.most_similar(query=t_question, n=5))
+
+    def test_cache(self):
+        test_question = "c# index was out of the bounds of the array"
+        documents = QuestionsSearchEngine.load_questions(path=QuestionSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents[:900])
+        r_query = qse.most_similar(query=test_question, n=5)
+
+        qse.enable_cache(max_size=10)
+        self.assertEqual(qse.most_similar(query=test_question, n=5), r_query)
+        self.assertEqual(qse.most_similar(query=test_question.upper() + '?', n=5), r_query)
+        self.assertEqual(qse.most_similar_many(queries=[test_question], n=5), [r_query])
+        self.assertEqual(qse.cache_stats()['results']['hits'], 2)
+
+        qse.add_documents(documents=documents[900:])
+        qse.most_similar(query=test_question, n=5)
+        self.assertEqual(qse.cache_stats()['results']['size'], 1)
+        self.assertEqual(qse.cache_stats()['results']['hits'], 2)
+
 
 if __name__ == '__main__':
     unittest.main()
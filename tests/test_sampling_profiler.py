@@ -0,0 +1,33 @@
+import time
+import unittest
+
+from src.SamplingProfiler import SamplingProfiler
+
+
+def busy_function(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+    def test_report(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        self.assertTrue(profiler.running)
+        busy_function(0.1)
+        profiler.stop()
+        self.assertFalse(profiler.running)
+
+        self.assertGreater(profiler.samples, 0)
+        report = profiler.report()
+        self.assertIn('busy_function', report)
+        stack, count = report.splitlines()[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+        profiler.reset()
+        self.assertEqual(profiler.report(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
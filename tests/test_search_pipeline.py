@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from src.Document import Document
+from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.SearchPipeline import SearchPipeline
+
+
+class SearchPipelineTestCase(unittest.TestCase):
+    CORPUS_PATH = "../data/questions.jsonl"
+
+    def test_search_pipeline(self):
+        test_question = "c# index was out of the bounds of the array"
+        documents = QuestionsSearchEngine.load_questions(path=SearchPipelineTestCase.CORPUS_PATH)[:1000]
+        qse = QuestionsSearchEngine(questions=documents, embedding_size=100)
+        with self.assertRaises(ValueError):
+            qse.search_pipeline(query=test_question)
+
+        # With every question as candidate second stage ranking is full vocabulary ranking
+        full_qse = QuestionsSearchEngine(questions=documents, embedding_size=None)
+        qse.build_pipeline(SearchPipeline(candidates=len(documents)))
+        result = qse.search_pipeline(query=test_question, n=5)
+        self.assertEqual(result['results'], full_qse.most_similar(query=test_question, n=5))
+        self.assertEqual(result['rescored'], result['candidates'])
+        self.assertEqual(result['over_budget'], [])
+        self.assertEqual(set(result['timings']), {'candidates', 'rescore'})
+        self.assertIn('pipeline', qse.memory_usage())
+
+        qse.build_pipeline(SearchPipeline(candidates=len(documents), rescore_budget=0., chunk_size=10))
+        result = qse.search_pipeline(query=test_question, n=5)
+        self.assertEqual(result['rescored'], 10)
+        self.assertEqual(result['over_budget'], ['rescore'])
+
+        qse.build_pipeline(SearchPipeline(candidates=10, candidate_budget=0.))
+        result = qse.search_pipeline(query=test_question, n=5)
+        self.assertEqual(result['rescored'], 0)
+        self.assertEqual(result['over_budget'], ['candidates'])
+        self.assertEqual(result['results'], qse.most_similar(query=test_question, n=5))
+
+        # Added questions are vectorized with fitted pipeline vectorizer, loaded engine has no pipeline
+        qse.build_pipeline(SearchPipeline(candidates=len(documents), tag_boost=1.))
+        qse.add_documents(documents=[Document(doc_id='new_question', text=test_question, tags=['python'])])
+        result = qse.search_pipeline(query=test_question, n=5, boost_tags='python')
+        self.assertEqual(result['results'][0], (2.0, test_question))
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'qse_index')
+            qse.save_stored_data(path=index_path)
+            qse.load_stored_data(path=index_path)
+        self.assertNotIn('pipeline', qse.memory_usage())
+        with self.assertRaises(ValueError):
+            qse.search_pipeline(query=test_question)
+
+    def test_boosts(self):
+        documents = [
+            Document(doc_id=0, text="How to sort list in python", tags=['python']),
+            Document(doc_id=1, text="Python sort list", tags=['java']),
+            Document(doc_id=2, text="Java array", tags=['java'])
+        ]
+        qse = QuestionsSearchEngine(questions=documents)
+        qse.build_pipeline(SearchPipeline(phrase_boost=1.))
+        result = qse.search_pipeline(query="sort list", n=2)
+        self.assertEqual([text for _, text in result['results']], ["Python sort list", "How to sort list in python"])
+        self.assertGreater(result['results'][1][0], 1.)
+
+        qse.build_pipeline(SearchPipeline(tag_boost=1.))
+        result = qse.search_pipeline(query="python list", n=2, boost_tags=['python'])
+        self.assertEqual(result['results'][0][1], "How to sort list in python")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.ShardedSearchEngine import ShardedSearchEngine
+
+
+class ShardedSearchEngineTestCase(unittest.TestCase):
+    CORPUS_PATH = "../data/questions.jsonl"
+    TEST_QUESTIONS = [
+        "how to make sure a file's integrity in C#",
+        "c# index was out of the bounds of the array",
+        "MySQL how to query five tables in one SELECT",
+        "qwertyuiop"
+    ]
+
+    def test_same_results(self):
+        documents = QuestionsSearchEngine.load_questions(path=ShardedSearchEngineTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        qse = QuestionsSearchEngine(questions=documents)
+
+        for partition in ShardedSearchEngine.PARTITIONS:
+            sharded = ShardedSearchEngine.build(documents=documents, n_shards=3, partition=partition)
+            self.assertEqual(len(sharded), len(documents))
+            for t_question in ShardedSearchEngineTestCase.TEST_QUESTIONS:
+                self.assertEqual(sharded.most_similar(query=t_question, n=5),
+                                 qse.most_similar(query=t_question, n=5))
+                self.assertEqual(sharded.most_similar(query=t_question, n=5, prune=True),
+                                 qse.most_similar(query=t_question, n=5))
+            self.assertEqual(sharded.most_similar_many(queries=ShardedSearchEngineTestCase.TEST_QUESTIONS, n=5),
+                             qse.most_similar_many(queries=ShardedSearchEngineTestCase.TEST_QUESTIONS, n=5))
+            sharded.close()
+
+    def test_from_corpus(self):
+        with open(ShardedSearchEngineTestCase.CORPUS_PATH, 'r') as fr:
+            rows = [fr.readline() for _ in range(1000)]
+
+        with tempfile.TemporaryDirectory() as path:
+            corpus_path = os.path.join(path, 'questions.jsonl')
+            with open(corpus_path, 'w') as fw:
+                fw.writelines(rows)
+
+            documents = QuestionsSearchEngine.load_questions(path=corpus_path)
+            qse = QuestionsSearchEngine(questions=documents)
+            sharded = ShardedSearchEngine.from_corpus(path=corpus_path, n_shards=3, workers=2)
+            self.assertEqual(len(sharded), len(documents))
+            # Scoring threads do not depend on number of processes used for indexing
+            self.assertEqual(sharded._pool._max_workers, 3)
+            self.assertEqual(sharded.most_similar_many(queries=ShardedSearchEngineTestCase.TEST_QUESTIONS, n=5),
+                             qse.most_similar_many(queries=ShardedSearchEngineTestCase.TEST_QUESTIONS, n=5))
+            sharded.close()
+
+    def test_save_load(self):
+        test_question = ShardedSearchEngineTestCase.TEST_QUESTIONS[1]
+        documents = QuestionsSearchEngine.load_questions(path=ShardedSearchEngineTestCase.CORPUS_PATH)
+        sharded = ShardedSearchEngine.build(documents=documents[:1000], n_shards=4)
+
+        with tempfile.TemporaryDirectory() as path:
+            index_path = os.path.join(path, 'sharded_index')
+            sharded.save_stored_data(path=index_path)
+            loaded = ShardedSearchEngine.load(path=index_path, verify=True)
+            self.assertEqual(loaded.n_shards, 4)
+            self.assertEqual(loaded.most_similar(query=test_question, n=5),
+                             sharded.most_similar(query=test_question, n=5))
+            loaded.close()
+        sharded.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
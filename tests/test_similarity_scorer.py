@@ -2,7 +2,9 @@ import unittest
 
 import numpy as np
 
-from src.SimilarityScorer import SimilarityScorer
+from src.SimilarityScorer import Bm25Scorer, Scorer, SimilarityScorer
+from src.SparseMatrix import SparseMatrix
+from src.Tokenizer import Tokenizer
 
 
 class SimilarityScorerCase(unittest.TestCase):
@@ -23,6 +25,90 @@ class SimilarityScorerCase(unittest.TestCase):
         equal = np.array_equal(similarity, expected_result)
         self.assertEqual(True, equal)
 
+    def test_sparse_cosine_similarity(self):
+        q = np.array([[1, 0, 2], [0, 0, 0]])
+        base = np.array([[1, 0, 2], [0, 3, 0], [2, 1, 0]])
+
+        sim = SimilarityScorer()
+        dense_similarity = sim.cosine_similarity(query_vectors=q, corpus_vectors=base)
+        sparse_similarity = sim.cosine_similarity(query_vectors=SparseMatrix.from_dense(q),
+                                                  corpus_vectors=SparseMatrix.from_dense(base))
+        self.assertEqual(sparse_similarity.shape, (3, 2))
+        self.assertTrue(np.allclose(dense_similarity, sparse_similarity))
+        self.assertTrue(np.array_equal(dense_similarity[:, 1], np.zeros(3)))
+
+    def test_normalized_cosine_similarity(self):
+        q = np.array([[1, 0, 2], [0, 0, 0]])
+        base = np.array([[1, 0, 2], [0, 3, 0], [0, 0, 0]])
+
+        sim = SimilarityScorer()
+        expected = sim.cosine_similarity(query_vectors=q, corpus_vectors=base)
+        similarity = sim.normalized_cosine_similarity(query_vectors=SparseMatrix.from_dense(q).normalized(),
+                                                      corpus_vectors=SparseMatrix.from_dense(base).normalized())
+        self.assertTrue(np.allclose(similarity, expected))
+
+    def test_bm25(self):
+        corpus = ["python list sort", "sort list in python python", "java list", "array"]
+        tokenizer = Tokenizer(stop_words=['in'], word_ids={'python': 0, 'list': 1, 'sort': 2, 'java': 3})
+        scorer = Bm25Scorer(k1=1.2, b=0.75)
+        scorer.fit(texts=corpus, tokenizer=tokenizer, n_terms=4)
+        self.assertTrue(np.array_equal(scorer.lengths, [3, 4, 2, 1]))
+
+        # Scores of BM25 formula computed word by word
+        word_lists = [tokenizer.tokenize(text) for text in corpus]
+        average_length = np.mean([len(words) for words in word_lists])
+        query = ['python', 'list']
+        expected = []
+        for words in word_lists:
+            score = 0.
+            for word in query:
+                df = sum(word in other for other in word_lists)
+                idf = np.log(1 + (len(corpus) - df + 0.5) / (df + 0.5))
+                tf = words.count(word)
+                score += idf * tf * 2.2 / (tf + 1.2 * (1 - 0.75 + 0.75 * len(words) / average_length))
+            expected.append(score)
+
+        query_vectors = scorer.query_vectors(texts=["Python list?"])
+        scores = scorer.score(query_vectors=query_vectors.toarray(), corpus_ids=np.arange(len(corpus)))
+        self.assertTrue(np.allclose(scores[:, 0], expected, atol=1e-5))
+        doc_ids, index_scores = scorer.inverted_index.search(query_vector=query_vectors)
+        self.assertTrue(np.allclose(index_scores, np.array(expected)[doc_ids], atol=1e-5))
+
+    def test_bm25_bigrams(self):
+        tokenizer = Tokenizer(word_ids={'python': 0, 'list': 1})
+        scorer = Bm25Scorer(bigram_buckets=64)
+        scorer.fit(texts=["python list", "list python"], tokenizer=tokenizer, n_terms=2)
+        self.assertEqual(scorer.term_frequencies.shape, (2, 66))
+        scores = scorer.score(query_vectors=scorer.query_vectors(texts=["python list"]).toarray(),
+                              corpus_ids=np.arange(2))
+        self.assertGreater(scores[0, 0], scores[1, 0])
+
+    def test_bm25_append(self):
+        tokenizer = Tokenizer(word_ids={'python': 0, 'list': 1, 'sort': 2, 'java': 3})
+        scorer = Bm25Scorer()
+        scorer.fit(texts=["python list sort", "java list"], tokenizer=tokenizer, n_terms=4)
+        scorer.append(texts=["sort python list python"])
+        scorer.append(texts=["java", "list list"])
+        self.assertTrue(np.array_equal(scorer.lengths, [3, 2, 4, 1, 2]))
+        self.assertEqual(len(scorer.term_frequencies), 5)
+
+        query_vectors = scorer.query_vectors(texts=["python list"])
+        scores = scorer.score(query_vectors=query_vectors.toarray(), corpus_ids=np.arange(5))[:, 0]
+        doc_ids, index_scores = scorer.inverted_index.search(query_vector=query_vectors)
+        self.assertTrue(np.allclose(index_scores, scores[doc_ids], atol=1e-5))
+
+        loaded = Bm25Scorer.from_arrays(arrays=scorer.to_arrays(), parameters=scorer.parameters(), tokenizer=tokenizer)
+        self.assertTrue(np.allclose(loaded.score(query_vectors=query_vectors.toarray(), corpus_ids=np.arange(5))[:, 0],
+                                    scores))
+        loaded.append(texts=["python"])
+        scorer.append(texts=["python"])
+        self.assertTrue(np.allclose(loaded.inverted_index.search(query_vector=query_vectors)[1],
+                                    scorer.inverted_index.search(query_vector=query_vectors)[1]))
+
+    def test_scorer_interface(self):
+        with self.assertRaises(TypeError):
+            Scorer()
+
 
 if __name__ == '__main__':
     unittest.main()
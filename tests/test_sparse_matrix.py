@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from src.SparseMatrix import SparseMatrix
+
+
+class SparseMatrixTestCase(unittest.TestCase):
+    def test_from_dense(self):
+        dense = np.array([[0., 2., 0.], [0., 0., 0.], [1., 0., 3.]])
+        matrix = SparseMatrix.from_dense(dense)
+        self.assertEqual(matrix.shape, (3, 3))
+        self.assertEqual(matrix.nnz, 3)
+        self.assertTrue(np.array_equal(matrix.toarray(), dense))
+        self.assertTrue(np.allclose(matrix.row_norms(), np.linalg.norm(dense, axis=1)))
+
+    def test_dot(self):
+        dense = np.array([[0., 2., 0.], [0., 0., 0.], [1., 0., 3.], [4., 0., 0.]])
+        other = np.array([[1., 2.], [3., 4.], [5., 6.]])
+        matrix = SparseMatrix.from_dense(dense)
+        self.assertTrue(np.allclose(matrix.dot(other), dense.dot(other)))
+
+    def test_rows(self):
+        matrix = SparseMatrix.from_rows(rows=[([2, 0], [1., 2.]), ([], []), ([1], [3.])], n_cols=3)
+        expected = np.array([[2., 0., 1.], [0., 0., 0.], [0., 3., 0.]])
+        self.assertTrue(np.array_equal(matrix.toarray(), expected))
+        self.assertTrue(np.array_equal(matrix.row_slice(1, 3).toarray(), expected[1:3]))
+        stacked = SparseMatrix.vstack([matrix.getrow(2), matrix.row_slice(0, 2)])
+        self.assertTrue(np.array_equal(stacked.toarray(), expected[[2, 0, 1]]))
+
+    def test_astype(self):
+        dense = np.array([[0., 2., 0.], [0., 0., 0.], [1., 0., -3.]])
+        other = np.array([[1., 2.], [3., 4.], [5., 6.]])
+        matrix = SparseMatrix.from_dense(dense)
+        self.assertEqual(matrix.astype(np.float32).dot(other.astype(np.float32)).dtype, np.float32)
+
+        quantized = matrix.astype(np.int8)
+        self.assertTrue(quantized.quantized)
+        self.assertEqual(quantized.dtype, np.int8)
+        self.assertTrue(np.allclose(quantized.toarray(), dense, atol=0.02))
+        self.assertTrue(np.allclose(quantized.dot(other), dense.dot(other), atol=0.1))
+        self.assertTrue(np.allclose(quantized.normalized().toarray(), matrix.normalized().toarray(), atol=0.01))
+        self.assertTrue(np.array_equal(SparseMatrix.vstack([quantized.getrow(2), quantized.getrow(0)]).toarray(),
+                                       quantized.toarray()[[2, 0]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from src.Document import Document
+from src.TagIndex import TagIndex
+
+
+class TagIndexTestCase(unittest.TestCase):
+    def test_matching(self):
+        documents = [
+            Document(doc_id='0', text='', tags=['python', 'numpy']),
+            Document(doc_id='1', text='', tags=['c#']),
+            Document(doc_id='2', text='', tags=['numpy', 'python', 'python']),
+            Document(doc_id='3', text='', tags=''),
+            Document(doc_id='4', text='', tags=['python'])
+        ]
+        tag_index = TagIndex(documents=documents)
+        self.assertTrue(np.array_equal(tag_index.documents('python'), [0, 2, 4]))
+        self.assertTrue(np.array_equal(tag_index.matching(tags='c#'), [1]))
+        self.assertTrue(np.array_equal(tag_index.matching(tags=['c#', 'numpy']), [0, 1, 2]))
+        self.assertTrue(np.array_equal(tag_index.matching(tags=['python', 'numpy'], match='all'), [0, 2]))
+        self.assertEqual(len(tag_index.matching(tags=['python', 'java'], match='all')), 0)
+        self.assertEqual(len(tag_index.matching(tags=[])), 0)
+
+        loaded = TagIndex.from_arrays(arrays=tag_index.to_arrays(), tags=tag_index.tags)
+        self.assertTrue(np.array_equal(loaded.matching(tags=['numpy', 'c#']), [0, 1, 2]))
+
+        delta_index = TagIndex(documents=documents[:2]).with_delta(delta=TagIndex(documents=documents[2:]), offset=2)
+        self.assertEqual(delta_index.tags, ['python', 'numpy', 'c#'])
+        self.assertTrue(np.array_equal(delta_index.matching(tags=['python', 'numpy'], match='all'), [0, 2]))
+        merged = delta_index.merged()
+        for tag in tag_index.tags:
+            self.assertTrue(np.array_equal(merged.documents(tag), tag_index.documents(tag)))
+
+        # Masks select the same documents as matching
+        for tags, match in [('c#', 'any'), (['c#', 'numpy'], 'any'), (['python', 'numpy'], 'all'),
+                            (['python', 'java'], 'all'), ([], 'any')]:
+            mask = delta_index.mask(tags=tags, n_docs=len(documents), match=match)
+            self.assertTrue(np.array_equal(np.flatnonzero(mask), tag_index.matching(tags=tags, match=match)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import numpy as np
 import unittest
 
+from src.SparseMatrix import SparseMatrix
 from src.TfIdfVectorizer import TfIdfVectorizer
 
 
@@ -41,6 +42,84 @@ class TfIdfVectorizerTestCase(unittest.TestCase):
             arr_sum = vec.sum()
             self.assertTrue(arr_sum > 0, "All values in vector are zeros")
 
+    def test_sparse_vectorizer(self):
+        test_documents = [
+            "How to write Function in Python with list?",
+            "What is array in JavaScript?"
+        ]
+
+        documents = TfIdfVectorizer.load_questions(path=TfIdfVectorizerTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+        vectorizer = TfIdfVectorizer(embedding_size=None, progress_bar=False)
+        vectorizer.fit(questions=documents)
+
+        result = vectorizer.transform_sparse(questions=test_documents)
+        self.assertTrue(type(result) is SparseMatrix)
+        self.assertTrue(result.shape == (len(test_documents), vectorizer.embedding_size))
+        self.assertTrue(np.allclose(result.toarray(), vectorizer.transform(questions=test_documents)))
+
+        vocabulary = {word_index: word for word, (word_index, _) in vectorizer.get_first_n_words(n=None).items()}
+        for doc in test_documents:
+            word_list = TfIdfVectorizer.trim_string(doc).split()
+            word_indices, tf_idf_scores = vectorizer.transform_doc_sparse(question=doc)
+            for word_index, tf_idf_score in zip(word_indices, tf_idf_scores):
+                expected, _ = vectorizer.tf_idf_info(word=vocabulary[word_index], document=doc, word_list=word_list)
+                self.assertEqual(tf_idf_score, expected)
+
+    def test_parallel_vectorizer(self):
+        documents = TfIdfVectorizer.load_questions(path=TfIdfVectorizerTestCase.CORPUS_PATH)
+        documents = documents[:1000]
+
+        vectorizer = TfIdfVectorizer(embedding_size=100, progress_bar=False)
+        vectorizer.fit(questions=documents)
+        vectors = vectorizer.transform_sparse(questions=documents)
+
+        parallel_vectorizer = TfIdfVectorizer(embedding_size=100, progress_bar=False)
+        parallel_vectorizer.fit(questions=documents, workers=3)
+        parallel_vectors = parallel_vectorizer.transform_sparse(questions=documents, workers=3)
+
+        self.assertEqual(list(vectorizer.get_first_n_words(n=None).items()),
+                         list(parallel_vectorizer.get_first_n_words(n=None).items()))
+        self.assertTrue(np.array_equal(vectors.indptr, parallel_vectors.indptr))
+        self.assertTrue(np.array_equal(vectors.indices, parallel_vectors.indices))
+        self.assertTrue(np.array_equal(vectors.data, parallel_vectors.data))
+
+    def test_document_frequency_bounds(self):
+        documents = TfIdfVectorizer.load_questions(path=TfIdfVectorizerTestCase.CORPUS_PATH)[:1000]
+        vectorizer = TfIdfVectorizer(embedding_size=None, progress_bar=False)
+        vectorizer.fit(questions=documents)
+        counts = {word: app_count for word, (_, app_count) in vectorizer.get_first_n_words(n=None).items()}
+
+        # Heap selection keeps order of sorted vocabulary
+        top_vectorizer = TfIdfVectorizer(embedding_size=50, progress_bar=False)
+        top_vectorizer.fit(questions=documents)
+        self.assertEqual(list(top_vectorizer.get_first_n_words(n=50).items()),
+                         list(vectorizer.get_first_n_words(n=50).items()))
+
+        pruned = TfIdfVectorizer(embedding_size=None, progress_bar=False, min_df=3, max_df=0.1)
+        pruned.fit(questions=iter(documents))
+        expected = {word for word, app_count in counts.items() if 3 <= app_count <= 100}
+        self.assertEqual(set(pruned.get_first_n_words(n=None)), expected)
+
+    def test_hashing_vectorizer(self):
+        documents = TfIdfVectorizer.load_questions(path=TfIdfVectorizerTestCase.CORPUS_PATH)[:1000]
+        vectorizer = TfIdfVectorizer(n_features=2 ** 12, progress_bar=False)
+        vectorizer.fit(questions=iter(documents))
+        vectors = vectorizer.transform_sparse(questions=documents[:10])
+        self.assertEqual(vectors.shape, (10, 2 ** 12))
+        self.assertTrue(np.all(np.diff(vectors.indptr) > 0))
+
+        # Vectorizers fitted on parts of corpus are merged into the same vectorizer
+        first, second = vectorizer.clone(), vectorizer.clone()
+        first.fit(questions=documents[:400])
+        second.fit(questions=documents[400:], workers=2)
+        merged = TfIdfVectorizer.merge([first, second])
+        self.assertTrue(np.allclose(merged.transform_sparse(questions=documents[:10]).toarray(), vectors.toarray()))
+
+        words, counts, parameters = merged.export_vocabulary()
+        loaded = TfIdfVectorizer.from_vocabulary(words=words, appearance_counts=counts, **parameters)
+        self.assertTrue(np.allclose(loaded.transform(questions=documents[:10]), vectors.toarray()))
+
 
 if __name__ == '__main__':
     unittest.main()
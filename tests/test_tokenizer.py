@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from src.Tokenizer import Tokenizer
+
+
+class TokenizerTestCase(unittest.TestCase):
+    def test_tokenize(self):
+        tokenizer = Tokenizer(stop_words=['how', 'to', 'in'])
+        self.assertEqual(tokenizer.tokenize("How to write 2 Functions in Python3?"), ['write', 'functions', 'python'])
+        self.assertEqual(Tokenizer.trim("C# array!"), 'c array ')
+
+    def test_encode(self):
+        tokenizer = Tokenizer(stop_words=['in'], word_ids={'array': 0, 'python': 1})
+        word_ids, lengths = tokenizer.encode_many(texts=["Array in Python", "", "numpy array"])
+        self.assertTrue(np.array_equal(word_ids, [0, 1, Tokenizer.UNKNOWN_ID, 0]))
+        self.assertTrue(np.array_equal(lengths, [2, 0, 2]))
+        self.assertTrue(np.array_equal(tokenizer.encode("python"), [1]))
+
+    def test_encode_buckets(self):
+        tokenizer = Tokenizer(stop_words=['in'], n_buckets=16)
+        word_ids, lengths = tokenizer.encode_many(texts=["Array in Python", "numpy array"])
+        expected = [Tokenizer.bucket(word, n_buckets=16) for word in ['array', 'python', 'numpy', 'array']]
+        self.assertTrue(np.array_equal(word_ids, expected))
+        self.assertTrue(np.array_equal(lengths, [2, 2]))
+        self.assertTrue(((word_ids >= 0) & (word_ids < 16)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
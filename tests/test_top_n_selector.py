@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+from src.TopNSelector import TopNSelector
+
+
+class TopNSelectorTestCase(unittest.TestCase):
+    def test_select(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.9, 0.3, 0.5, 0.7])
+        doc_ids, best_scores = TopNSelector(n=4).select(scores=scores)
+        self.assertEqual(doc_ids.tolist(), [1, 3, 6, 2])
+        self.assertEqual(best_scores.tolist(), [0.9, 0.9, 0.7, 0.5])
+
+        doc_ids, best_scores = TopNSelector(n=10, min_score=0.5).select(scores=scores, doc_ids=np.arange(7) + 10)
+        self.assertEqual(doc_ids.tolist(), [11, 13, 16, 12, 15])
+
+    def test_select_many_and_merge(self):
+        scores = np.array([[0.2, 0.4, 0.1], [0.3, 0.3, 0.6]])
+        selector = TopNSelector(n=2)
+        selections = selector.select_many(scores=scores)
+        self.assertEqual([doc_ids.tolist() for doc_ids, _ in selections], [[1, 0], [2, 0]])
+
+        doc_ids, best_scores = selector.merge(selections[0], (np.array([5, 7]), np.array([0.4, 0.3])))
+        self.assertEqual(doc_ids.tolist(), [1, 5])
+        self.assertEqual(best_scores.tolist(), [0.4, 0.4])
+
+
+if __name__ == '__main__':
+    unittest.main()
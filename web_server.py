@@ -1,68 +1,286 @@
 # Python 3 server example
+import argparse
 import json
 import logging
 import os
-from http.server import BaseHTTPRequestHandler, HTTPServer
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from urllib.parse import urlparse
 
-from src.QuestionSearchEngine import QuestionsSearchEngine
+from src.Metrics import metrics
+from src.SamplingProfiler import SamplingProfiler
 
 hostName = "localhost"
 serverPort = 8081
+# Larger request bodies are rejected with 413
+maxBodySize = 1024 * 1024
+# Seconds after which client should retry request sent before engine is loaded
+retryAfter = 5
 
-qse_data_path = 'cached/qse_data.pkl'
-if os.path.exists(qse_data_path):
-    qse = QuestionsSearchEngine(skip_process=True)
-    qse.load_stored_data(qse_data_path)
-else:
-    documents = QuestionsSearchEngine.load_questions(path="data/questions.jsonl")
-    qse = QuestionsSearchEngine(questions=documents, stop_words_path="data/stop_words_english.json")
+qse_data_path = 'cached/qse_index'
+corpus_path = 'data/questions.jsonl'
+stop_words_path = 'data/stop_words_english.json'
+
+# Engine is loaded by load_engine, until then server is live but not ready
+qse = None
+engine_ready = threading.Event()
+engine_error = None
+
+# Pool which runs scoring in threaded mode, it bounds number of concurrently scored requests
+scoring_pool = None
+profiler = SamplingProfiler()
+# Profile endpoints are served only when server runs with --profile
+profile_routes = False
+
+
+def load_engine(cache_size=0, cache_ttl=None):
+    """
+    Load engine from index directory (or pickle cache of older versions next to it), or build it from corpus if
+    neither exists. Engine module is imported here, so server can bind its port before numpy and engine are
+    imported.
+    """
+    global qse, engine_error
+    try:
+        from src.QuestionSearchEngine import QuestionsSearchEngine
+        stored_data_path = QuestionsSearchEngine.stored_data_path(qse_data_path)
+        if stored_data_path is not None:
+            engine = QuestionsSearchEngine(skip_process=True)
+            engine.load_stored_data(stored_data_path)
+        else:
+            engine = QuestionsSearchEngine.from_corpus(path=corpus_path, stop_words_path=stop_words_path)
+        if cache_size > 0:
+            engine.enable_cache(max_size=cache_size, ttl=cache_ttl)
+        qse = engine
+        engine_ready.set()
+        logging.log(logging.INFO, "Engine loaded, server is ready")
+    except Exception as error:
+        engine_error = error
+        logging.exception("Engine loading failed")
+
+
+def engine_metrics() -> dict:
+    """
+    Index size and cache statistics, collected on every /metrics request.
+    """
+    if not engine_ready.is_set():
+        return {'ready': 0}
+    gauges = {'ready': 1, 'index_documents': len(qse)}
+    for name, size in qse.memory_usage().items():
+        gauges['index_%s_bytes' % name] = size
+    for cache, stats in qse.cache_stats().items():
+        for name in ['size', 'hits', 'misses', 'hit_rate']:
+            gauges['cache_%s_%s' % (cache, name)] = stats[name]
+    return gauges
+
+
+metrics.register_collector(engine_metrics)
+
+
+def find_similar_questions(questions: list, tags=None, match='any', expand_duplicates=False) -> list:
+    # Posting lists of all questions are gathered once per batch, which is faster than searching one by one
+    options = {'n': 5, 'tags': tags, 'match': match, 'expand_duplicates': expand_duplicates}
+    if scoring_pool is None:
+        return qse.most_similar_many(queries=questions, **options)
+    return scoring_pool.submit(qse.most_similar_many, queries=questions, **options).result()
 
 
 class MyServer(BaseHTTPRequestHandler):
-    def _set_response(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+    def _send_data(self, data, status=200, content_type='application/json', headers=None):
+        with metrics.stage('serialize'):
+            body = json.dumps(data).encode('utf-8')
+        self._send_body(body=body, status=status, content_type=content_type, headers=headers)
+
+    def _send_body(self, body: bytes, status=200, content_type='text/plain; charset=utf-8', headers=None):
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
+        self.wfile.write(body)
+
+    def _send_failure(self, status, message, headers=None):
+        self._send_data({"message": message, "status": "ERROR"}, status=status, headers=headers)
 
     def do_GET(self):
-        self.send_response(200)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
+        path = urlparse(self.path).path
+        if path == '/health/live':
+            self._send_data({"status": "OK"})
+            return
+        if path == '/health/ready':
+            if engine_ready.is_set():
+                self._send_data({"status": "OK"})
+            elif engine_error is not None:
+                self._send_failure(500, "Engine loading failed: %s" % engine_error)
+            else:
+                self._send_failure(503, "Engine is loading.")
+            return
+        if path == '/metrics':
+            self._send_body(metrics.to_prometheus().encode('utf-8'), content_type='text/plain; version=0.0.4')
+            return
+        if profile_routes and path == '/profile':
+            self._send_body(profiler.report().encode('utf-8'))
+            return
+
         ok_response = {
             "message": "ping!",
             "status": "OK"
         }
-        data = json.dumps(ok_response)
-        self.wfile.write(data.encode('utf-8'))
+        self._send_data(ok_response, content_type="text/html")
 
     def do_POST(self):
-        content_length = int(self.headers['Content-Length']) # <--- Gets the size of data
-        post_data = self.rfile.read(content_length) # <--- Gets the data itself
-        logging.info("POST request,\nPath: %s\nHeaders:\n%s\n\nBody:\n%s\n",
-                str(self.path), str(self.headers), post_data.decode('utf-8'))
+        path = urlparse(self.path).path
+        if profile_routes and path in ('/profile/start', '/profile/stop'):
+            self._profile(start=path == '/profile/start')
+            return
+
+        if not engine_ready.is_set():
+            # Body is not read, so connection can not be reused
+            self.close_connection = True
+            self._send_failure(503, "Engine is loading.", headers={'Retry-After': str(retryAfter)})
+            return
+
+        metrics.increment('requests_total')
+        with metrics.stage('request'):
+            self._find_similar()
+
+    def _content_length(self):
+        """
+        Validated Content-Length of request, None if it is invalid and failure was sent. Body of failed request
+        is not read, so connection can not be reused.
+        """
+        try:
+            content_length = int(self.headers['Content-Length'])  # <--- Gets the size of data
+        except (TypeError, ValueError):
+            self.close_connection = True
+            self._send_failure(411, "Content-Length header is required.")
+            return None
+        if content_length < 0:
+            self.close_connection = True
+            self._send_failure(400, "Content-Length should not be negative.")
+            return None
+        if content_length > maxBodySize:
+            self.close_connection = True
+            self._send_failure(413, "Request body is larger than %d bytes." % maxBodySize)
+            return None
+        return content_length
+
+    def _profile(self, start: bool):
+        content_length = self._content_length()
+        if content_length is None:
+            return
+        # Request body is not used
+        self.rfile.read(content_length)
+        if start:
+            profiler.reset()
+            profiler.start()
+            self._send_data({"message": "Profiler started.", "status": "OK"})
+        else:
+            profiler.stop()
+            self._send_body(profiler.report().encode('utf-8'))
 
-        post_body = post_data.decode()
-        data_dict = json.loads(post_body)
-        self._set_response()
+    def _find_similar(self):
+        content_length = self._content_length()
+        if content_length is None:
+            return
+
+        post_data = self.rfile.read(content_length)  # <--- Gets the data itself
+        logging.info("POST request, Path: %s, Body size: %d", str(self.path), content_length)
+        logging.debug("POST request,\nPath: %s\nHeaders:\n%s\n\nBody:\n%s\n",
+                      str(self.path), str(self.headers), post_data.decode('utf-8', errors='replace'))
+
+        try:
+            with metrics.stage('parse_json'):
+                data_dict = json.loads(post_data.decode())
+        except ValueError:
+            self._send_failure(400, "Request body is not valid json.")
+            return
+        if type(data_dict) is not dict:
+            self._send_failure(400, "Request body should be json object.")
+            return
+
+        tags = data_dict.get('tags', None)
+        match = data_dict.get('match', 'any')
+        if tags is not None and (type(tags) is not list or not all(type(tag) is str for tag in tags)):
+            self._send_failure(400, "Tags should be list of strings.")
+            return
+        from src.TagIndex import TagIndex
+        if match not in TagIndex.MATCH_MODES:
+            self._send_failure(400, "Match should be one of %s." % ', '.join(TagIndex.MATCH_MODES))
+            return
+        expand_duplicates = data_dict.get('expand_duplicates', False)
+        if type(expand_duplicates) is not bool:
+            self._send_failure(400, "Expand duplicates should be boolean.")
+            return
 
         ## Do some processing
         questions = data_dict.get('questions', None)
         results = []
         if questions and type(questions) is list:
-            for t_question in questions:
-                if type(t_question) is str:
-                    r_query = qse.most_similar(query=t_question, n=5)
-                    results.append({"question": t_question, "similar_questions": r_query})
+            questions = [t_question for t_question in questions if type(t_question) is str]
+            r_queries = find_similar_questions(questions=questions, tags=tags, match=match,
+                                               expand_duplicates=expand_duplicates)
+            for t_question, r_query in zip(questions, r_queries):
+                results.append({"question": t_question, "similar_questions": r_query})
         ## Reprocess data
 
-        data = json.dumps(results)
-        self.wfile.write(data.encode('utf-8'))
+        self._send_data(results)
+
+
+class KeepAliveServer(MyServer):
+    # HTTP/1.1 keeps connection open between requests, every response has Content-Length
+    protocol_version = "HTTP/1.1"
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--mode', default='simple', choices=['simple', 'threaded'],
+                        help="simple - one request at a time, threaded - concurrent keep-alive connections "
+                             "with scoring in worker pool")
+    parser.add_argument('-w', '--workers', default=os.cpu_count() or 1, type=int,
+                        help="Number of concurrently scored requests in threaded mode")
+    parser.add_argument('--host', default=hostName, help="Server host")
+    parser.add_argument('-p', '--port', default=serverPort, type=int, help="Server port")
+    parser.add_argument('--max_body_size', default=maxBodySize, type=int, help="Max POST body size in bytes")
+    parser.add_argument('--cache_size', default=0, type=int, help="Number of cached query results, 0 disables cache")
+    parser.add_argument('--cache_ttl', default=None, type=float, help="Lifetime of cached query results in seconds")
+    parser.add_argument('--metrics', action='store_true', help="Measure time of request and search stages")
+    parser.add_argument('--profile', action='store_true',
+                        help="Start sampling profiler with server and serve /profile endpoints")
+    parser.add_argument('--profile_interval', default=0.005, type=float, help="Seconds between profiler samples")
+    parser.add_argument('-s', '--startup', default='background', choices=['background', 'eager'],
+                        help="background - bind port at once and load engine in background, eager - load engine "
+                             "before binding port")
+    parser.add_argument('-dp', '--qse_data_path', default=qse_data_path, help="Path to index directory")
+    parser.add_argument('-d', '--corpus_path', default=corpus_path,
+                        help="Path to corpus, used when index directory does not exist")
+    parser.add_argument('--stop_words_path', default=stop_words_path, help="Path to file with stopwords")
+    args = parser.parse_args()
+    maxBodySize = args.max_body_size
+    qse_data_path = args.qse_data_path
+    corpus_path = args.corpus_path
+    stop_words_path = args.stop_words_path
+    metrics.enabled = args.metrics
+    profiler.interval = args.profile_interval
+    profile_routes = args.profile
+    if args.profile:
+        profiler.start()
+    if args.startup == 'eager':
+        load_engine(cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+        if engine_error is not None:
+            raise SystemExit(1)
 
-if __name__ == "__main__":        
-    webServer = HTTPServer((hostName, serverPort), MyServer)
-    print("Server started http://%s:%s" % (hostName, serverPort))
+    if args.mode == 'threaded':
+        # NumPy releases GIL while scoring, so threads share one engine and use more cores
+        scoring_pool = ThreadPoolExecutor(max_workers=args.workers)
+        webServer = ThreadingHTTPServer((args.host, args.port), KeepAliveServer)
+    else:
+        webServer = HTTPServer((args.host, args.port), MyServer)
+    print("Server started http://%s:%s" % (args.host, args.port))
+    if args.startup == 'background':
+        threading.Thread(target=load_engine, kwargs={'cache_size': args.cache_size, 'cache_ttl': args.cache_ttl},
+                         name='engine-loader', daemon=True).start()
 
     try:
         webServer.serve_forever()
@@ -70,4 +288,6 @@ if __name__ == "__main__":
         pass
 
     webServer.server_close()
+    if scoring_pool is not None:
+        scoring_pool.shutdown()
     print("Server stopped.")